@@ -7,10 +7,12 @@ import argparse
 import logging
 import os
 
-from py3iperf3.utils import setup_logging
+from py3iperf3.utils import setup_logging, parse_bandwidth, parse_payload_ratio
+from py3iperf3.utils import parse_positive_int
 from py3iperf3.iperf3_client import Iperf3Client
 from py3iperf3.iperf3_api import Iperf3TestProto
 from py3iperf3.iperf3_server import Iperf3Server
+from py3iperf3.payload_pool import PAYLOAD_PATTERNS
 
 def run(params):
     """Runt the client"""
@@ -18,8 +20,6 @@ def run(params):
     loop = asyncio.get_event_loop()
     params = vars(params)
 
-    print(params)
-
     setup_logging(**params)
 
     if params['server']:
@@ -67,16 +67,40 @@ def main():
     parser.add_argument('--client-port', help='Bind lcient to the given port', type=int)
     parser.add_argument('--ip-version', help='Use IP version <4|6>', type=int)
     parser.add_argument('--test-duration', help='Run test for given number of seconds', type=int)
+    parser.add_argument('-O', '--omit', help='Omit the first given number of seconds from the results', type=int)
     parser.add_argument('--debug', help='Enable debug output', action='store_true')
     parser.add_argument('--log-filename', help='Log to the indicated file')
     parser.add_argument('--parallel', help='Number of parallel streams to send data', type=int)
+    parser.add_argument('--use-processes', help='Run each parallel stream in its own process', action='store_true')
     parser.add_argument('--blockcount', help='Number of blocks to send', type=int)
     parser.add_argument('--reverse', help='Server instead of client sends data', action='store_true')
     parser.add_argument('--protocol', help='Transport protocol for sending data <TCP|UDP>')
     parser.add_argument('--no-delay', help='Disable Nagle\'s algorithm', action='store_true')
     parser.add_argument('--title', help='Add free text to the results')
+    parser.add_argument('-J', '--json', help='Output results in JSON format', action='store_true')
+    parser.add_argument('--json-stream', help='Output one JSON line per interval as the test runs', action='store_true')
     parser.add_argument('--get-server-output', help='Get results from the server', action='store_true')
     parser.add_argument('--window', help='Set Socket TX/RX buffer size in Bytes', type=int)
+    parser.add_argument('-b', '--bandwidth', help='Target bandwidth in bits/sec #[KMG][/#] (0 for unlimited)', type=parse_bandwidth)
+    parser.add_argument('--file', help='Transmit/receive the given file')
+    parser.add_argument('--file-wrap', help='Restart from the beginning of the file on EOF', action='store_true')
+    parser.add_argument('--file-ranges', help='Parallel TCP streams send a part of the file each (py3iperf3 server only)', action='store_true')
+    parser.add_argument('--zerocopy', help='Use sendfile to send the file', action='store_true')
+    parser.add_argument('--integrity-hash', help='Compare SHA-256 digests of the data sent and received (TCP)', action='store_true')
+    parser.add_argument('--udp-gso', help='Send UDP datagrams in batches using GSO (Linux)', action='store_true')
+    parser.add_argument('--udp-batch-rx', help='Receive many UDP datagrams per socket wake-up', action='store_true')
+    parser.add_argument('--udp-gro', help='Receive coalesced UDP datagrams using GRO (Linux)', action='store_true')
+    parser.add_argument('--buffered-rx', help='Receive TCP data into a preallocated buffer', action='store_true')
+    parser.add_argument('--send-budget', help='Max Bytes sent per stream per loop iteration', type=parse_positive_int)
+    parser.add_argument('--write-buffer-high', help='Transport write buffer high-water mark in Bytes', type=int)
+    parser.add_argument('--write-buffer-low', help='Transport write buffer low-water mark in Bytes', type=int)
+    parser.add_argument('--cpu-interval', help='Report CPU utilization for every interval', action='store_true')
+    parser.add_argument('--payload', help='Content of the sent blocks', choices=PAYLOAD_PATTERNS)
+    parser.add_argument('--payload-pattern', help='String repeated with the repeat payload')
+    parser.add_argument('--payload-ratio', help='Compression ratio of the compressible payload (>= 1)', type=parse_payload_ratio)
+    parser.add_argument('--send-scheduler', help='Send from all streams round-robin in a single callback', action='store_true')
+    parser.add_argument('--loop-monitor', help='Report event loop lag and sending callback times', action='store_true')
+    parser.add_argument('--stats-retention', help='Max interval records kept, older ones are downsampled', type=int)
 
     # Parse the command line params
     params = parser.parse_args()
@@ -89,6 +113,10 @@ def main():
         else:
             params.protocol = Iperf3TestProto.TCP
 
+    params.burst = None
+    if params.bandwidth is not None:
+        params.bandwidth, params.burst = params.bandwidth
+
     # Run the client
     run(params)
 
@@ -0,0 +1,76 @@
+"""
+CPU utilization of the test process and its stream workers.
+"""
+import os
+import time
+
+def cpu_utilization(first, last):
+    """
+    Get CPU utilization between two (time, user, system) samples
+    as percentages of the elapsed time. 100% == one fully used core.
+    """
+    elapsed = last[0] - first[0]
+    if elapsed <= 0:
+        return {'cpu_util_total': 0, 'cpu_util_user': 0, 'cpu_util_system': 0}
+
+    user = 100 * (last[1] - first[1]) / elapsed
+    system = 100 * (last[2] - first[2]) / elapsed
+
+    return {
+        'cpu_util_total': user + system,
+        'cpu_util_user': user,
+        'cpu_util_system': system,
+    }
+
+class CpuUsage(object):
+    """
+    Samples CPU time used by this process (all of its threads) at the
+    start and stop of a test, and optionally at every interval.
+    CPU seconds used by worker processes since the start can be added.
+    """
+
+    def __init__(self):
+        self._first = None
+        self._last = None
+        self._final = None
+
+    @staticmethod
+    def _sample(worker_user, worker_system):
+        """Get (time, user, system) sample including the workers"""
+
+        times = os.times()
+        return (time.monotonic(),
+                times.user + worker_user,
+                times.system + worker_system)
+
+    def start(self):
+        """Take the first sample"""
+        self._first = self._last = self._sample(0, 0)
+        self._final = None
+
+    def restart(self, worker_user=0, worker_system=0):
+        """Take a new first sample, e.g. once the omitted period is over"""
+        self._first = self._last = self._sample(worker_user, worker_system)
+        self._final = None
+
+    def stop(self, worker_user=0, worker_system=0):
+        """Take the final sample"""
+        if self._first is not None:
+            self._final = self._sample(worker_user, worker_system)
+
+    def interval(self, worker_user=0, worker_system=0):
+        """Get utilization since the previous interval"""
+
+        sample = self._sample(worker_user, worker_system)
+        utilization = cpu_utilization(self._last, sample)
+        self._last = sample
+
+        return utilization
+
+    def total(self):
+        """Get utilization between the start and stop"""
+
+        if self._first is None or self._final is None:
+            return cpu_utilization((0, 0, 0), (0, 0, 0))
+
+        return cpu_utilization(self._first, self._final)
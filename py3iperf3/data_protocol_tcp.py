@@ -4,13 +4,26 @@ Python asyncio Protocol extension for TCP use.
 import asyncio
 import logging
 import socket
+import struct
+
+try:
+    import fcntl
+    import termios
+except ImportError:
+    fcntl = None
+
+from py3iperf3.tcp_info import read_tcp_info
+
+# Size of the preallocated receive buffer
+RX_BUFFER_SIZE = 256 * 1024
 
 class TcpTestProtocol(asyncio.Protocol):
     """
     Extension of asyncio protocol for TCP data
     """
 
-    def __init__(self, test_stream=None, no_delay=False, window=None, server=None):
+    def __init__(self, test_stream=None, no_delay=False, window=None, server=None,
+                 write_buffer_high=None, write_buffer_low=None):
         """
         Initialize TCP Protocol object.
         """
@@ -22,6 +35,8 @@ class TcpTestProtocol(asyncio.Protocol):
         self._no_delay = no_delay
         self._window = window
         self._server = server
+        self._write_buffer_high = write_buffer_high
+        self._write_buffer_low = write_buffer_low
 
     @property
     def socket_id(self):
@@ -93,6 +108,8 @@ class TcpTestProtocol(asyncio.Protocol):
 
         self._logger.debug('Socket TX buffer: %s B; RX buffer: %s B;', tx_buf, rx_buf)
 
+        self.set_write_buffer_limits(self._write_buffer_high, self._write_buffer_low)
+
         self._stream.connection_established(self)
 
     def data_received(self, data):
@@ -115,12 +132,55 @@ class TcpTestProtocol(asyncio.Protocol):
         else:
             self._logger.debug('[%s] Connection lost!', self._sock_id, exc_info=exc)
 
+    def set_write_buffer_limits(self, high=None, low=None):
+        """
+        Set transport flow control limits. Asyncio defaults are used if None.
+        """
+        if high is None and low is None:
+            return
+
+        self._logger.debug('[%s] Setting write buffer limits. High: %s B; Low: %s B;',
+                           self._sock_id, high, low)
+        self._transport.set_write_buffer_limits(high=high, low=low)
+
     def send_data(self, data):
         """
         Write data to transport.
         """
         self._transport.write(data)
 
+    def get_tcp_info(self):
+        """
+        Get TCP_INFO of the data socket or None if not available.
+        """
+        if self._socket is None:
+            return None
+
+        return read_tcp_info(self._socket)
+
+    def get_send_queue(self):
+        """
+        Get (bytes queued in the socket send buffer, send buffer size)
+        or None if not available.
+        """
+        if self._socket is None or fcntl is None or not hasattr(termios, 'TIOCOUTQ'):
+            return None
+
+        try:
+            queued = fcntl.ioctl(self._socket.fileno(), termios.TIOCOUTQ, bytes(4))
+            size = self._socket.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+        except OSError:
+            return None
+
+        return struct.unpack('i', queued)[0], size
+
+    def send_file(self, loop, file, offset, count):
+        """
+        Send part of the file using zero-copy sendfile. Returns coroutine
+        resolving to the number of bytes sent.
+        """
+        return loop.sendfile(self._transport, file, offset, count, fallback=False)
+
     def pause_writing(self):
         """
         Pause writing callback from transport.
@@ -132,3 +192,32 @@ class TcpTestProtocol(asyncio.Protocol):
         Resume writing callback from transport.
         """
         self._stream.resume_writing()
+
+class TcpBufferedTestProtocol(TcpTestProtocol, asyncio.BufferedProtocol):
+    """
+    TCP data protocol receiving directly into a preallocated buffer.
+    No bytes object is created for the received data.
+    """
+
+    def __init__(self, rx_buffer_size=RX_BUFFER_SIZE, **kwargs):
+        """
+        Initialize TCP Protocol object and the receive buffer.
+        """
+        super().__init__(**kwargs)
+        self._rx_buffer = bytearray(rx_buffer_size)
+        self._rx_view = memoryview(self._rx_buffer)
+
+    def get_buffer(self, sizehint):
+        """
+        Get buffer to receive data into.
+        """
+        return self._rx_view
+
+    def buffer_updated(self, nbytes):
+        """
+        Data received into the buffer call-back.
+        """
+        if self._stream is None:
+            self._server.control_data_received(self, bytes(self._rx_view[:nbytes]))
+        else:
+            self._stream.buffer_received(self._rx_view, nbytes)
@@ -3,15 +3,31 @@ Asyncio protocol for UDP tests
 """
 import asyncio
 import logging
+import socket
+import struct
+
+# Linux UDP segmentation/receive offload socket options (linux/udp.h)
+SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)
+UDP_GRO = getattr(socket, 'UDP_GRO', 104)
+
+# GRO segment size control message
+GRO_SEGMENT_SIZE = struct.Struct('=i')
 
 class UdpTestProtocol(asyncio.DatagramProtocol):
     """UDP Protocol implementation"""
 
-    def __init__(self, test_stream=None):
+    def __init__(self, test_stream=None, sock=None):
+        """
+        Initialize UDP Protocol object. The raw socket is only
+        required for sending with UDP GSO.
+        """
         self._transport = None
         self._stream = test_stream
         self._logger = logging.getLogger('py3iperf3')
         self._sock_id = None
+        self._sock = sock
+        self._gso_enabled = False
 
     @property
     def socket_id(self):
@@ -36,3 +52,165 @@ class UdpTestProtocol(asyncio.DatagramProtocol):
         Write data to transport.
         """
         self._transport.sendto(data)
+
+    def close(self):
+        """
+        Close the transport.
+        """
+        if self._transport is not None:
+            self._transport.close()
+
+    def enable_gso(self, segment_size):
+        """
+        Ask the kernel to segment sent buffers into segment_size datagrams.
+        Returns False if not supported.
+        """
+        if self._sock is None:
+            return False
+
+        try:
+            self._sock.setsockopt(SOL_UDP, UDP_SEGMENT, segment_size)
+        except OSError as exc:
+            self._logger.debug('[%s] UDP GSO not supported: %s', self._sock_id, exc)
+            return False
+
+        self._gso_enabled = True
+        return True
+
+    def send_segments(self, data, segment_size):
+        """
+        Send buffer of back-to-back datagrams. With GSO the whole buffer
+        is sent in one syscall, otherwise datagrams are sent one by one.
+        """
+        # Direct send only if it does not overtake data buffered in the transport
+        if self._gso_enabled and not self._transport.get_write_buffer_size():
+            try:
+                self._sock.send(data)
+                return
+            except (BlockingIOError, InterruptedError):
+                # Let the transport buffer the datagrams
+                pass
+            except OSError as exc:
+                self._logger.debug('[%s] UDP GSO send failed, disabling GSO: %s',
+                                   self._sock_id, exc)
+                self._gso_enabled = False
+                try:
+                    self._sock.setsockopt(SOL_UDP, UDP_SEGMENT, 0)
+                except OSError:
+                    pass
+
+        data_view = memoryview(data)
+        for offset in range(0, len(data), segment_size):
+            self._transport.sendto(data_view[offset:offset + segment_size])
+
+    def pause_writing(self):
+        """
+        Pause writing callback from transport.
+        """
+        self._stream.pause_writing()
+
+    def resume_writing(self):
+        """
+        Resume writing callback from transport.
+        """
+        self._stream.resume_writing()
+
+class UdpBatchTestProtocol(object):
+    """
+    UDP receive engine. Owns the socket and on every readiness event
+    drains many datagrams with recvmsg_into directly into a pool of
+    preallocated buffers. With UDP GRO the kernel coalesces datagrams
+    and they are split back using the segment size it reports.
+    """
+
+    def __init__(self, loop, sock, test_stream=None, gro=False,
+                 num_buffers=8, buffer_size=65535, max_reads=64):
+        """
+        Initialize the receive engine on a connected non-blocking socket.
+        """
+        self._loop = loop
+        self._sock = sock
+        self._stream = test_stream
+        self._logger = logging.getLogger('py3iperf3')
+        self._sock_id = sock.fileno()
+        self._max_reads = max_reads
+        self._reading = False
+
+        # Receive buffers are reused round-robin
+        self._buffers = [bytearray(buffer_size) for _ in range(num_buffers)]
+        self._views = [memoryview(x) for x in self._buffers]
+        self._next_buffer = 0
+
+        self._anc_size = 0
+        if gro:
+            try:
+                self._sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+                self._anc_size = socket.CMSG_SPACE(GRO_SEGMENT_SIZE.size)
+            except OSError as exc:
+                self._logger.info('[%s] UDP GRO not supported: %s', self._sock_id, exc)
+
+    @property
+    def socket_id(self):
+        """Return socket id"""
+        return self._sock_id
+
+    def start(self):
+        """
+        Start reading and inform the stream.
+        """
+        self._loop.add_reader(self._sock_id, self._read_ready)
+        self._reading = True
+
+        self._stream.connection_established(self)
+
+    def send_data(self, data):
+        """
+        Send data directly on the socket.
+        """
+        try:
+            self._sock.send(data)
+        except (BlockingIOError, InterruptedError):
+            self._logger.debug('[%s] Socket busy, datagram dropped', self._sock_id)
+
+    def close(self):
+        """
+        Stop reading and close the socket.
+        """
+        if self._reading:
+            self._loop.remove_reader(self._sock_id)
+            self._reading = False
+
+        self._sock.close()
+
+    def _read_ready(self):
+        """
+        Socket readable callback. Drain up to max_reads buffers.
+        """
+        for _ in range(self._max_reads):
+
+            index = self._next_buffer
+            self._next_buffer = (index + 1) % len(self._buffers)
+
+            try:
+                num_bytes, ancdata, _, _ = self._sock.recvmsg_into(
+                    [self._buffers[index]], self._anc_size)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as exc:
+                self._logger.debug('[%s] UDP receive error: %s', self._sock_id, exc)
+                return
+
+            # Coalesced datagrams are num_bytes long unless GRO says otherwise
+            segment_size = num_bytes
+            for cmsg_level, cmsg_type, cmsg_data in ancdata:
+                if cmsg_level == SOL_UDP and cmsg_type == UDP_GRO:
+                    segment_size = GRO_SEGMENT_SIZE.unpack_from(cmsg_data)[0]
+
+            view = self._views[index]
+            if segment_size >= num_bytes:
+                self._stream.data_received(view[:num_bytes])
+                continue
+
+            for offset in range(0, num_bytes, segment_size):
+                self._stream.data_received(
+                    view[offset:min(offset + segment_size, num_bytes)])
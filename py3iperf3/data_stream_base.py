@@ -1,11 +1,16 @@
 """
 A base class for TCP and UDP test streams.
 """
-import random
+import itertools
 import logging
 import time
 
 from py3iperf3.error import IPerf3Exception
+from py3iperf3.file_ranges import RANGE_HEADER, pack_range_header, unpack_range_header
+from py3iperf3.file_sink import FileSink
+from py3iperf3.pacing import TokenBucket
+from py3iperf3.payload_pool import get_payload_ring
+from py3iperf3.stream_hash import StreamHash
 
 class BaseTestStream(object):
     """Class implementing common methods for TCP and UDP test streams"""
@@ -20,43 +25,96 @@ class BaseTestStream(object):
 
         self._test_protocol = None
         self._sending_handle = None
+        self._paused = False
+
+        # Transport flow control of the sender
+        self._pause_count = 0
+        self._paused_since = None
+        self._paused_time = 0
 
         self._time_stream_start = None
         self._time_stream_stop = None
 
         self._block_size = self._test.block_size
         self._stop_on = self._test.test_type
+        self._send_budget = self._test.send_budget
+        self._loop_monitor = self._test.loop_monitor
+        self._send_scheduler = self._test.send_scheduler
 
-        self._stat_objs = []
+        self._last_stats = None
         self._bytes_tx_this_interval = 0
         self._bytes_rx_this_interval = 0
         self._blocks_tx_this_interval = 0
         self._pkt_tx_this_interval = 0
         self._pkt_rx_this_interval = 0
 
-        self._data_source_sink = None # Either byte array or file handle
+        self._data_source_sink = None # Either payload ring, file source or file sink
+        self._payload_blocks = None
+        self._file_offset = 0
+
+        # Part of the file sent by this stream, whole file by default
+        self._file_range = None
+        self._file_start = 0
+        self._file_end = None
+
+        # Range header being received
+        self._range_header = None
+
+        # Running hash of the sent or received data
+        self._stream_hash = None
+        if self._test.integrity_hash:
+            self._stream_hash = StreamHash()
 
-        # Will this stream send data?
-        if ((self._test.role == 'c' and self._test.sender) or
-            (self._test.role == 's' and not self._test.sender)):
+        # Will this stream send data? Sender is already given for our role.
+        self._is_sending = self._test.sender
+
+        # Pace sending to the target bandwidth. Bucket holds at least two
+        # blocks so that late timer wake-ups do not lower the rate.
+        self._pacer = None
+        if self._is_sending and self._test.bandwidth:
+            self._pacer = TokenBucket(
+                self._test.bandwidth,
+                max(2, self._test.burst or 1) * self._block_size)
+
+        if self._is_sending:
 
             if self._test.file is None:
-                self._data_source_sink = bytearray(
-                    random.getrandbits(8) for _ in range(self._block_size))
+                # Read-only blocks shared by all streams of the same block size
+                self._data_source_sink = get_payload_ring(
+                    self._block_size, self._test.payload, self._test.payload_param)
+                self._payload_blocks = itertools.cycle(self._data_source_sink)
             else:
-                self._data_source_sink = open(
-                    self._test.file, 'rb')
+                # Mapped file is shared by all streams of the test
+                self._data_source_sink = self._test.file_source
+
+                # Parallel streams send their own part of the file
+                if self._test.file_ranges:
+                    self._file_range = kwargs.get('file_range') or self._test.next_file_range()
+                    self._file_start = self._file_offset = self._file_range[0]
+                    self._file_end = self._file_range[0] + self._file_range[1]
         else:
-            # This stream will receive data
+            # This stream will receive data, written to file off the loop
             if self._test.file is not None:
-                self._data_source_sink = open(
-                    self._test.file, 'rb+')
+                self._data_source_sink = FileSink(self._test.file)
+
+            # Sender tells which part of the file comes first
+            if self._test.file_ranges:
+                self._range_header = bytearray()
 
     @property
     def socket_id(self):
         """Get small int representing socket"""
         return self._test_protocol.socket_id
 
+    @property
+    def stopped(self):
+        """Can stop_stream be called without waiting?"""
+        return True
+
+    def request_stop(self):
+        """Ask the stream to stop. Streams on the loop stop in stop_stream."""
+        pass
+
     def save_stats(self, t_start, t_end, t_sec):
         """Save interval stats to the stats object &
            return an opaque stats obj to the caller.
@@ -77,83 +135,196 @@ class BaseTestStream(object):
 
     def data_received(self, data, remote_addr=None):
         """Call-back: Data received on the test data connection"""
+
+        # Stopped stream does not count nor write late data
+        if self.done:
+            return
+
+        if self._range_header is not None:
+            data = self._receive_range_header(data)
+
         self._bytes_rx_this_interval += len(data)
 
+        if self._stream_hash is not None:
+            self._stream_hash.update(data)
+
+        if self._test.file:
+            self._write_to_file(data)
+
+    def buffer_received(self, buffer, nbytes):
+        """
+        Call-back: nbytes received into the protocol's buffer.
+        Data is copied out only when writing to file or hashing it.
+        """
+        if self.done:
+            return
+
+        # Buffer is reused by the protocol, copy the data hashed after the header
+        if self._range_header is not None:
+            self.data_received(bytes(buffer[:nbytes]))
+            return
+
+        self._bytes_rx_this_interval += nbytes
+
+        if self._stream_hash is not None:
+            # Buffer is reused by the protocol
+            self._stream_hash.update(bytes(buffer[:nbytes]))
+
         if self._test.file:
-            try:
-                self._data_source_sink.write(data)
-            except OSError as exc:
-                logging.exception('Failed to write received data to file',
-                                  exc_info=exc)
-                raise IPerf3Exception('Failed to write RX data to file')
+            self._write_to_file(buffer[:nbytes])
+
+    def _receive_range_header(self, data):
+        """
+        Collect the range header from the start of the data and write the
+        rest of the data at the range of the file. Returns the rest.
+        """
+        num_missing = RANGE_HEADER.size - len(self._range_header)
+        self._range_header += data[:num_missing]
+        if len(self._range_header) < RANGE_HEADER.size:
+            return data[:0]
+
+        header = self._range_header
+        self._range_header = None
+
+        file_range = unpack_range_header(header)
+        if file_range is None:
+            # Sender does not split the file, the header bytes are data
+            self._logger.debug('No file range header received, writing from the start')
+            return bytes(header) + bytes(data[num_missing:])
+
+        offset, length, size = file_range
+        if self._test.file and size:
+            self._logger.debug('Receiving file range %s-%s of %s B',
+                               offset, offset + length, size)
+            self._data_source_sink.set_range(offset, length)
+
+        return data[num_missing:]
+
+    def _write_to_file(self, data):
+        """Write received data to file"""
+        try:
+            self._data_source_sink.write(data)
+        except OSError as exc:
+            logging.exception('Failed to write received data to file',
+                              exc_info=exc)
+            raise IPerf3Exception('Failed to write RX data to file')
 
     def _try_sending(self):
         """
-        Check the time/block/bytes gating and send if possible.
+        Sending callback. Timed if the loop is monitored.
+        """
+        if self._loop_monitor is None:
+            self._send_blocks()
+            return
+
+        started = time.perf_counter()
+        self._send_blocks()
+        self._loop_monitor.send_time(time.perf_counter() - started)
+
+    def _send_blocks(self):
+        """
+        Send as many blocks as the gating, the transport and the
+        per-tick byte budget allow, then reschedule.
+        """
+        self._sending_handle = None
+        budget = self._send_budget
+
+        while budget > 0 and not self._paused and not self.done:
+
+            if not self._pacing_allows():
+                # Try again once there are enough tokens
+                self._sending_handle = self._loop.call_later(
+                    self._pacer.delay(self._block_size), self._try_sending)
+                return
+
+            if not self._claim_block():
+                # No more data to send. Inform test and do not reschedule sending
+                self.done = True
+                self._test.sendable_data_depleted()
+                return
+
+            bytes_sent = self._send_block()
+            if not bytes_sent:
+                break
+
+            budget -= bytes_sent
+
+        # Transport will call resume_writing when paused
+        if not self._paused and not self.done:
+            self._schedule_sending()
+
+    def _schedule_sending(self):
+        """
+        Send again in the next loop iteration, in turn with the
+        other streams if the test has a send scheduler.
+        """
+        if self._send_scheduler is None:
+            self._sending_handle = self._loop.call_soon(self._try_sending)
+        else:
+            self._sending_handle = self._send_scheduler.add(self)
+
+    def _pacing_allows(self):
+        """
+        Check if the target bandwidth allows sending the next block.
+        """
+        return self._pacer is None or self._pacer.consume(self._block_size)
+
+    def _claim_block(self):
+        """
+        Check the time/block/bytes gating and claim the next block.
+        Returns False (without side effects) once nothing is left to send.
         """
         if self._stop_on == 't':
             # Time based test will be stopped by the test class
-            self._send_block()
-            self._sending_handle = self._loop.call_soon(self._try_sending)
+            return True
 
         elif self._stop_on == 'b':
             # Check the remianing block count
             if self._test._blocks_remaining:
                 self._test._blocks_remaining -= 1
-                self._send_block()
-                self._sending_handle = self._loop.call_soon(self._try_sending)
-
-            else:
-                # No more blocks to send. Inform test and do not reschedule sending
-                self._sending_handle = None
-                self.done = True
-                self._test.sendable_data_depleted()
+                return True
 
         elif self._stop_on == 's':
             # Check the remaining bytes count
-
             if self._test._bytes_remaining > self._block_size:
                 # Send the whole block, reduce size as normal
                 self._test._bytes_remaining -= self._block_size
-                self._send_block()
-                self._sending_handle = self._loop.call_soon(self._try_sending)
+                return True
 
             elif self._test._bytes_remaining > 0:
                 # Sent the whole block, reduce to 0
                 self._test._bytes_remaining = 0
-                self._send_block()
-                self._sending_handle = None
-                self.done = True
-                self._test.sendable_data_depleted()
+                return True
 
-            else:
-                self._sending_handle = None
-                self.done = True
-                self._test.sendable_data_depleted()
+        return False
 
     def _get_block(self):
         """Get data block for sending"""
 
         # What is data_source_sink
         if self._test.file:
-            bytes_data = self._data_source_sink.read(
-                self._block_size)
+            bytes_data, self._file_offset = self._data_source_sink.get_block(
+                self._file_offset, self._block_size, self._file_start, self._file_end)
 
-            # Empty bytes() == file EOF
-            if bytes_data is bytes():
+            # Empty block == file EOF
+            if not bytes_data:
                 self.done = True
-                self._test.sendable_data_depleted()
+                self._file_sent()
 
             return bytes_data
         else:
-            # Random bytearray
-            return self._data_source_sink
+            # Next block of the shared payload ring
+            return next(self._payload_blocks)
 
     def _send_block(self):
-        """Send data over the test protocol"""
+        """Send data over the test protocol. Return number of bytes sent."""
 
         data_block = self._get_block()
 
+        # Nothing to send (i.e. file EOF)
+        if not data_block:
+            return 0
+
         # We might run out of memory in some cases
         try:
             self._test_protocol.send_data(data_block)
@@ -161,17 +332,48 @@ class BaseTestStream(object):
             # Program failed at memory alloc
             # Not a biggy, try later...
             self._logger.exception('[%s] Stream Out-of-Memory: ', self.socket_id, exc_info=exc)
-            return
+            return 0
 
         self._blocks_tx_this_interval += 1
         self._bytes_tx_this_interval += len(data_block)
 
+        if self._stream_hash is not None:
+            self._stream_hash.update(data_block)
+
+        return len(data_block)
+
+    def _file_sent(self):
+        """
+        The stream sent all of its file data. The test ends once
+        every stream has sent its part of the file.
+        """
+
+        if self._file_range is None or self._test.all_streams_done:
+            self._test.sendable_data_depleted()
+
+    def _send_range_header(self):
+        """
+        Tell the receiver which part of the file the stream sends.
+        An empty range is sent if no file is sent.
+        """
+        if not (self._is_sending and self._test.file_ranges):
+            return
+
+        if self._file_range is None:
+            header = pack_range_header(0, 0, 0)
+        else:
+            header = pack_range_header(
+                self._file_range[0], self._file_range[1], self._data_source_sink.size)
+
+        self._test_protocol.send_data(header)
+
     def start_stream(self):
         """Start sending data"""
 
         self._time_stream_start = time.time()
+        self._send_range_header()
         if self._sending_handle is None:
-            self._sending_handle = self._loop.call_soon(self._try_sending)
+            self._schedule_sending()
 
     def stop_stream(self):
         """Stop sending data"""
@@ -183,13 +385,19 @@ class BaseTestStream(object):
         self._logger.debug('Stop stream called')
         self._time_stream_stop = time.time()
 
+        if self._paused_since is not None:
+            self._paused_time += time.monotonic() - self._paused_since
+            self._paused_since = None
+
         if self._sending_handle is not None:
             self._sending_handle.cancel()
             self._sending_handle = None
 
-        # Close file handle if file is used
-        if self._test.file:
+        # Close file handle if file is used. Shared source is closed by the test.
+        if self._test.file and not self._is_sending:
             self._data_source_sink.close()
+            self._logger.info('File writer backlogged for %.3f sec',
+                              self._data_source_sink.backlog_time)
 
         self.done = True
 
@@ -199,6 +407,40 @@ class BaseTestStream(object):
         self._test_protocol = proto
         # Link proto with us
         proto.set_owner(self, is_stream=True)
+        # Apply the transport flow control limits
+        proto.set_write_buffer_limits(
+            self._test.write_buffer_high,
+            self._test.write_buffer_low)
+
+    def pause_writing(self):
+        """
+        Request by transport to pause writing.
+        """
+        self._paused = True
+
+        self._pause_count += 1
+        if self._paused_since is None:
+            self._paused_since = time.monotonic()
+
+        if self._loop_monitor is not None:
+            self._loop_monitor.writing_paused()
+
+        if self._sending_handle:
+            self._sending_handle.cancel()
+            self._sending_handle = None
+
+    def resume_writing(self):
+        """
+        Request be transport to resume writing.
+        """
+        self._paused = False
+
+        if self._paused_since is not None:
+            self._paused_time += time.monotonic() - self._paused_since
+            self._paused_since = None
+
+        if self._sending_handle is None and self._time_stream_start and not self.done:
+            self._schedule_sending()
 
     def get_stats_header(self):
         """
@@ -206,26 +448,59 @@ class BaseTestStream(object):
         """
         pass
 
+    def get_diagnostics(self):
+        """
+        Get what the sending side knows about its limits: how often and
+        for which part of the run the transport paused writing.
+        """
+        if not self._is_sending or self._time_stream_start is None:
+            return {}
+
+        run_time = (self._time_stream_stop or time.time()) - self._time_stream_start
+        paused_time = self._paused_time
+        if self._paused_since is not None:
+            paused_time += time.monotonic() - self._paused_since
+
+        return {
+            'pauses': self._pause_count,
+            'paused_fraction': min(paused_time / run_time, 1) if run_time > 0 else 0,
+        }
+
+    def get_hashed_bytes(self):
+        """Get bytes given to the integrity hash so far or None if not hashed"""
+
+        if self._stream_hash is None:
+            return None
+
+        return self._stream_hash.queued_bytes
+
     def get_final_stats(self):
         """
         Get the final stats object
         """
 
+        totals = self._test.stats_store.totals(self._stream_id)
+
         stats_obj = {
             "id":self._stream_id,
-            "bytes":sum([x['bytes'] for x in self._stat_objs]),
+            "bytes":totals.bytes,
             "retransmits":-1,
             "jitter":0,
             "errors":0,
             "packets":0,
         }
 
+        # Digest of all data, including the omitted intervals
+        if self._stream_hash is not None:
+            stats_obj['digest'] = self._stream_hash.finish()
+            stats_obj['digest_bytes'] = self._stream_hash.num_bytes
+
         return stats_obj
 
     def get_interval_stats(self, t_start, t_end, t_sec):
         """
         Get stats for the given interval.
-        N.B. Extending function should save object in stats array!
+        N.B. Extending function should save object in the stats store!
         N.B. Extending function should reset protocol specific counters!
         """
 
@@ -243,7 +518,7 @@ class BaseTestStream(object):
             "seconds":	        t_sec,
             "bytes":	        num_bytes,
             "bits_per_second":	int(num_bytes * 8 / t_sec),
-            "omitted":	        False,
+            "omitted":	        self._test.omitting,
             "errors":           0,
         }
 
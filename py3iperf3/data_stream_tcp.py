@@ -1,18 +1,43 @@
 """
 A class representing a single data stream in iPerf3 test.
 """
+import asyncio
 import socket
+import time
 
 from py3iperf3.data_stream_base import BaseTestStream
-from py3iperf3.data_protocol_tcp import TcpTestProtocol
+from py3iperf3.data_protocol_tcp import TcpTestProtocol, TcpBufferedTestProtocol
 from py3iperf3.utils import data_size_formatter
+from py3iperf3.tcp_info import tcp_info_supported
 
 class TestStreamTcp(BaseTestStream):
     """A single test data stream"""
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self._paused = False
+        self._sendfile_task = None
+
+        # TCP_INFO based sender stats
+        self._has_tcp_info = False
+        self._last_total_retrans = 0
+        self._retransmits = 0
+        self._max_snd_cwnd = 0
+        self._max_rtt = 0
+        self._min_rtt = None
+        self._sum_rtt = 0
+        self._num_rtt = 0
+
+        # Sender limits for the diagnosis. TCP_INFO (busy, rwnd_limited,
+        # sndbuf_limited) times at the start and the end of the test.
+        self._send_queue_sum = 0
+        self._send_queue_samples = 0
+        self._chrono_first = (0, 0, 0)
+        self._chrono_last = None
+
+    @property
+    def has_retransmits(self):
+        """Check if retransmits are known for this stream"""
+        return self._has_tcp_info
 
     def print_sum_stats(self, stat_list):
         """Given a list of stats objects print a sum"""
@@ -50,12 +75,20 @@ class TestStreamTcp(BaseTestStream):
                            self._test.server_port,
                            ip_family)
 
+        # Receive into a preallocated buffer if requested
+        if self._test.buffered_rx and not self._is_sending:
+            protocol_class = TcpBufferedTestProtocol
+        else:
+            protocol_class = TcpTestProtocol
+
         try:
             connect_coro = self._loop.create_connection(
-                lambda: TcpTestProtocol(
+                lambda: protocol_class(
                     test_stream=self,
                     no_delay=self._test.no_delay,
-                    window=self._test.window),
+                    window=self._test.window,
+                    write_buffer_high=self._test.write_buffer_high,
+                    write_buffer_low=self._test.write_buffer_low),
                 host=self._test.server_address,
                 port=self._test.server_port,
                 family=ip_family)
@@ -74,11 +107,111 @@ class TestStreamTcp(BaseTestStream):
 
     def get_interval_stats(self, t_start, t_end, t_sec):
         """
-        Get interval stats from base. Nothing to extend.
+        Get interval stats from base. Extend with TCP_INFO on the sender.
         """
 
         stats = super().get_interval_stats(t_start, t_end, t_sec)
-        self._stat_objs.append(stats)
+
+        if self._test.sender:
+            self._add_tcp_info_stats(stats)
+            self._sample_send_queue(stats)
+
+        self._test.stats_store.append(self._stream_id, stats)
+        self._last_stats = stats
+
+        return stats
+
+    def _add_tcp_info_stats(self, stats):
+        """
+        Sample TCP_INFO and add retransmits, cwnd and RTT to the interval stats.
+        """
+        tcp_info = self._test_protocol.get_tcp_info()
+        if tcp_info is None:
+            return
+
+        self._has_tcp_info = True
+
+        retransmits = tcp_info['total_retrans'] - self._last_total_retrans
+        self._last_total_retrans = tcp_info['total_retrans']
+        snd_cwnd = tcp_info['snd_cwnd'] * tcp_info['snd_mss']
+
+        stats['retransmits'] = retransmits
+        stats['snd_cwnd'] = snd_cwnd
+        stats['rtt'] = tcp_info['rtt']
+        stats['rttvar'] = tcp_info['rttvar']
+        stats['pmtu'] = tcp_info['pmtu']
+
+        # Newer kernels account why the connection was not sending
+        if 'busy_time' in tcp_info:
+            chrono = (tcp_info['busy_time'], tcp_info['rwnd_limited'],
+                      tcp_info['sndbuf_limited'])
+            if stats['omitted']:
+                self._chrono_first = chrono
+            else:
+                self._chrono_last = chrono
+
+        # Warm-up is not in the totals
+        if stats['omitted']:
+            return
+
+        self._retransmits += retransmits
+        self._max_snd_cwnd = max(self._max_snd_cwnd, snd_cwnd)
+        self._max_rtt = max(self._max_rtt, tcp_info['rtt'])
+        if self._min_rtt is None or tcp_info['rtt'] < self._min_rtt:
+            self._min_rtt = tcp_info['rtt']
+        self._sum_rtt += tcp_info['rtt']
+        self._num_rtt += 1
+
+    def _sample_send_queue(self, stats):
+        """
+        Sample how full the socket send buffer is.
+        """
+        if stats['omitted']:
+            return
+
+        send_queue = self._test_protocol.get_send_queue()
+        if send_queue is None or not send_queue[1]:
+            return
+
+        self._send_queue_sum += min(send_queue[0] / send_queue[1], 1)
+        self._send_queue_samples += 1
+
+    def get_diagnostics(self):
+        """
+        Add mean send buffer occupancy and the parts of the busy
+        time limited by the receiver window and the send buffer.
+        """
+        diagnostics = super().get_diagnostics()
+        if not diagnostics:
+            return diagnostics
+
+        if self._send_queue_samples:
+            diagnostics['send_queue'] = self._send_queue_sum / self._send_queue_samples
+
+        if self._chrono_last is not None:
+            busy_time = self._chrono_last[0] - self._chrono_first[0]
+            if busy_time > 0:
+                diagnostics['rwnd_limited'] = (
+                    self._chrono_last[1] - self._chrono_first[1]) / busy_time
+                diagnostics['sndbuf_limited'] = (
+                    self._chrono_last[2] - self._chrono_first[2]) / busy_time
+
+        return diagnostics
+
+    def get_final_stats(self):
+        """
+        Get base stats object and add TCP_INFO totals if sampled.
+        """
+        stats = super().get_final_stats()
+
+        if self._has_tcp_info:
+            stats['retransmits'] = self._retransmits
+            stats['max_snd_cwnd'] = self._max_snd_cwnd
+            stats['max_rtt'] = self._max_rtt
+            stats['min_rtt'] = self._min_rtt
+            # All samples may have been taken while omitting
+            if self._num_rtt:
+                stats['mean_rtt'] = self._sum_rtt // self._num_rtt
 
         return stats
 
@@ -88,43 +221,119 @@ class TestStreamTcp(BaseTestStream):
         """
 
         # Get reference to the last entry
-        stats = self._stat_objs[-1]
+        stats = self._last_stats
 
         # Format strings
         size_str = data_size_formatter(int(stats['bytes'])*8, in_bytes=True)
         speed_str = data_size_formatter(int(stats['bits_per_second']))
 
-        # Print entry
-        self._logger.info('[{}] {:.2f}-{:.2f} sec {} B {}/sec'.format(
+        stat_str = '[{}] {:.2f}-{:.2f} sec {} B {}/sec'.format(
             stats['socket'],
             stats['start'],
             stats['end'],
             size_str,
-            speed_str))
+            speed_str)
+
+        # Sender with TCP_INFO
+        if 'retransmits' in stats:
+            cwnd_str = data_size_formatter(stats['snd_cwnd'] * 8, in_bytes=True)
+            stat_str = '{}  {} Retr  {} Cwnd'.format(stat_str, stats['retransmits'], cwnd_str)
+
+        if stats['omitted']:
+            stat_str = '{}  (omitted)'.format(stat_str)
+
+        # Print entry
+        self._logger.info(stat_str)
 
-    def _try_sending(self):
+    def start_stream(self):
         """
-        Implement paused gating.
+        Start sending data. Use sendfile if zero-copy file sending is requested.
         """
-        if not self._paused:
-            super()._try_sending()
+        if not (self._test.zerocopy and self._test.file):
+            super().start_stream()
+            return
+
+        self._time_stream_start = time.time()
+        self._send_range_header()
+        if self._sendfile_task is None:
+            self._sendfile_task = self._loop.create_task(self._send_file())
 
-    def pause_writing(self):
+    def stop_stream(self):
         """
-        Request by transport to pause writing.
+        Stop sending data and cancel the sendfile task if any.
         """
-        self._paused = True
+        if self._sendfile_task is not None:
+            self._sendfile_task.cancel()
+            self._sendfile_task = None
 
-        if self._sending_handle:
-            self._sending_handle.cancel()
-            self._sending_handle = None
+        super().stop_stream()
 
-    def resume_writing(self):
+    async def _send_file(self):
         """
-        Request be transport to resume writing.
+        Push the file to the socket block by block using sendfile.
+        Falls back to the copying sender if sendfile is not available.
         """
-        self._paused = False
-        self._sending_handle = self._loop.call_soon(self._try_sending)
+        while not self.done:
+
+            if not self._pacing_allows():
+                await asyncio.sleep(self._pacer.delay(self._block_size))
+                continue
+
+            if not self._claim_block():
+                self._sendfile_task = None
+                self.done = True
+                self._test.sendable_data_depleted()
+                return
+
+            self._file_offset = self._data_source_sink.normalize_offset(
+                self._file_offset, self._file_start, self._file_end)
+
+            # Stay within the part of the file of this stream
+            count = self._block_size
+            if self._file_end is not None:
+                count = min(count, self._file_end - self._file_offset)
+
+            try:
+                bytes_sent = 0
+                if count > 0:
+                    bytes_sent = await self._test_protocol.send_file(
+                        self._loop, self._data_source_sink.file,
+                        self._file_offset, count)
+            except asyncio.SendfileNotAvailableError as exc:
+                self._logger.debug('[%s] Zero-copy not possible, falling back to copying: %s',
+                                   self.socket_id, exc)
+                self._sendfile_task = None
+
+                # Send the claimed block and continue as normal
+                self._send_block()
+                self._schedule_sending()
+                return
+            except ConnectionError as exc:
+                self._logger.debug('[%s] Connection lost while sending file: %s',
+                                   self.socket_id, exc)
+                self._sendfile_task = None
+                return
+
+            # Zero bytes == file EOF
+            if not bytes_sent:
+                self._sendfile_task = None
+                self.done = True
+                self._file_sent()
+                return
+
+            if self._stream_hash is not None:
+                sent_block, _ = self._data_source_sink.get_block(self._file_offset, bytes_sent)
+                self._stream_hash.update(sent_block)
+
+            self._file_offset += bytes_sent
+            self._blocks_tx_this_interval += 1
+            self._bytes_tx_this_interval += bytes_sent
 
     def get_stats_header(self):
+        """
+        Sender gets retransmits and congestion window columns if available.
+        """
+        if self._test.sender and tcp_info_supported():
+            return '[ ID] Interval           Transfer     Bandwidth       Retr  Cwnd'
+
         return '[ ID] Interval           Transfer     Bandwidth'
\ No newline at end of file
@@ -1,13 +1,23 @@
 """
 Test data stream over UDP.
 """
+import socket
 import struct
 import time
 
 from py3iperf3.data_stream_base import BaseTestStream
-from py3iperf3.data_protocol_udp import UdpTestProtocol
+from py3iperf3.data_protocol_udp import UdpTestProtocol, UdpBatchTestProtocol
+from py3iperf3.udp_rx_log import UdpRxLog
 from py3iperf3.utils import data_size_formatter
 
+# Datagram header: time sec, time usec, packet count
+UDP_HEADER_32 = struct.Struct('>III')
+UDP_HEADER_64 = struct.Struct('>IIQ')
+
+# Max datagrams and bytes in a single UDP GSO send
+GSO_MAX_SEGMENTS = 64
+GSO_MAX_BYTES = 65507
+
 class TestStreamUdp(BaseTestStream):
     """
     UDP Test data stream.
@@ -24,21 +34,82 @@ class TestStreamUdp(BaseTestStream):
         self._pkt_cnt_64bit = self._test._parameters.udp64bitcounters
         self._err_count = 0
         self._ooo_count = 0
+        self._dup_count = 0
 
         self._jitter = 0
-        self._prev_transit = 0
+
+        # Received datagrams, processed at interval boundaries
+        self._rx_log = UdpRxLog()
+
+        if self._pkt_cnt_64bit:
+            self._header = UDP_HEADER_64
+        else:
+            self._header = UDP_HEADER_32
+
+        # Datagram is built in place for every packet
+        self._datagram = bytearray(self._block_size)
+        self._datagram_view = memoryview(self._datagram)
+        if self._is_sending and self._test.file is None:
+            self._datagram[:] = self._data_source_sink[0]
+
+        # Super-buffer of datagrams for UDP GSO
+        self._gso_segments = 0
+        self._gso_buffer = None
+        self._gso_view = None
 
     def create_connection(self):
         """
         Create UDP datagram socket.
         """
-        connect_coro = self._loop.create_datagram_endpoint(
-            lambda: UdpTestProtocol(test_stream=self),
-            remote_addr=(
-                self._test.server_address,
-                self._test.server_port))
+        if self._test.udp_gso and self._is_sending:
+            connect_coro = self._create_gso_endpoint()
+        elif (self._test.udp_batch_rx or self._test.udp_gro) and not self._is_sending:
+            connect_coro = self._create_batch_rx_endpoint()
+        else:
+            connect_coro = self._loop.create_datagram_endpoint(
+                lambda: UdpTestProtocol(test_stream=self),
+                remote_addr=(
+                    self._test.server_address,
+                    self._test.server_port))
         self._loop.create_task(connect_coro)
 
+    async def _make_connected_socket(self):
+        """
+        Make a non-blocking UDP socket connected to the server.
+        """
+        addr_info = await self._loop.getaddrinfo(
+            self._test.server_address,
+            self._test.server_port,
+            type=socket.SOCK_DGRAM)
+        family, sock_type, proto, _, remote_addr = addr_info[0]
+
+        sock = socket.socket(family, sock_type, proto)
+        sock.setblocking(False)
+        sock.connect(remote_addr)
+
+        return sock
+
+    async def _create_gso_endpoint(self):
+        """
+        Create the datagram endpoint on our own socket, so that
+        GSO super-buffers can be sent on it directly.
+        """
+        sock = await self._make_connected_socket()
+
+        await self._loop.create_datagram_endpoint(
+            lambda: UdpTestProtocol(test_stream=self, sock=sock),
+            sock=sock)
+
+    async def _create_batch_rx_endpoint(self):
+        """
+        Create the batched receive engine in place of the datagram endpoint.
+        """
+        sock = await self._make_connected_socket()
+
+        batch_protocol = UdpBatchTestProtocol(
+            self._loop, sock, test_stream=self, gro=self._test.udp_gro)
+        batch_protocol.start()
+
     def connection_established(self, test_protocol):
         """
         Callback on connection established.
@@ -51,6 +122,32 @@ class TestStreamUdp(BaseTestStream):
 
         self._logger.info('UDP Test: initial data')
 
+        if self._test.udp_gso and self._is_sending:
+            self._setup_gso()
+
+    def _setup_gso(self):
+        """
+        Prepare the GSO super-buffer if the kernel supports UDP GSO.
+        """
+        num_segments = min(GSO_MAX_SEGMENTS, GSO_MAX_BYTES // self._block_size)
+
+        if self._test.file or num_segments < 2:
+            self._logger.info('UDP GSO is not used with files or large blocks')
+            return
+
+        if not self._test_protocol.enable_gso(self._block_size):
+            self._logger.info('UDP GSO refused, sending datagrams one by one')
+            return
+
+        self._gso_segments = num_segments
+        self._gso_buffer = self._datagram * num_segments
+        self._gso_view = memoryview(self._gso_buffer)
+
+        # Datagrams of the super-buffer carry consecutive payload blocks
+        for index in range(num_segments):
+            offset = index * self._block_size
+            self._gso_view[offset:offset + self._block_size] = next(self._payload_blocks)
+
     def data_received(self, data, remote_addr=None):
         """Data received callback"""
 
@@ -58,84 +155,110 @@ class TestStreamUdp(BaseTestStream):
         if len(data) == 4:
             return
 
-        self._pkt_rx_this_interval += 1
-
-        # Extract time and packet count
-        if self._pkt_cnt_64bit:
-            (time_sec, time_usec, pkt_num) = struct.unpack(
-                '>IIQ', data[:16])
-        else:
-            (time_sec, time_usec, pkt_num) = struct.unpack(
-                '>III', data[:12])
-
-        # Handle Out-Of-Order packets
-        # Algo is lifted from ESnet iPerf3 code
-        if pkt_num >= self._pkt_cnt + 1:
+        # Extract time and packet count, loss and jitter are computed later
+        (time_sec, time_usec, pkt_num) = self._header.unpack_from(data)
+        self._rx_log.append(
+            pkt_num, time_sec * 1000000000 + time_usec * 1000, time.time_ns())
 
-            # count errors
-            if pkt_num > self._pkt_cnt + 1:
-                self._err_count += (pkt_num - 1) - self._pkt_cnt
-
-            # Update largest seen
-            self._pkt_cnt = pkt_num
-        else:
-            # We got missing packet
-            if pkt_num < self._pkt_cnt:
-                self._lost_in_period -= 1
+        # Handle received data as normal
+        super().data_received(data, remote_addr)
 
-            self._ooo_count += 1
-            if self._err_count > 0:
-                self._err_count -= 1
+    def _process_received(self):
+        """
+        Compute loss, out-of-order, duplicates and jitter for the
+        datagrams received since the last call.
+        """
+        self._pkt_rx_this_interval += self._rx_log.process()
 
-            self._logger.debug("Out-of-Order Packet: Incoming seq: %s but expected %s",
-                               pkt_num, self._pkt_cnt)
+        self._err_count = self._rx_log.errors
+        self._ooo_count = self._rx_log.out_of_order
+        self._dup_count = self._rx_log.duplicates
+        self._jitter = self._rx_log.jitter
 
-        # Jitter calc
-        transit = time.time() - time_sec - (time_usec / 1000000)
-        d = transit - self._prev_transit
-        if d < 0:
-            d = -d
+    def _get_block(self):
+        """
+        Build the datagram in the preallocated buffer. The header is
+        packed in place, so no new objects are allocated per packet.
+        """
+        length = self._block_size
 
-        self._prev_transit = transit
-        self._jitter += (d - self._jitter) / 16.0
+        if self._test.file:
+            block_bytes = super()._get_block()
+            length = len(block_bytes)
 
-        # Handle received data as normal
-        super().data_received(data, remote_addr)
+            # Nothing to send on EOF
+            if not length:
+                return block_bytes
 
-    def _get_block(self):
-        """Get block to send and make UDP changes"""
+            # Payload is copied after the header, short blocks are padded to header size
+            length = max(length, self._header.size)
+            self._datagram_view[self._header.size:len(block_bytes)] = block_bytes[self._header.size:]
+        elif len(self._data_source_sink) > 1:
+            # Payload of the next block of the ring after the header
+            self._datagram_view[self._header.size:] = next(
+                self._payload_blocks)[self._header.size:]
 
-        block_bytes = super()._get_block()
+        time_sec, time_nsec = divmod(time.time_ns(), 1000000000)
+        self._header.pack_into(self._datagram, 0, time_sec, time_nsec // 1000, self._pkt_cnt)
 
-        time_now = time.time()
-        time_sec = int(time_now)
-        time_usec = int((time_now % 1) * 1000000)
+        if length == self._block_size:
+            return self._datagram
 
-        # Handle 64-bit counters
-        if self._pkt_cnt_64bit:
-            udp_extras = struct.pack('>IIQ',
-                                     time_sec,
-                                     time_usec,
-                                     self._pkt_cnt)
-            block_bytes = udp_extras + block_bytes[16:]
-        else:
-            udp_extras = struct.pack('>III',
-                                     time_sec,
-                                     time_usec,
-                                     self._pkt_cnt)
-            block_bytes = udp_extras + block_bytes[12:]
+        return self._datagram_view[:length]
 
-        return block_bytes
+    def _send_gso_blocks(self):
+        """
+        Claim as many blocks as fit into the GSO super-buffer, stamp
+        each datagram with its own header and send them at once.
+        """
+        # The first block is already claimed by the caller
+        num_blocks = 1
+        while (num_blocks < self._gso_segments and
+               self._pacing_allows() and
+               self._claim_block()):
+            num_blocks += 1
+
+        time_sec, time_nsec = divmod(time.time_ns(), 1000000000)
+        time_usec = time_nsec // 1000
+        for index in range(num_blocks):
+            self._header.pack_into(self._gso_buffer, index * self._block_size,
+                                   time_sec, time_usec, self._pkt_cnt + index)
+
+        num_bytes = num_blocks * self._block_size
+        self._test_protocol.send_segments(
+            self._gso_view[:num_bytes], self._block_size)
+
+        self._blocks_tx_this_interval += num_blocks
+        self._bytes_tx_this_interval += num_bytes
+        self._pkt_tx_this_interval += num_blocks
+        self._pkt_cnt += num_blocks
+
+        return num_bytes
 
     def _send_block(self):
         """Extend sending function with packets counting"""
 
+        if self._gso_segments:
+            return self._send_gso_blocks()
+
         # Send the block
-        super()._send_block()
+        bytes_sent = super()._send_block()
 
         # Increase the counters
-        self._pkt_tx_this_interval += 1
-        self._pkt_cnt += 1
+        if bytes_sent:
+            self._pkt_tx_this_interval += 1
+            self._pkt_cnt += 1
+
+        return bytes_sent
+
+    def stop_stream(self):
+        """
+        Stop the stream and close the data socket.
+        """
+        super().stop_stream()
+
+        if self._test_protocol is not None:
+            self._test_protocol.close()
 
     def get_final_stats(self):
         """
@@ -143,8 +266,14 @@ class TestStreamUdp(BaseTestStream):
         """
 
         stats = super().get_final_stats()
-        stats['packets'] = sum([x['packets'] for x in self._stat_objs])
-        stats['errors'] = sum([x['errors'] for x in self._stat_objs])
+        totals = self._test.stats_store.totals(self._stream_id)
+        stats['packets'] = totals.packets
+        stats['errors'] = totals.errors
+        stats['jitter'] = self._jitter / 1000000000
+
+        if not self._test.sender:
+            stats['out_of_order'] = self._ooo_count
+            stats['duplicates'] = self._dup_count
 
         return stats
 
@@ -152,6 +281,8 @@ class TestStreamUdp(BaseTestStream):
         """
         Get interval stats. Extend and reset packet counters.
         """
+        if not self._test.sender:
+            self._process_received()
 
         stats = super().get_interval_stats(t_start, t_end, t_sec)
         if self._test.sender:
@@ -159,13 +290,15 @@ class TestStreamUdp(BaseTestStream):
         else:
             stats['packets'] = self._pkt_rx_this_interval
             stats['errors'] = self._err_count
-            stats['jitter'] = self._jitter
+            stats['jitter'] = self._jitter / 1000000000
          
         self._pkt_tx_this_interval = 0
         self._pkt_rx_this_interval = 0
         self._err_count = 0
+        self._rx_log.errors = 0
 
-        self._stat_objs.append(stats)
+        self._test.stats_store.append(self._stream_id, stats)
+        self._last_stats = stats
 
         return stats
 
@@ -175,7 +308,7 @@ class TestStreamUdp(BaseTestStream):
         """
 
         # Get reference to the last entry
-        stats = self._stat_objs[-1]
+        stats = self._last_stats
 
         # Format strings
         size_str = data_size_formatter(int(stats['bytes'])*8, in_bytes=True)
@@ -196,6 +329,9 @@ class TestStreamUdp(BaseTestStream):
             stat_str = '{}  {:.4f} ms   {}/{}'.format(
                 base_str, stats['jitter'] * 1000, stats['errors'], stats['packets'])
 
+        if stats['omitted']:
+            stat_str = '{}  (omitted)'.format(stat_str)
+
         # Print entry
         self._logger.info(stat_str)
 
@@ -0,0 +1,256 @@
+"""
+Test streams running in their own worker processes.
+The parent keeps a proxy stream that reads the worker's counters.
+"""
+import multiprocessing
+import time
+
+from py3iperf3.cpu_usage import cpu_utilization
+from py3iperf3.data_stream_tcp import TestStreamTcp
+from py3iperf3.data_stream_udp import TestStreamUdp
+
+# Layout of the shared counters array
+CNT_STATE = 0
+CNT_BYTES_TX = 1
+CNT_BYTES_RX = 2
+CNT_BLOCKS_TX = 3
+CNT_PKT_TX = 4
+CNT_PKT_RX = 5
+CNT_ERRORS = 6
+CNT_JITTER_NS = 7
+CNT_TCPI_VALID = 8
+CNT_TCPI_RETRANS = 9
+CNT_TCPI_CWND = 10
+CNT_TCPI_RTT = 11
+CNT_TCPI_RTTVAR = 12
+CNT_TCPI_PMTU = 13
+CNT_CPU_USER_US = 14
+CNT_CPU_SYSTEM_US = 15
+CNT_OUT_OF_ORDER = 16
+CNT_DUPLICATES = 17
+NUM_COUNTERS = 18
+
+# Worker states
+WORKER_STARTING = 0
+WORKER_RUNNING = 1
+WORKER_DONE = 2
+WORKER_STOPPED = 3  # Last counters are published
+
+# How often workers publish counters and check for commands
+WORKER_TICK = 0.01
+WORKER_JOIN_TIMEOUT = 1
+
+class WorkerProtocolProxy(object):
+    """
+    Stands in for the data protocol of a stream running in a worker.
+    """
+
+    def __init__(self, counters, socket_id):
+        self._counters = counters
+        self._sock_id = socket_id
+
+    @property
+    def socket_id(self):
+        """
+        Return the id of the stream. Socket numbers of the
+        workers are per process and may be the same.
+        """
+        return self._sock_id
+
+    def get_tcp_info(self):
+        """Get the TCP_INFO last published by the worker"""
+
+        if not self._counters[CNT_TCPI_VALID]:
+            return None
+
+        return {
+            'total_retrans': self._counters[CNT_TCPI_RETRANS],
+            'snd_cwnd': self._counters[CNT_TCPI_CWND],
+            'snd_mss': 1,   # Worker publishes cwnd in bytes
+            'rtt': self._counters[CNT_TCPI_RTT],
+            'rttvar': self._counters[CNT_TCPI_RTTVAR],
+            'pmtu': self._counters[CNT_TCPI_PMTU],
+        }
+
+    def get_send_queue(self):
+        """Send buffer of the worker's socket is not published"""
+        return None
+
+    def close(self):
+        """Socket is closed by the worker"""
+        pass
+
+class StreamWorkerMixin(object):
+    """
+    Proxy for a stream running in a worker process with its own event loop.
+    Counters published by the worker are turned into the interval counters
+    of the stream, so stats are produced and printed as usual.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self._blocks_share = kwargs.get('blocks_remaining')
+        self._bytes_share = kwargs.get('bytes_remaining')
+
+        # Stream whose worker must connect before this one
+        self._previous_stream = kwargs.get('previous_stream')
+
+        self._mp_context = multiprocessing.get_context('spawn')
+        self._counters = self._mp_context.RawArray('q', NUM_COUNTERS)
+        self._last_counters = [0] * NUM_COUNTERS
+        self._start_event = self._mp_context.Event()
+        self._stop_event = self._mp_context.Event()
+        self._worker = None
+        self._poll_handle = None
+
+        # (time, user, system) of the worker at start and stop of the stream
+        self._cpu_first = None
+        self._cpu_final = None
+
+        self._test_protocol = WorkerProtocolProxy(self._counters, self._stream_id)
+
+    def create_connection(self):
+        """
+        Start the worker process. The worker connects to the server once
+        the worker of the previous stream has, so the server gives the
+        streams the same ids.
+        """
+
+        # Imported here to avoid circular import with the test class
+        from py3iperf3.stream_worker import run_stream_worker
+
+        previous_counters = None
+        if self._previous_stream is not None:
+            previous_counters = self._previous_stream._counters
+
+        self._worker = self._mp_context.Process(
+            target=run_stream_worker,
+            args=(self._test.worker_parameters,
+                  self._test.role,
+                  self._test.cookie,
+                  self._stream_id,
+                  self._blocks_share,
+                  self._bytes_share,
+                  self._file_range,
+                  self._counters,
+                  previous_counters,
+                  self._start_event,
+                  self._stop_event),
+            daemon=True)
+        self._worker.start()
+
+        self._logger.debug('Stream %s worker started. PID: %s',
+                           self._stream_id, self._worker.pid)
+
+    def start_stream(self):
+        """Tell the worker to start sending"""
+
+        self._time_stream_start = time.time()
+        self._cpu_first = self._cpu_sample()
+        self._start_event.set()
+        self._poll_handle = self._loop.call_later(WORKER_TICK, self._poll_worker)
+
+    @property
+    def stopped(self):
+        """Has the worker published its last counters?"""
+        return (self._worker is None or
+                self._counters[CNT_STATE] == WORKER_STOPPED or
+                not self._worker.is_alive())
+
+    def request_stop(self):
+        """Tell the worker to stop, without waiting for it"""
+
+        if self._poll_handle is not None:
+            self._poll_handle.cancel()
+            self._poll_handle = None
+
+        self._stop_event.set()
+
+    def stop_stream(self):
+        """Tell the worker to stop and wait for it to exit"""
+
+        self.request_stop()
+        if self._worker is not None:
+            self._worker.join(WORKER_JOIN_TIMEOUT)
+            self._worker = None
+
+        if self._cpu_first is not None and self._cpu_final is None:
+            self._cpu_final = self._cpu_sample()
+
+        super().stop_stream()
+
+    def _cpu_sample(self):
+        """Get (time, user, system) CPU seconds last published by the worker"""
+        return (time.monotonic(),
+                self._counters[CNT_CPU_USER_US] / 1000000,
+                self._counters[CNT_CPU_SYSTEM_US] / 1000000)
+
+    def get_cpu_times(self):
+        """Get user and system CPU seconds the worker used since the start"""
+
+        if self._cpu_first is None:
+            return 0, 0
+
+        last = self._cpu_final or self._cpu_sample()
+        return last[1] - self._cpu_first[1], last[2] - self._cpu_first[2]
+
+    def get_final_stats(self):
+        """Add CPU utilization of the worker to the final stats"""
+
+        stats = super().get_final_stats()
+
+        if self._cpu_final is not None:
+            stats.update(cpu_utilization(self._cpu_first, self._cpu_final))
+
+        return stats
+
+    def get_diagnostics(self):
+        """Flow control of the worker's transport is not published"""
+        return {}
+
+    def _poll_worker(self):
+        """Check if the worker has sent all data"""
+
+        if self._counters[CNT_STATE] != WORKER_DONE:
+            self._poll_handle = self._loop.call_later(WORKER_TICK, self._poll_worker)
+            return
+
+        self._poll_handle = None
+        self.done = True
+
+        # Data is split between the workers, wait for all of them
+        if self._test.all_streams_done:
+            self._test.sendable_data_depleted()
+
+    def _process_received(self):
+        """Received datagrams are processed in the worker"""
+        pass
+
+    def get_interval_stats(self, t_start, t_end, t_sec):
+        """
+        Set interval counters from the worker's counters and get stats as usual.
+        """
+        counters = self._counters[:]
+        delta = [now - last for now, last in zip(counters, self._last_counters)]
+        self._last_counters = counters
+
+        self._bytes_tx_this_interval = delta[CNT_BYTES_TX]
+        self._bytes_rx_this_interval = delta[CNT_BYTES_RX]
+        self._blocks_tx_this_interval = delta[CNT_BLOCKS_TX]
+        self._pkt_tx_this_interval = delta[CNT_PKT_TX]
+        self._pkt_rx_this_interval = delta[CNT_PKT_RX]
+        self._err_count = delta[CNT_ERRORS]
+        self._jitter = counters[CNT_JITTER_NS]
+        self._ooo_count = counters[CNT_OUT_OF_ORDER]
+        self._dup_count = counters[CNT_DUPLICATES]
+
+        return super().get_interval_stats(t_start, t_end, t_sec)
+
+class WorkerStreamTcp(StreamWorkerMixin, TestStreamTcp):
+    """TCP test stream running in a worker process"""
+    pass
+
+class WorkerStreamUdp(StreamWorkerMixin, TestStreamUdp):
+    """UDP test stream running in a worker process"""
+    pass
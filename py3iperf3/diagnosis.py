@@ -0,0 +1,67 @@
+"""
+Diagnosis of what limited the throughput of a test stream.
+"""
+
+BOUND_CPU = 'CPU-bound'
+BOUND_FLOW_CONTROL = 'flow-control-bound'
+BOUND_NETWORK = 'network-bound'
+
+# Utilization (100% == one core) above which a side is saturated
+CPU_SATURATED_PERCENT = 90
+
+# Part of the busy time above which the receiver window is the limit
+RWND_LIMITED_FRACTION = 0.5
+
+# Part of the run the sender had a full send buffer or a paused transport
+# above which the sender kept up with the network
+BACKLOGGED_FRACTION = 0.2
+
+# 99th percentile of the loop timer delay above which the loop is overloaded
+LOOP_LAG_MS = 5
+
+def diagnose_stream(diagnostics, sender_cpu=None, receiver_cpu=None, loop_lag=None):
+    """
+    Classify a stream as CPU-bound, flow-control-bound or network-bound.
+
+    diagnostics are the sender's stream diagnostics (empty if unknown),
+    CPU utilization is the total percent of the side or None if unknown,
+    loop_lag is the loop monitor summary of the sender or None.
+    Returns the verdict and a list of reasons for it.
+    """
+    rwnd_limited = diagnostics.get('rwnd_limited')
+    if rwnd_limited is not None and rwnd_limited >= RWND_LIMITED_FRACTION:
+        return BOUND_FLOW_CONTROL, [
+            'receiver window limited {:.0f}% of busy time'.format(100 * rwnd_limited)]
+
+    sender_saturated = sender_cpu is not None and sender_cpu >= CPU_SATURATED_PERCENT
+    if receiver_cpu is not None and receiver_cpu >= CPU_SATURATED_PERCENT \
+            and not sender_saturated:
+        return BOUND_FLOW_CONTROL, [
+            'receiver CPU {:.0f}%'.format(receiver_cpu)]
+
+    # Data was waiting for the network most of the time
+    backlog = []
+    paused_fraction = diagnostics.get('paused_fraction')
+    if paused_fraction is not None and paused_fraction >= BACKLOGGED_FRACTION:
+        backlog.append('transport paused {:.0f}% of the time'.format(100 * paused_fraction))
+    send_queue = diagnostics.get('send_queue')
+    if send_queue is not None and send_queue >= BACKLOGGED_FRACTION:
+        backlog.append('send buffer {:.0f}% full'.format(100 * send_queue))
+
+    if not backlog:
+        reasons = []
+        if sender_saturated:
+            reasons.append('sender CPU {:.0f}%'.format(sender_cpu))
+        if loop_lag is not None and loop_lag['timer_delay']['p99_ms'] >= LOOP_LAG_MS:
+            reasons.append('event loop lag {:.1f} ms'.format(loop_lag['timer_delay']['p99_ms']))
+        if reasons:
+            return BOUND_CPU, reasons
+
+    sndbuf_limited = diagnostics.get('sndbuf_limited')
+    if sndbuf_limited is not None and sndbuf_limited >= BACKLOGGED_FRACTION:
+        backlog.append('send buffer limited {:.0f}% of busy time'.format(100 * sndbuf_limited))
+
+    if not backlog:
+        backlog.append('no sender or receiver limit found')
+
+    return BOUND_NETWORK, backlog
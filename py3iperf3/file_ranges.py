@@ -0,0 +1,41 @@
+"""
+Splitting of a file between parallel streams.
+
+Every stream of a partitioned transfer starts with a range header telling
+the receiver where in the file the data of the stream belongs.
+"""
+import struct
+
+# Magic, range offset, range length, file size
+RANGE_HEADER = struct.Struct('!4sQQQ')
+RANGE_MAGIC = b'P3FR'
+
+def split_file(size, parts, align=1):
+    """
+    Split size bytes into parts (offset, length) ranges. Range
+    boundaries are multiples of align, the last range takes the rest.
+    """
+    part_size = -(-size // parts)
+    part_size = -(-part_size // align) * align
+
+    ranges = []
+    for index in range(parts):
+        offset = min(index * part_size, size)
+        ranges.append((offset, min(part_size, size - offset)))
+
+    return ranges
+
+def pack_range_header(offset, length, size):
+    """Make the range header of a stream"""
+    return RANGE_HEADER.pack(RANGE_MAGIC, offset, length, size)
+
+def unpack_range_header(header):
+    """
+    Get (offset, length, size) from the range header.
+    Returns None if the data does not start with a range header.
+    """
+    magic, offset, length, size = RANGE_HEADER.unpack(header)
+    if magic != RANGE_MAGIC:
+        return None
+
+    return offset, length, size
@@ -0,0 +1,160 @@
+"""
+File sink used by the receiving streams.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+
+# Size of coalesced writes. Multiple of the page size, so writes stay aligned.
+WRITE_CHUNK_SIZE = 1024 * 1024
+# Max chunks waiting for the writer thread
+WRITE_QUEUE_DEPTH = 8
+
+class FileSink(object):
+    """
+    Coalesces received data into large chunks that are written to
+    the file by a background thread. The event loop only copies data
+    into the current chunk. It waits for the writer only when the queue
+    is full; the time spent waiting is reported as backlog time.
+
+    Data is written from the start of the file, or from the start of the
+    range set before the first write, so parallel streams can each write
+    their own part of the same file.
+    """
+
+    def __init__(self, file_name, chunk_size=WRITE_CHUNK_SIZE,
+                 queue_depth=WRITE_QUEUE_DEPTH):
+        """
+        Open the file and start the writer thread.
+        """
+        self._logger = logging.getLogger('py3iperf3')
+        self._file = open(file_name, 'rb+', buffering=0)
+        self._chunk_size = chunk_size
+        self._position = 0
+
+        # Chunks to write and written chunks for reuse
+        self._write_queue = queue.Queue(maxsize=queue_depth)
+        self._free_chunks = queue.SimpleQueue()
+
+        self._chunk = bytearray(chunk_size)
+        self._chunk_view = memoryview(self._chunk)
+        self._fill = 0
+
+        self._backlog_time = 0
+        self._error = None
+        self._closed = False
+
+        self._writer = threading.Thread(target=self._write_chunks, daemon=True)
+        self._writer.start()
+
+    @property
+    def backlog_time(self):
+        """Get seconds the event loop waited for the writer"""
+        return self._backlog_time
+
+    def set_range(self, offset, length):
+        """
+        Write from the offset on. Space for length bytes is allocated
+        up front where supported, so parallel ranges do not fragment.
+        """
+        self._position = offset
+
+        if not length or not hasattr(os, 'posix_fallocate'):
+            return
+
+        try:
+            os.posix_fallocate(self._file.fileno(), offset, length)
+        except OSError as exc:
+            self._logger.debug('File space not preallocated: %s', exc)
+
+    def write(self, data):
+        """
+        Copy data into the current chunk and queue full chunks.
+        Raises OSError if the writer thread failed and ValueError
+        if the sink is closed, as the writer is gone.
+        """
+        if self._error is not None:
+            raise self._error
+
+        if self._closed:
+            raise ValueError('Write to a closed file sink')
+
+        data = memoryview(data)
+        while data:
+            num_bytes = min(len(data), self._chunk_size - self._fill)
+            self._chunk_view[self._fill:self._fill + num_bytes] = data[:num_bytes]
+            self._fill += num_bytes
+            data = data[num_bytes:]
+
+            if self._fill == self._chunk_size:
+                self._queue_chunk()
+
+    def _queue_chunk(self):
+        """Hand the current chunk to the writer and take an empty one"""
+
+        item = (self._chunk, self._fill, self._position)
+        self._position += self._fill
+        try:
+            self._write_queue.put_nowait(item)
+        except queue.Full:
+            wait_start = time.perf_counter()
+            self._write_queue.put(item)
+            self._backlog_time += time.perf_counter() - wait_start
+
+        try:
+            self._chunk = self._free_chunks.get_nowait()
+        except queue.Empty:
+            self._chunk = bytearray(self._chunk_size)
+        self._chunk_view = memoryview(self._chunk)
+        self._fill = 0
+
+    def _write_chunks(self):
+        """Writer thread: write queued chunks until told to stop"""
+
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                return
+
+            chunk, length, position = item
+            if self._error is None:
+                try:
+                    self._write_at(memoryview(chunk)[:length], position)
+                except OSError as exc:
+                    self._error = exc
+
+            self._free_chunks.put(chunk)
+
+    def _write_at(self, data, position):
+        """Write all data at the position of the file"""
+
+        if not hasattr(os, 'pwrite'):
+            self._file.seek(position)
+            self._file.write(data)
+            return
+
+        while data:
+            num_bytes = os.pwrite(self._file.fileno(), data, position)
+            data = data[num_bytes:]
+            position += num_bytes
+
+    def close(self):
+        """Write out remaining data, stop the writer and close the file"""
+
+        # One shot action
+        if self._closed:
+            return
+
+        self._closed = True
+
+        if self._fill:
+            self._queue_chunk()
+
+        self._write_queue.put(None)
+        self._writer.join()
+        self._file.close()
+
+        if self._error is not None:
+            self._logger.error('Failed to write received data to file: %s', self._error)
@@ -0,0 +1,85 @@
+"""
+Memory-mapped file used as a data source by the sending streams.
+"""
+import logging
+import mmap
+import os
+
+class FileSource(object):
+    """
+    Read-only memory mapping of a file shared by all streams of a test.
+    Blocks are handed out as memoryview slices of the mapping, so no
+    data is copied or allocated per block. Each stream keeps its own offset
+    and may be limited to its own range of the file.
+    """
+
+    def __init__(self, file_name, wrap=False):
+        """
+        Open and map the file. If wrap is set, reading continues from
+        the start of the file once EOF is reached.
+        """
+        self._logger = logging.getLogger('py3iperf3')
+        self._wrap = wrap
+        self._mmap = None
+
+        self._file = open(file_name, 'rb')
+        self._size = os.fstat(self._file.fileno()).st_size
+
+        # Empty files can not be mapped
+        if self._size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(self._mmap, 'madvise'):
+                self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+            self._view = memoryview(self._mmap)
+        else:
+            self._view = memoryview(b'')
+
+    @property
+    def file(self):
+        """Get the underlying file object"""
+        return self._file
+
+    @property
+    def size(self):
+        """Get the file size in bytes"""
+        return self._size
+
+    def normalize_offset(self, offset, start=0, end=None):
+        """Wrap the offset to the start of the range if required"""
+        if end is None:
+            end = self._size
+
+        if self._wrap and offset >= end:
+            return start
+
+        return offset
+
+    def get_block(self, offset, length, start=0, end=None):
+        """
+        Get a block of up to length bytes starting at the offset, within
+        the range from start to end (the whole file by default).
+        Returns the block and the offset of the next block.
+        Empty block == end of the range.
+        """
+        if end is None:
+            end = self._size
+
+        offset = self.normalize_offset(offset, start, end)
+        block = self._view[offset:min(offset + length, end)]
+
+        return block, offset + len(block)
+
+    def close(self):
+        """Unmap and close the file"""
+
+        self._view.release()
+
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Blocks are still referenced by transport buffers.
+                # The mapping will be released once those are gone.
+                self._logger.debug('File mapping still in use, leaving it to GC')
+
+        self._file.close()
@@ -7,6 +7,8 @@ import socket
 COOKIE_SIZE = 36
 DEFAULT_BLOCK_TCP = 128 * 1024
 DEFAULT_BLOCK_UDP = 1 * 1024
+DEFAULT_UDP_RATE = 1024 * 1024
+CLIENT_VERSION = 'py3iPerf3_v0.9'
 
 class Iperf3TestProto(enum.Enum):
     """Protocol used to trasmit test data"""
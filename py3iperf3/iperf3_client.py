@@ -4,6 +4,7 @@ An entry point and a shell holding iPerf tests on the client side.
 import logging
 import asyncio
 
+from py3iperf3.error import IPerf3Exception
 from py3iperf3.iperf3_test import Iperf3Test
 
 class Iperf3Client(object):
@@ -21,16 +22,68 @@ class Iperf3Client(object):
         self._logger = logging.getLogger('py3iperf3')
 
         self._tests = []
+        self._pending = {}  # Test run by a coroutine -> future of its result
 
     def create_test(self, test_parameters):
         """Create and return an instance of a test"""
 
-        test = Iperf3Test(
+        test = self._make_test(test_parameters)
+        self._tests.append(test)
+        return test
+
+    def _make_test(self, test_parameters):
+        """Make a test given a dict or a settings object"""
+
+        # Settings object holds the changed settings only
+        if not isinstance(test_parameters, dict):
+            test_parameters = vars(test_parameters)
+
+        # Run streams of the test in worker processes
+        if self._use_processes and test_parameters.get('use_processes') is None:
+            test_parameters = dict(test_parameters, use_processes=True)
+
+        return Iperf3Test(
             master=self,
             loop=self._loop,
             test_parameters=test_parameters)
-        self._tests.append(test)
-        return test
+
+    async def run_test(self, test_parameters):
+        """
+        Run a test on the loop of the client and get its TestResult.
+        The loop is not stopped once the test is done.
+        Raises IPerf3Exception if the test fails.
+        """
+        test = self._make_test(test_parameters)
+        future = self._loop.create_future()
+        self._pending[test] = future
+
+        test.run()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # Keep the test pending, so that test_done does not
+            # take it for one of the tests of run_all_tests
+            test.stop()
+            raise
+
+    async def run(self, tests, concurrency=None, return_exceptions=False):
+        """
+        Run tests given by their parameters, up to concurrency tests at
+        a time (all at once by default). Get their TestResults in the
+        order of the tests. Failures are raised or returned as in
+        asyncio.gather.
+        """
+        semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+        async def run_limited(test_parameters):
+            if semaphore is None:
+                return await self.run_test(test_parameters)
+
+            async with semaphore:
+                return await self.run_test(test_parameters)
+
+        return await asyncio.gather(
+            *[run_limited(x) for x in tests], return_exceptions=return_exceptions)
 
     def run_all_tests(self):
         """Run all tests"""
@@ -44,9 +97,28 @@ class Iperf3Client(object):
         for test in self._tests:
             test.stop()
 
+    def _set_test_result(self, future, test):
+        """Resolve the future of a test run by a coroutine"""
+
+        # Cancelled by the caller
+        if future.done():
+            return
+
+        if test.error is not None:
+            future.set_exception(IPerf3Exception('Test failed: {}'.format(test.error)))
+        elif test.remote_results is None:
+            future.set_exception(IPerf3Exception('Test stopped before the results were exchanged'))
+        else:
+            future.set_result(test.get_result())
+
     def test_done(self, test):
         """Callback on test completed"""
 
+        # Test run by a coroutine, the loop is not ours to stop
+        if test in self._pending:
+            self._set_test_result(self._pending.pop(test), test)
+            return
+
         # Remove the test
         try:
             self._tests.remove(test)
@@ -56,3 +128,11 @@ class Iperf3Client(object):
         # If we removed the last - stop the client
         if not self._tests:
             self._loop.stop()
+
+async def run_test(test_parameters, use_processes=False):
+    """
+    Run a single test on the running loop and get its TestResult.
+    Raises IPerf3Exception if the test fails.
+    """
+    client = Iperf3Client(loop=asyncio.get_running_loop(), use_processes=use_processes)
+    return await client.run_test(test_parameters)
@@ -1,19 +1,37 @@
 """
 A class representing a single iPerf3 test on both client and the server.
 """
+import email.utils
 import logging
+import platform
 import socket
 import struct
 import json
 import time
 
 from py3iperf3.control_protocol import ControlProtocol
-from py3iperf3.utils import make_cookie, data_size_formatter
+from py3iperf3.cpu_usage import CpuUsage
+from py3iperf3.utils import make_cookie, data_size_formatter, format_cpu_utilization
+from py3iperf3.utils import format_loop_stats
 from py3iperf3.iperf3_api import Iperf3State, Iperf3TestProto
-from py3iperf3.iperf3_api import DEFAULT_BLOCK_TCP, DEFAULT_BLOCK_UDP
+from py3iperf3.iperf3_api import DEFAULT_BLOCK_TCP, DEFAULT_BLOCK_UDP, DEFAULT_UDP_RATE
+from py3iperf3.iperf3_api import CLIENT_VERSION
 from py3iperf3.data_stream_tcp import TestStreamTcp
 from py3iperf3.data_stream_udp import TestStreamUdp
+from py3iperf3.data_stream_worker import WorkerStreamTcp, WorkerStreamUdp
+from py3iperf3.data_stream_worker import WORKER_TICK, WORKER_JOIN_TIMEOUT
+from py3iperf3.diagnosis import diagnose_stream
 from py3iperf3.error import IPerf3Exception
+from py3iperf3.file_ranges import split_file
+from py3iperf3.file_source import FileSource
+from py3iperf3.json_output import JsonReport, make_interval, final_stream_entry, sum_entry
+from py3iperf3.loop_monitor import LoopMonitor
+from py3iperf3.payload_pool import PATTERN_REPEAT, PATTERN_COMPRESSIBLE
+from py3iperf3.results import IntervalResult, StreamResult, TestResult, transfer_from_stats
+from py3iperf3.send_scheduler import SendScheduler
+from py3iperf3.stats_store import StatsStore
+from py3iperf3.stream_hash import HASH_ALGORITHM, DATA_WAIT_TIMEOUT, DATA_WAIT_POLL
+from py3iperf3.stream_hash import compare_digests
 from py3iperf3.settings import Iperf3TestSettings
 
 class Iperf3Test(object):
@@ -29,28 +47,44 @@ class Iperf3Test(object):
 
         self._streams = []
         self._interval_stats = []
+        self._file_source = None
+        self._file_parts = None
+        self._next_file_part = 0
         self._next_stream_id = 1
 
         # Event handles
         self._hdl_stop_test = None
         self._hdl_omitting = None
         self._hdl_stats = None
+        self._hdl_streams_stopped = None
 
         self._role = 'c'                # Default role is 'c'-lient, other 's'-server
         self._cookie = None
         self._control_protocol = None
+        self._connect_task = None
         self._state = None
         self._remote_results = None
+        self._error = None
 
         self._test_stopper = 't'        # 't' - time; 'b' - blocks; 's' - data size
         self._blocks_remaining = None
         self._bytes_remaining = None
         self._depleted_called = False
+        self._streams_stopping = False
+        self._streams_stop_deadline = None
 
-        self._last_stat_collect_time = None
         self._stream_start_time = None
         self._stream_stop_time = None
 
+        # Monotonic clock of the stats intervals
+        self._stats_start_ns = None
+        self._stats_last_ns = None
+        self._stats_stop_ns = None
+        self._stats_loop_start = None
+        self._stats_tick = 0
+        self._omitting = False
+        self._cpu_usage = CpuUsage()
+
         # Length prefixed strings reception
         self._string_drain = False
         self._string_length = None
@@ -59,6 +93,24 @@ class Iperf3Test(object):
         # Overwrite defaults with given params
         self._set_test_parameters(test_parameters)
 
+        # Interval stats of all streams
+        self._stats_store = StatsStore(self._parameters.stats_retention)
+
+        # Event loop lag instrumentation
+        self._loop_monitor = None
+        if self._parameters.loop_monitor:
+            self._loop_monitor = LoopMonitor(self._loop)
+
+        # Single sending callback for all streams
+        self._send_scheduler = None
+        if self._parameters.send_scheduler:
+            self._send_scheduler = SendScheduler(self._loop)
+
+        # Machine readable output instead of the log lines
+        self._json_report = None
+        if self._parameters.json or self._parameters.json_stream:
+            self._json_report = JsonReport(stream_mode=self._parameters.json_stream)
+
     @property
     def next_stream_id(self):
         """Get next stream id"""
@@ -90,6 +142,46 @@ class Iperf3Test(object):
         """Get results received from remote peer"""
         return self._remote_results
 
+    @property
+    def error(self):
+        """Get the exception that ended the test or None"""
+        return self._error
+
+    @property
+    def omitting(self):
+        """Are intervals of the warm-up period being collected"""
+        return self._omitting
+
+    @property
+    def stats_store(self):
+        """Get the interval stats store"""
+        return self._stats_store
+
+    @property
+    def loop_monitor(self):
+        """Get the event loop monitor or None if not monitored"""
+        return self._loop_monitor
+
+    @property
+    def payload(self):
+        """Get the payload pattern of the sent blocks"""
+        return self._parameters.payload
+
+    @property
+    def payload_param(self):
+        """Get the byte string to repeat or the compression ratio of the payload"""
+        if self._parameters.payload == PATTERN_REPEAT and self._parameters.payload_pattern:
+            return self._parameters.payload_pattern.encode('utf-8')
+        elif self._parameters.payload == PATTERN_COMPRESSIBLE:
+            return self._parameters.payload_ratio
+
+        return None
+
+    @property
+    def send_scheduler(self):
+        """Get the send scheduler or None if streams schedule themselves"""
+        return self._send_scheduler
+
     @property
     def cookie(self):
         if self._cookie is None:
@@ -113,6 +205,26 @@ class Iperf3Test(object):
     def block_size(self):
         return self._parameters.block_size
 
+    @property
+    def bandwidth(self):
+        """Get target bandwidth in bits/sec. 0 - unlimited"""
+        return self._parameters.bandwidth
+
+    @property
+    def burst(self):
+        """Get number of packets sent in a burst"""
+        return self._parameters.burst
+
+    @property
+    def worker_parameters(self):
+        """Get test parameters for a stream worker process"""
+        return dict(vars(self._parameters))
+
+    @property
+    def all_streams_done(self):
+        """Check if all streams are done"""
+        return all(x.done for x in self._streams)
+
     @property
     def test_type(self):
         # What stops the test (time/tx blocks/tx data)
@@ -123,6 +235,41 @@ class Iperf3Test(object):
         """Get the read/write file"""
         return self._parameters.file
 
+    @property
+    def file_source(self):
+        """Get the memory-mapped file shared by sending streams"""
+        if self._file_source is None:
+            self._file_source = FileSource(
+                self._parameters.file, wrap=self._parameters.file_wrap)
+
+        return self._file_source
+
+    @property
+    def file_ranges(self):
+        """Check if parallel streams send their own parts of the file"""
+        return self._parameters.file_ranges
+
+    def next_file_range(self):
+        """Get (offset, length) of the file part of the next sending stream"""
+        if self._file_parts is None:
+            self._file_parts = split_file(
+                self.file_source.size, self._parameters.parallel, self.block_size)
+
+        file_range = self._file_parts[self._next_file_part % len(self._file_parts)]
+        self._next_file_part += 1
+
+        return file_range
+
+    @property
+    def integrity_hash(self):
+        """Check if streams hash their data to verify the transfer"""
+        return self._parameters.integrity_hash
+
+    @property
+    def zerocopy(self):
+        """Get zero-copy (sendfile) file sending property"""
+        return self._parameters.zerocopy
+
     @property
     def no_delay(self):
         """Get NoDelay property"""
@@ -133,6 +280,41 @@ class Iperf3Test(object):
         """Get Window property"""
         return self._parameters.window
 
+    @property
+    def udp_gso(self):
+        """Get UDP generic segmentation offload property"""
+        return self._parameters.udp_gso
+
+    @property
+    def udp_batch_rx(self):
+        """Get batched UDP receive property"""
+        return self._parameters.udp_batch_rx
+
+    @property
+    def udp_gro(self):
+        """Get UDP generic receive offload property"""
+        return self._parameters.udp_gro
+
+    @property
+    def send_budget(self):
+        """Get max number of bytes a stream sends per loop iteration"""
+        return self._parameters.send_budget
+
+    @property
+    def write_buffer_high(self):
+        """Get transport write buffer high-water mark"""
+        return self._parameters.write_buffer_high
+
+    @property
+    def write_buffer_low(self):
+        """Get transport write buffer low-water mark"""
+        return self._parameters.write_buffer_low
+
+    @property
+    def buffered_rx(self):
+        """Get receive into preallocated buffer property"""
+        return self._parameters.buffered_rx
+
     @property
     def ip_version(self):
         """Get IP version"""
@@ -149,9 +331,17 @@ class Iperf3Test(object):
         if self._disposed:
             return
 
-        self._client_cleanup()
         self._disposed = True
 
+        # Not connected to the server yet
+        if self._control_protocol is None:
+            if self._connect_task is not None:
+                self._connect_task.cancel()
+            self._master.test_done(self)
+            return
+
+        self._client_cleanup()
+
     def set_control_connection(self, control_protocol, cookie):
         """Link a test with a control protocol in the server"""
 
@@ -177,11 +367,9 @@ class Iperf3Test(object):
         self._streams.append(stream)
         if len(self._streams) == self._parameters.parallel:
             self._set_and_send_state(Iperf3State.TEST_START)
-
-            self._stream_start_time = time.time()
-            self._hdl_stats = self._loop.call_later(
-                self._parameters.report_interval,
-                self._collect_print_stats)
+            self._cpu_usage.start()
+            self._start_stats_timer()
+            self._start_omitting()
 
             self._set_and_send_state(Iperf3State.TEST_RUNNING)
 
@@ -197,6 +385,16 @@ class Iperf3Test(object):
                 self._parameters.parallel = value
             if key == 'reverse':
                 self._parameters.reverse = True
+            if key == 'bandwidth':
+                self._parameters.bandwidth = value
+            if key == 'burst':
+                self._parameters.burst = value
+            if key == 'omit':
+                self._parameters.omit = value
+            if key == 'file_ranges':
+                self._parameters.file_ranges = True
+            if key == 'integrity_hash':
+                self._parameters.integrity_hash = True
 
         # Request streams
         self._set_and_send_state(Iperf3State.CREATE_STREAMS)
@@ -234,10 +432,7 @@ class Iperf3Test(object):
 
             if self._state == Iperf3State.TEST_END:
                 # Client done sending
-                self._stream_stop_time = time.time()
-                if self._hdl_stats is not None:
-                    self._hdl_stats.cancel()
-                    self._hdl_stats = None
+                self._stop_stats_timer()
                 self._set_and_send_state(Iperf3State.EXCHANGE_RESULTS)
                 self._string_drain = True
 
@@ -279,20 +474,23 @@ class Iperf3Test(object):
                     for stream in self._streams:
                         stream.start_stream()
 
-                self._stream_start_time = time.time()
+                self._cpu_usage.start()
+                self._start_stats_timer()
+                self._start_omitting()
 
+                if self._json_report is not None:
+                    self._json_report.start(self._json_start())
+
+                # Test runs for the given duration after the omitted period
                 if self._test_stopper == 't':
                     self._hdl_stop_test = self._loop.call_later(
-                        self._parameters.test_duration,
+                        self._parameters.omit + self._parameters.test_duration,
                         self._stop_all_streams)
 
-                self._hdl_stats = self._loop.call_later(
-                    self._parameters.report_interval,
-                    self._collect_print_stats)
-
             elif self._state == Iperf3State.TEST_RUNNING:
-                header = self._streams[0].get_stats_header()
-                self._logger.info(header)
+                if self._json_report is None:
+                    header = self._streams[0].get_stats_header()
+                    self._logger.info(header)
             elif self._state == Iperf3State.EXCHANGE_RESULTS:
                 self._send_results()
                 self._string_drain = True # Expect string reply from the server
@@ -318,6 +516,11 @@ class Iperf3Test(object):
         TODO: Final/Sum results should be generated by each stream
         """
         self._logger.debug('Received results: %s', self.remote_results)
+
+        if self._json_report is not None:
+            self._json_report.end(self._json_end())
+            return
+
         self._logger.info('- - - - - - - - - - - - - - - - - - - - - - - - -')
         self._logger.info('Test Complete. Summary Results:')
         header = self._streams[0].get_stats_header()
@@ -337,7 +540,7 @@ class Iperf3Test(object):
                     remote_stats = stat_ob
 
             # TODO: Use each streams time length
-            test_len = self._stream_stop_time - self._stream_start_time
+            test_len = self._test_length
 
             # Format our numbers
             our_data_str = data_size_formatter(
@@ -351,19 +554,35 @@ class Iperf3Test(object):
             remote_speed_str = data_size_formatter(
                 int(remote_stats['bytes'] * 8 / test_len), None, None, 'm')
 
+            # Sender knows retransmits
+            if our_stats.get('retransmits', -1) >= 0:
+                our_speed_str = '{}/sec  {} Retr'.format(our_speed_str, our_stats['retransmits'])
+            else:
+                our_speed_str = '{}/sec'.format(our_speed_str)
+
             # Print entry
-            self._logger.info('[{}] 0.00-{:.2f} sec {} {}/sec   local'.format(
+            self._logger.info('[{}] 0.00-{:.2f} sec {} {}   local'.format(
                 stream.socket_id, test_len, our_data_str, our_speed_str))
             self._logger.info('[{}] 0.00-{:.2f} sec {} {}/sec   remote'.format(
                 stream.socket_id, test_len, remote_data_str, remote_speed_str))
 
+            # Datagrams counted by the UDP receiver
+            if our_stats.get('out_of_order') or our_stats.get('duplicates'):
+                self._logger.info('[{}] {} out-of-order, {} duplicate datagrams'.format(
+                    stream.socket_id, our_stats['out_of_order'], our_stats['duplicates']))
+
+            # Stream ran in a worker process
+            if 'cpu_util_total' in our_stats:
+                self._logger.info('[{}] Worker CPU Utilization: {}'.format(
+                    stream.socket_id, format_cpu_utilization(our_stats)))
+
             # Add for later usage (if num stream > 1)
             local_stats_list.append(our_stats)
             remote_stats_list.append(remote_stats)
 
         # Calculate sum stats if required
         if len(self._streams) > 1:
-            test_len = self._stream_stop_time - self._stream_start_time
+            test_len = self._test_length
             sum_local = sum([x['bytes'] for x in local_stats_list])
             sum_remote = sum([x['bytes'] for x in remote_stats_list])
 
@@ -385,6 +604,209 @@ class Iperf3Test(object):
             self._logger.info('[SUM] 0.00-{:.2f} sec {} {}/sec   remote'.format(
                 test_len, remote_data_str, remote_speed_str))
 
+        if self.sender:
+            roles = ('sender', 'receiver')
+        else:
+            roles = ('receiver', 'sender')
+
+        self._logger.info('CPU Utilization: local/{} {}, remote/{} {}'.format(
+            roles[0], format_cpu_utilization(self._cpu_usage.total()),
+            roles[1], format_cpu_utilization(self.remote_results)))
+
+        if self._loop_monitor is not None:
+            self._logger.info('Event loop: {}'.format(
+                format_loop_stats(self._loop_monitor.total())))
+
+        for entry in self._diagnose():
+            self._logger.info('[{}] Bottleneck: {} ({})'.format(
+                entry['socket'], entry['bottleneck'], ', '.join(entry['reasons'])))
+
+        for entry in self._check_integrity():
+            self._logger.info('[{}] Integrity: {} {} ({} B local, {} B remote)'.format(
+                entry['socket'], entry['status'], entry['algorithm'],
+                entry['local_bytes'], entry['remote_bytes']))
+
+    def _json_start(self):
+        """Make the start part of the JSON output"""
+
+        connected = []
+        for stream in self._streams:
+            connected.append({
+                'socket': stream.socket_id,
+                'remote_host': self._parameters.server_address,
+                'remote_port': self._parameters.server_port,
+            })
+
+        return {
+            'connected': connected,
+            'version': CLIENT_VERSION,
+            'system_info': platform.platform(),
+            'timestamp': {
+                'time': email.utils.formatdate(self._stream_start_time, usegmt=True),
+                'timesecs': int(self._stream_start_time),
+            },
+            'connecting_to': {
+                'host': self._parameters.server_address,
+                'port': self._parameters.server_port,
+            },
+            'cookie': self.cookie,
+            'test_start': {
+                'protocol': self._parameters.test_protocol.name,
+                'num_streams': self._parameters.parallel,
+                'blksize': self._parameters.block_size,
+                'omit': self._parameters.omit,
+                'duration': self._parameters.test_duration,
+                'bytes': self._parameters.bytes or 0,
+                'blocks': self._parameters.blockcount or 0,
+                'reverse': int(bool(self._parameters.reverse)),
+                'title': self._parameters.title,
+            },
+        }
+
+    def _json_end(self):
+        """Make the end part of the JSON output from our and remote results"""
+
+        test_len = self._test_length
+        udp = self._parameters.test_protocol == Iperf3TestProto.UDP
+        cpu_util = self._cpu_usage.total()
+        streams = []
+
+        for stream in self._streams:
+            our_stats = stream.get_final_stats()
+            remote_stats = {'bytes': 0}
+            for stat_ob in self.remote_results['streams']:
+                if stat_ob['id'] == our_stats['id']:
+                    remote_stats = stat_ob
+
+            our_entry = final_stream_entry(
+                our_stats, stream.socket_id, test_len, self.sender, udp)
+            remote_entry = final_stream_entry(
+                remote_stats, stream.socket_id, test_len, not self.sender, udp)
+
+            if self.sender:
+                streams.append({'sender': our_entry, 'receiver': remote_entry})
+            else:
+                streams.append({'sender': remote_entry, 'receiver': our_entry})
+
+        end_obj = {
+            'streams': streams,
+            'sum_sent': sum_entry([x['sender'] for x in streams], True),
+            'sum_received': sum_entry([x['receiver'] for x in streams], False),
+            'cpu_utilization_percent': {
+                'host_total': cpu_util['cpu_util_total'],
+                'host_user': cpu_util['cpu_util_user'],
+                'host_system': cpu_util['cpu_util_system'],
+                'remote_total': self.remote_results.get('cpu_util_total', 0),
+                'remote_user': self.remote_results.get('cpu_util_user', 0),
+                'remote_system': self.remote_results.get('cpu_util_system', 0),
+            },
+        }
+
+        if self._loop_monitor is not None:
+            end_obj['loop_lag'] = self._loop_monitor.total()
+
+        end_obj['diagnosis'] = self._diagnose()
+
+        if self._parameters.integrity_hash:
+            end_obj['integrity'] = self._check_integrity()
+
+        return end_obj
+
+    def get_result(self):
+        """
+        Get results of the finished test as a TestResult.
+        None if the results were not exchanged with the remote.
+        """
+        if self.remote_results is None:
+            return None
+
+        test_len = self._test_length
+        udp = self._parameters.test_protocol == Iperf3TestProto.UDP
+        streams = []
+
+        for stream in self._streams:
+            our_stats = stream.get_final_stats()
+            remote_stats = {'bytes': 0}
+            for stat_ob in self.remote_results['streams']:
+                if stat_ob['id'] == our_stats['id']:
+                    remote_stats = stat_ob
+
+            intervals = [IntervalResult(x.as_dict())
+                         for x in self._stats_store.records(our_stats['id'])]
+
+            streams.append(StreamResult(
+                stream.socket_id,
+                transfer_from_stats(our_stats, test_len, self.sender, udp),
+                transfer_from_stats(remote_stats, test_len, not self.sender, udp),
+                intervals))
+
+        remote_cpu = {key: self.remote_results.get(key, 0) for key in
+                      ('cpu_util_total', 'cpu_util_user', 'cpu_util_system')}
+
+        return TestResult(
+            self.sender, test_len, streams,
+            self._cpu_usage.total(), remote_cpu,
+            self._diagnose(), self._check_integrity())
+
+    def _check_integrity(self):
+        """
+        Compare the digests of the data of each stream with the
+        digests of the remote. Empty unless the streams hash data.
+        """
+        if not self._parameters.integrity_hash:
+            return []
+
+        integrity = []
+        for stream in self._streams:
+            our_stats = stream.get_final_stats()
+            remote_stats = {}
+            for stat_ob in self.remote_results['streams']:
+                if stat_ob['id'] == our_stats['id']:
+                    remote_stats = stat_ob
+
+            integrity.append({
+                'socket': stream.socket_id,
+                'status': compare_digests(our_stats, remote_stats),
+                'algorithm': HASH_ALGORITHM,
+                'local_digest': our_stats.get('digest'),
+                'remote_digest': remote_stats.get('digest'),
+                'local_bytes': our_stats.get('digest_bytes', 0),
+                'remote_bytes': remote_stats.get('digest_bytes', 0),
+            })
+
+        return integrity
+
+    def _diagnose(self):
+        """
+        Classify what limited each stream. Transport and TCP_INFO
+        details are known only if we are the sender.
+        """
+        local_cpu = self._cpu_usage.total()['cpu_util_total']
+        remote_cpu = self.remote_results.get('cpu_util_total')
+
+        loop_lag = None
+        if self._loop_monitor is not None:
+            loop_lag = self._loop_monitor.total()
+
+        diagnosis = []
+        for stream in self._streams:
+            # Stream in a worker process has its own CPU
+            our_cpu = stream.get_final_stats().get('cpu_util_total', local_cpu)
+
+            if self.sender:
+                bottleneck, reasons = diagnose_stream(
+                    stream.get_diagnostics(), our_cpu, remote_cpu, loop_lag)
+            else:
+                bottleneck, reasons = diagnose_stream({}, remote_cpu, our_cpu)
+
+            diagnosis.append({
+                'socket': stream.socket_id,
+                'bottleneck': bottleneck,
+                'reasons': reasons,
+            })
+
+        return diagnosis
+
     def sendable_data_depleted(self):
         """Called when blockcount is set and no more blocks remain"""
         # This could be implemented via the get/set property
@@ -395,44 +817,211 @@ class Iperf3Test(object):
         self._depleted_called = True
         self._stop_all_streams()
 
-    def _collect_print_stats(self):
-        """Collect and print periodic statistics"""
+    def _start_stats_timer(self):
+        """
+        Start periodic stats. Ticks are scheduled at absolute deadlines
+        from now, so time spent collecting and printing does not add up.
+        """
+        self._stream_start_time = time.time()
+        self._stats_start_ns = time.monotonic_ns()
+        self._stats_last_ns = self._stats_start_ns
+        self._stats_loop_start = self._loop.time()
+        self._stats_tick = 0
 
-        all_stream_stats = []
-        t_now = time.time()
+        if self._loop_monitor is not None:
+            self._loop_monitor.start()
 
-        if self._last_stat_collect_time is None:
-            scratch_start = 0
-        else:
-            scratch_start = self._last_stat_collect_time - self._stream_start_time
+        self._schedule_stats_tick()
 
-        scratch_end = t_now - self._stream_start_time
-        scratch_seconds = t_now - self._stream_start_time - scratch_start
+    def _schedule_stats_tick(self):
+        """Schedule the next stats tick"""
 
-        self._last_stat_collect_time = t_now
+        self._stats_tick += 1
+        self._hdl_stats = self._loop.call_at(
+            self._stats_loop_start + self._stats_tick * self._parameters.report_interval,
+            self._collect_print_stats)
 
-        # Collect and print individual stats
-        # Check if we need sum stats
-        if len(self._streams) > 1:
-            all_stats = []
+    def _mark_stats_stop(self):
+        """
+        Take the stop time of the test and cancel periodic stats,
+        so waiting for the streams to stop is not counted in the test.
+        """
+
+        # One shot action
+        if self._stream_stop_time is not None:
+            return
+
+        self._stream_stop_time = time.time()
+        self._stats_stop_ns = time.monotonic_ns()
+
+        if self._hdl_stats is not None:
+            self._hdl_stats.cancel()
+            self._hdl_stats = None
+
+        if self._hdl_omitting is not None:
+            self._hdl_omitting.cancel()
+            self._hdl_omitting = None
+
+    def _stop_stats_timer(self):
+        """Stop periodic stats and collect the last partial interval"""
+
+        self._mark_stats_stop()
+
+        # Stats were never started
+        if self._stats_start_ns is None:
+            return
+
+        self._collect_print_stats(final=True, t_now_ns=self._stats_stop_ns)
+        self._stats_stop_ns = self._stats_last_ns
+        self._cpu_usage.stop(*self._worker_cpu_times())
+
+        if self._loop_monitor is not None:
+            self._loop_monitor.stop()
+
+    def _worker_cpu_times(self):
+        """Get user and system CPU seconds used by stream workers"""
+
+        user = system = 0
+        for stream in self._streams:
+            get_cpu_times = getattr(stream, 'get_cpu_times', None)
+            if get_cpu_times is not None:
+                stream_user, stream_system = get_cpu_times()
+                user += stream_user
+                system += stream_system
+
+        return user, system
+
+    def _start_omitting(self):
+        """Mark intervals of the first omit seconds as omitted"""
+
+        if not self._parameters.omit:
+            return
+
+        self._omitting = True
+        self._hdl_omitting = self._loop.call_later(
+            self._parameters.omit, self._omitting_done)
+
+    def _omitting_done(self):
+        """
+        Collect the rest of the omitted period and restart the stats
+        timer, so that intervals and totals start from zero. CPU and
+        loop totals restart too.
+        """
+        self._hdl_omitting = None
+
+        if self._hdl_stats is not None:
+            self._hdl_stats.cancel()
+            self._hdl_stats = None
+
+        self._collect_print_stats(final=True)
+        self._omitting = False
+
+        self._cpu_usage.restart(*self._worker_cpu_times())
+        if self._loop_monitor is not None:
+            self._loop_monitor.reset_total()
+
+        self._start_stats_timer()
+
+    @property
+    def _test_length(self):
+        """Get seconds the test ran on the monotonic clock"""
+        return (self._stats_stop_ns - self._stats_start_ns) / 1000000000
+
+    def _collect_print_stats(self, final=False, t_now_ns=None):
+        """
+        Collect and print stats over the window since the last collection,
+        ending now or at the given monotonic time. The final partial
+        interval is collected but printed or added to the JSON output
+        only if it is at least 10% of the report interval.
+        """
+        if t_now_ns is None:
+            t_now_ns = time.monotonic_ns()
+
+        # Nothing to collect
+        if t_now_ns == self._stats_last_ns:
+            return
+
+        scratch_start = (self._stats_last_ns - self._stats_start_ns) / 1000000000
+        scratch_end = (t_now_ns - self._stats_start_ns) / 1000000000
+        scratch_seconds = (t_now_ns - self._stats_last_ns) / 1000000000
+
+        self._stats_last_ns = t_now_ns
+
+        # Ticks due while the loop was too busy are folded into this window
+        missed_ticks = 0
+        if not final:
+            ticks_due = int((self._loop.time() - self._stats_loop_start) /
+                            self._parameters.report_interval)
+            missed_ticks = max(0, ticks_due - self._stats_tick)
+            self._stats_tick += missed_ticks
+
+            if missed_ticks:
+                self._logger.warning('Missed %s stats interval(s), event loop is overloaded',
+                                     missed_ticks)
+
+        # Collect individual stats
+        all_stats = []
+        for stream in self._streams:
+            all_stats.append(stream.get_interval_stats(scratch_start, scratch_end, scratch_seconds))
+
+        cpu_util = None
+        if self._parameters.cpu_interval:
+            cpu_util = self._cpu_usage.interval(*self._worker_cpu_times())
+
+        loop_stats = None
+        if self._loop_monitor is not None:
+            loop_stats = self._loop_monitor.interval()
+
+        if final and scratch_seconds < 0.1 * self._parameters.report_interval:
+            # Too short to report
+            pass
+        elif self._json_report is not None:
+            interval_obj = make_interval(all_stats, self.sender)
+            if missed_ticks:
+                interval_obj['missed_ticks'] = missed_ticks
+            if cpu_util is not None:
+                interval_obj['cpu_utilization_percent'] = {
+                    'host_total': cpu_util['cpu_util_total'],
+                    'host_user': cpu_util['cpu_util_user'],
+                    'host_system': cpu_util['cpu_util_system'],
+                }
+            if loop_stats is not None:
+                interval_obj['loop_lag'] = loop_stats
+            self._json_report.interval(interval_obj)
+        else:
+            # Print individual stats and sum if required
             for stream in self._streams:
-                all_stats.append(stream.get_interval_stats(scratch_start, scratch_end, scratch_seconds))
                 stream.print_last_stats_entry()
-            self._streams[0].print_sum_stats(all_stats)
-        else:
-            self._streams[0].get_interval_stats(scratch_start, scratch_end, scratch_seconds)
-            self._streams[0].print_last_stats_entry()
+            if len(self._streams) > 1:
+                self._streams[0].print_sum_stats(all_stats)
+            if cpu_util is not None:
+                self._logger.info('[CPU] {}'.format(format_cpu_utilization(cpu_util)))
+            if loop_stats is not None:
+                self._logger.info('[LOOP] {}'.format(format_loop_stats(loop_stats)))
 
-        self._hdl_stats = self._loop.call_later(
-            self._parameters.report_interval,
-            self._collect_print_stats)
+        if not final:
+            self._schedule_stats_tick()
 
     def _client_cleanup(self):
 
-        # close all streams
+        if self._hdl_streams_stopped is not None:
+            self._hdl_streams_stopped.cancel()
+            self._hdl_streams_stopped = None
+
+        # close all streams, workers stop at the same time
+        for stream in self._streams:
+            stream.request_stop()
         for stream in self._streams:
             stream.stop_stream()
 
+        if self._send_scheduler is not None:
+            self._send_scheduler.close()
+
+        # Unmap the shared file
+        if self._file_source is not None:
+            self._file_source.close()
+            self._file_source = None
+
         # Graceful bye-bye to the server
         self._set_and_send_state(Iperf3State.IPERF_DONE)
 
@@ -481,12 +1070,10 @@ class Iperf3Test(object):
             if self._state == Iperf3State.PARAM_EXCHANGE:
                 self._parse_received_params(received_string)
             elif self._state == Iperf3State.EXCHANGE_RESULTS:
-                # Send our results
-                self._send_results()
                 # Collect client's results
                 self._save_received_results(received_string)
-                # Transition to show results state
-                self._set_and_send_state(Iperf3State.DISPLAY_RESULTS)
+                # Send our results and show them
+                self._send_server_results()
                 # TODO: cleanup
 
         # If anything extra is left - process as normal
@@ -499,16 +1086,47 @@ class Iperf3Test(object):
         result_obj = json.loads(result_string)
         self._remote_results = result_obj
 
+    def _send_server_results(self, deadline=None):
+        """
+        Send our results and transition to show results state. Data
+        still in flight is waited for first, up to a timeout, so that
+        digests of the received data cover all the data sent.
+        """
+        if deadline is None:
+            deadline = self._loop.time() + DATA_WAIT_TIMEOUT
+
+        if not self._received_all_data() and self._loop.time() < deadline:
+            self._loop.call_later(DATA_WAIT_POLL, self._send_server_results, deadline)
+            return
+
+        self._send_results()
+        self._set_and_send_state(Iperf3State.DISPLAY_RESULTS)
+
+    def _received_all_data(self):
+        """Check if the receiving streams hashed all data the remote sent"""
+
+        if self.sender or not self._parameters.integrity_hash:
+            return True
+
+        sent_bytes = {x['id']: x.get('digest_bytes', 0) for x in self.remote_results['streams']}
+
+        return all(stream.get_hashed_bytes() >= sent_bytes.get(stream._stream_id, 0)
+                   for stream in self._streams)
+
     def _send_results(self):
         """Send test results to remote peer"""
 
         results_obj = {}
 
-        results_obj["cpu_util_total"] = 0
-        results_obj["cpu_util_user"] = 0
-        results_obj["cpu_util_system"] = 0
+        results_obj.update(self._cpu_usage.total())
 
-        results_obj["sender_has_retransmits"] = -1
+        # Retransmits are known if we send and TCP_INFO is available
+        if not self.sender:
+            results_obj["sender_has_retransmits"] = -1
+        elif any(getattr(x, 'has_retransmits', False) for x in self._streams):
+            results_obj["sender_has_retransmits"] = 1
+        else:
+            results_obj["sender_has_retransmits"] = 0
         results_obj["congestion_used"] = "Unknown"
         results_obj["streams"] = []
 
@@ -525,18 +1143,45 @@ class Iperf3Test(object):
 
     def _stop_all_streams(self):
 
+        # One shot action
+        if self._streams_stopping:
+            return
+
+        self._streams_stopping = True
         self._logger.debug('Stopping all streams!')
 
-        self._stream_stop_time = time.time()
+        # The test ends now, not once the workers are done stopping
+        self._mark_stats_stop()
+
+        # Workers stop at the same time, then wait for all of them
+        for stream in self._streams:
+            stream.request_stop()
+
+        self._streams_stop_deadline = time.monotonic() + WORKER_JOIN_TIMEOUT
+        self._wait_streams_stopped()
+
+    def _wait_streams_stopped(self):
+        """
+        Poll until all workers have published their last counters,
+        without blocking the loop, then end the test.
+        """
+        self._hdl_streams_stopped = None
+
+        if (not all(stream.stopped for stream in self._streams) and
+                time.monotonic() < self._streams_stop_deadline):
+            self._hdl_streams_stopped = self._loop.call_later(
+                WORKER_TICK, self._wait_streams_stopped)
+            return
 
         # Stop streams
         for stream in self._streams:
             stream.stop_stream()
 
-        # Stop proress reporting
-        if self._hdl_stats is not None:
-            self._hdl_stats.cancel()
-            self._hdl_stats = None
+        if self._send_scheduler is not None:
+            self._send_scheduler.close()
+
+        # Stop progress reporting, streams' last bytes go to the last interval
+        self._stop_stats_timer()
 
         self._set_and_send_state(Iperf3State.TEST_END)
 
@@ -565,6 +1210,30 @@ class Iperf3Test(object):
             else:
                 self._parameters.block_size = 1000
 
+        # Unlimited bandwidth unless UDP
+        if self._parameters.bandwidth is None:
+            if self._parameters.test_protocol == Iperf3TestProto.UDP:
+                self._parameters.bandwidth = DEFAULT_UDP_RATE
+            else:
+                self._parameters.bandwidth = 0
+
+        # Parallel TCP streams split the file between them if asked to. Each
+        # stream sends a range header that only a py3iperf3 server expects.
+        if self._parameters.file_ranges and not (
+                self._parameters.file and self._parameters.parallel > 1 and
+                self._parameters.test_protocol == Iperf3TestProto.TCP):
+            self._parameters.file_ranges = False
+
+        # Lost and reordered datagrams make a hash of UDP data meaningless.
+        # Worker processes do not publish digests.
+        if self._parameters.integrity_hash:
+            if self._parameters.test_protocol != Iperf3TestProto.TCP:
+                self._logger.warning('Integrity hash is supported only with TCP')
+                self._parameters.integrity_hash = False
+            elif self._parameters.use_processes:
+                self._logger.warning('Integrity hash is not supported with worker processes')
+                self._parameters.integrity_hash = False
+
         # Remaining time counter
         if self._parameters.test_duration:
             self._test_stopper = 't'
@@ -583,8 +1252,10 @@ class Iperf3Test(object):
         """Create test streams"""
 
         try:
-            for _ in range(self._parameters.parallel):
-                if self.data_protocol == Iperf3TestProto.TCP:
+            for index in range(self._parameters.parallel):
+                if self._parameters.use_processes:
+                    test_stream = self._create_worker_stream(index)
+                elif self.data_protocol == Iperf3TestProto.TCP:
                     test_stream = TestStreamTcp(loop=self._loop, test=self, stream_id=self._next_stream_id)
                 elif self.data_protocol == Iperf3TestProto.UDP:
                     test_stream = TestStreamUdp(loop=self._loop, test=self, stream_id=self._next_stream_id)
@@ -603,6 +1274,39 @@ class Iperf3Test(object):
             self._logger.exception('Failed creating stream!', exc_info=exc)
             raise IPerf3Exception('Failed to create test stream!')
 
+    def _create_worker_stream(self, index):
+        """
+        Create a stream running in its own process. Blocks/bytes
+        to send are split evenly between the workers.
+        """
+        worker_kwargs = {
+            'loop': self._loop,
+            'test': self,
+            'stream_id': self._next_stream_id,
+            'blocks_remaining': self._split_remaining(self._blocks_remaining, index),
+            'bytes_remaining': self._split_remaining(self._bytes_remaining, index),
+            'previous_stream': self._streams[-1] if self._streams else None,
+        }
+
+        if self.data_protocol == Iperf3TestProto.TCP:
+            return WorkerStreamTcp(**worker_kwargs)
+        elif self.data_protocol == Iperf3TestProto.UDP:
+            return WorkerStreamUdp(**worker_kwargs)
+
+        raise IPerf3Exception('The required data protocol is not implemented (yet)')
+
+    def _split_remaining(self, total, index):
+        """Get the share of the total for the stream with the given index"""
+
+        if total is None:
+            return None
+
+        share, extra = divmod(total, self._parameters.parallel)
+        if index < extra:
+            share += 1
+
+        return share
+
     def _exchange_parameters(self):
         """Send test parameters to the server"""
 
@@ -612,7 +1316,7 @@ class Iperf3Test(object):
             param_obj['tcp'] = True
         elif self.data_protocol == Iperf3TestProto.UDP:
             param_obj['udp'] = True
-        param_obj['omit'] = 0
+        param_obj['omit'] = self._parameters.omit
         param_obj['time'] = self._parameters.test_duration
         if self._parameters.bytes:
             param_obj['num'] = self._parameters.bytes
@@ -627,10 +1331,12 @@ class Iperf3Test(object):
         if self._parameters.window:
             param_obj['window'] = self._parameters.window
         param_obj['len'] = self._parameters.block_size
-        #param_obj['bandwidth'] = 1
+        if self._parameters.bandwidth:
+            param_obj['bandwidth'] = self._parameters.bandwidth
         #param_obj['fqrate'] = 1
         #param_obj['pacing_timer'] = 1
-        #param_obj['burst'] = 1
+        if self._parameters.burst:
+            param_obj['burst'] = self._parameters.burst
         #param_obj['TOS'] = 1
         #param_obj['flowlabel'] = 1
         if self._parameters.title:
@@ -641,8 +1347,12 @@ class Iperf3Test(object):
             param_obj['get_server_output'] = 1
         if self._parameters.udp64bitcounters:
             param_obj['udp_counters_64bit'] = 1
+        if self._parameters.file_ranges:
+            param_obj['file_ranges'] = 1
+        if self._parameters.integrity_hash:
+            param_obj['integrity_hash'] = 1
         #param_obj['authtoken'] = ''
-        param_obj['client_version'] = 'py3iPerf3_v0.9'
+        param_obj['client_version'] = CLIENT_VERSION
 
         json_str = json.dumps(param_obj)
         self._logger.debug('Settings JSON (%s): %s',
@@ -653,6 +1363,16 @@ class Iperf3Test(object):
         str_bytes = json_str.encode('ascii')
         self._control_protocol.send_data(str_bytes)
 
+    def _control_connect_done(self, task):
+        """End the test if the control connection failed"""
+
+        if task.cancelled() or task.exception() is None:
+            return
+
+        self._logger.error('Failed to connect to the server: %s', task.exception())
+        self._error = task.exception()
+        self.stop()
+
     def _connect_to_server(self):
         """Make a control connection to the server"""
 
@@ -703,7 +1423,8 @@ class Iperf3Test(object):
                 control_connect_coro = self._loop.create_connection(
                     lambda: ControlProtocol(test=self),
                     **connect_params)
-                self._loop.create_task(control_connect_coro)
+                self._connect_task = self._loop.create_task(control_connect_coro)
+                self._connect_task.add_done_callback(self._control_connect_done)
                 break
             except Exception as exc:
                 self._logger.exception('Exception connecting to the server!', exc_info=exc)
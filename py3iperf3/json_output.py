@@ -0,0 +1,161 @@
+"""
+iPerf3 compatible JSON output of the test results.
+"""
+import json
+import sys
+
+# TCP_INFO values of the sender in the end part
+FINAL_TCP_KEYS = ('retransmits', 'max_snd_cwnd', 'max_rtt', 'min_rtt', 'mean_rtt')
+
+# Datagram counts of the UDP receiver in the end part
+FINAL_UDP_KEYS = ('out_of_order', 'duplicates')
+
+def udp_loss_fields(stats):
+    """Get iPerf3 loss and jitter fields from UDP receiver stats"""
+
+    lost_packets = stats.get('errors', 0)
+    packets = stats.get('packets', 0)
+    total_packets = packets + lost_packets
+
+    return {
+        'jitter_ms': stats.get('jitter', 0) * 1000,
+        'lost_packets': lost_packets,
+        'packets': packets,
+        'lost_percent': 100 * lost_packets / total_packets if total_packets else 0,
+    }
+
+def interval_stream_entry(stats, sender):
+    """Make an interval entry of a stream from its interval stats"""
+
+    entry = dict(stats)
+    entry['sender'] = sender
+
+    if 'jitter' in entry:
+        del entry['jitter']
+        del entry['errors']
+        entry.update(udp_loss_fields(stats))
+
+    return entry
+
+def sum_entry(entries, sender):
+    """Make a sum entry over stream entries of the same interval"""
+
+    first = entries[0]
+    num_bytes = sum(x['bytes'] for x in entries)
+
+    entry = {
+        'start': first['start'],
+        'end': first['end'],
+        'seconds': first['seconds'],
+        'bytes': num_bytes,
+        'bits_per_second': num_bytes * 8 / first['seconds'] if first['seconds'] else 0,
+        'omitted': first.get('omitted', False),
+        'sender': sender,
+    }
+
+    if 'retransmits' in first:
+        entry['retransmits'] = sum(x.get('retransmits', 0) for x in entries)
+
+    if 'jitter_ms' in first:
+        entry.update(udp_loss_fields({
+            'jitter': sum(x['jitter_ms'] for x in entries) / len(entries) / 1000,
+            'errors': sum(x['lost_packets'] for x in entries),
+            'packets': sum(x['packets'] for x in entries),
+        }))
+    elif 'packets' in first:
+        entry['packets'] = sum(x['packets'] for x in entries)
+
+    return entry
+
+def final_stream_entry(stats, socket_id, seconds, sender, udp):
+    """Make an end entry of a stream from its final stats"""
+
+    num_bytes = stats['bytes']
+    entry = {
+        'socket': socket_id,
+        'start': 0,
+        'end': seconds,
+        'seconds': seconds,
+        'bytes': num_bytes,
+        'bits_per_second': num_bytes * 8 / seconds if seconds else 0,
+        'sender': sender,
+    }
+
+    if udp:
+        if sender:
+            entry['packets'] = stats.get('packets', 0)
+        else:
+            entry.update(udp_loss_fields(stats))
+            for key in FINAL_UDP_KEYS:
+                if key in stats:
+                    entry[key] = stats[key]
+    else:
+        for key in FINAL_TCP_KEYS:
+            if stats.get(key) is not None and stats[key] >= 0:
+                entry[key] = stats[key]
+
+    return entry
+
+def make_interval(all_stats, sender):
+    """Make an iPerf3 interval object from interval stats of all streams"""
+
+    streams = [interval_stream_entry(stats, sender) for stats in all_stats]
+
+    return {
+        'streams': streams,
+        'sum': sum_entry(streams, sender),
+    }
+
+class JsonReport(object):
+    """
+    Writes the test results as a single iPerf3 JSON document with
+    start, intervals and end parts once the test ends. In stream mode
+    every part is written as a separate JSON line as soon as it is
+    known, so long tests can be followed as they run.
+    """
+
+    def __init__(self, stream_mode=False, output=None):
+        self._stream_mode = stream_mode
+        self._output = output if output is not None else sys.stdout
+
+        self._start = {}
+        self._intervals = []
+
+    def start(self, start_obj):
+        """Set the start part"""
+
+        if self._stream_mode:
+            self._write_event('start', start_obj)
+        else:
+            self._start = start_obj
+
+    def interval(self, interval_obj):
+        """Add an interval"""
+
+        if self._stream_mode:
+            self._write_event('interval', interval_obj)
+        else:
+            self._intervals.append(interval_obj)
+
+    def end(self, end_obj):
+        """Set the end part and write out the document"""
+
+        if self._stream_mode:
+            self._write_event('end', end_obj)
+            return
+
+        document = {
+            'start': self._start,
+            'intervals': self._intervals,
+            'end': end_obj,
+        }
+        self._output.write(json.dumps(document, indent=4))
+        self._output.write('\n')
+        self._output.flush()
+
+    def _write_event(self, event, data):
+        """Write a single JSON line"""
+
+        self._output.write(json.dumps({'event': event, 'data': data}))
+        self._output.write('\n')
+        self._output.flush()
@@ -0,0 +1,177 @@
+"""
+Event loop lag and callback latency instrumentation of a test.
+"""
+from array import array
+import time
+
+# Period of the loop lag probe in seconds
+PROBE_PERIOD = 0.01
+
+# Histogram buckets are powers of two of microseconds: bucket N holds
+# values in [2^(N-1), 2^N) us, bucket 0 holds values below 1 us.
+NUM_BUCKETS = 25
+
+# Percentiles published for every histogram
+PERCENTILES = (50, 90, 99)
+
+class LatencyHistogram(object):
+    """Log2 histogram of durations with count, sum and max"""
+
+    __slots__ = ('buckets', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.buckets = array('Q', bytes(8 * NUM_BUCKETS))
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def add(self, seconds):
+        """Add a duration in seconds"""
+
+        micros = int(seconds * 1000000)
+        if micros < 0:
+            micros = 0
+
+        self.buckets[min(micros.bit_length(), NUM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        """Add all values of the other histogram"""
+
+        for index, count in enumerate(other.buckets):
+            self.buckets[index] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """Get upper bound in seconds of the bucket holding the percentile"""
+
+        if not self.count:
+            return 0
+
+        rank = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                # The max is a tighter bound for the last bucket
+                return min((1 << index) / 1000000, self.max)
+
+        return self.max
+
+    def as_dict(self):
+        """Get summary of the histogram, times in milliseconds"""
+
+        summary = {
+            'count': self.count,
+            'mean_ms': self.sum / self.count * 1000 if self.count else 0,
+            'max_ms': self.max * 1000,
+        }
+        for percent in PERCENTILES:
+            summary['p{}_ms'.format(percent)] = self.percentile(percent) * 1000
+
+        return summary
+
+class LoopMonitor(object):
+    """
+    Measures how well the shared event loop keeps up with the streams:
+
+    * timer_delay - lateness of call_later/call_at callbacks, probed
+      every PROBE_PERIOD
+    * callback_delay - time a call_soon callback waits in the ready queue
+    * send_time - time spent in a single sending callback of a stream
+    * pauses - number of times transports asked the streams to pause writing
+
+    Histograms are kept per interval and over the whole test.
+    """
+
+    def __init__(self, loop, probe_period=PROBE_PERIOD):
+        self._loop = loop
+        self._probe_period = probe_period
+        self._probe_handle = None
+        self._probe_deadline = None
+
+        self._interval = self._new_histograms()
+        self._total = self._new_histograms()
+        self._interval_pauses = 0
+        self._total_pauses = 0
+
+    @staticmethod
+    def _new_histograms():
+        return {
+            'timer_delay': LatencyHistogram(),
+            'callback_delay': LatencyHistogram(),
+            'send_time': LatencyHistogram(),
+        }
+
+    def start(self):
+        """Start probing the loop"""
+
+        if self._probe_handle is None:
+            self._schedule_probe()
+
+    def stop(self):
+        """Stop probing the loop"""
+
+        if self._probe_handle is not None:
+            self._probe_handle.cancel()
+            self._probe_handle = None
+
+    def _schedule_probe(self):
+        """Schedule the timer probe at an absolute deadline"""
+
+        self._probe_deadline = self._loop.time() + self._probe_period
+        self._probe_handle = self._loop.call_at(self._probe_deadline, self._timer_probe)
+
+    def _timer_probe(self):
+        """Timer fired. Follow up with a ready queue probe."""
+
+        self._interval['timer_delay'].add(self._loop.time() - self._probe_deadline)
+        self._probe_handle = self._loop.call_soon(self._callback_probe, time.perf_counter())
+
+    def _callback_probe(self, scheduled):
+        """Ready queue callback ran"""
+
+        self._interval['callback_delay'].add(time.perf_counter() - scheduled)
+        self._schedule_probe()
+
+    def send_time(self, seconds):
+        """Record time spent in a sending callback"""
+        self._interval['send_time'].add(seconds)
+
+    def writing_paused(self):
+        """Record transport pausing a stream"""
+        self._interval_pauses += 1
+
+    def _summary(self, histograms, pauses):
+        summary = {name: histogram.as_dict() for name, histogram in histograms.items()}
+        summary['pauses'] = pauses
+
+        return summary
+
+    def interval(self):
+        """Get the summary of the interval and start a new one"""
+
+        summary = self._summary(self._interval, self._interval_pauses)
+
+        for name, histogram in self._interval.items():
+            self._total[name].merge(histogram)
+        self._total_pauses += self._interval_pauses
+
+        self._interval = self._new_histograms()
+        self._interval_pauses = 0
+
+        return summary
+
+    def reset_total(self):
+        """Drop the intervals completed so far from the totals"""
+        self._total = self._new_histograms()
+        self._total_pauses = 0
+
+    def total(self):
+        """Get the summary over all completed intervals"""
+        return self._summary(self._total, self._total_pauses)
@@ -0,0 +1,58 @@
+"""
+Token bucket used to pace sending streams to the target bandwidth.
+"""
+import time
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter driven by a monotonic clock.
+    Tokens are bytes, filled at the target rate up to the bucket size.
+    """
+
+    def __init__(self, rate, bucket_size, clock=time.monotonic):
+        """
+        Make a full bucket. Rate is in bits/sec, bucket size in bytes.
+        """
+        self._rate = rate / 8
+        self._bucket_size = bucket_size
+        self._clock = clock
+
+        self._tokens = bucket_size
+        self._last_fill = clock()
+
+    @property
+    def rate(self):
+        """Get the target rate in bits/sec"""
+        return int(self._rate * 8)
+
+    def _fill(self):
+        """Add tokens for the time passed since the last fill"""
+
+        time_now = self._clock()
+        self._tokens = min(
+            self._bucket_size,
+            self._tokens + (time_now - self._last_fill) * self._rate)
+        self._last_fill = time_now
+
+    def consume(self, num_bytes):
+        """
+        Take tokens for sending num_bytes. Returns False if
+        there are not enough tokens yet.
+        """
+        self._fill()
+
+        if self._tokens < num_bytes:
+            return False
+
+        self._tokens -= num_bytes
+        return True
+
+    def delay(self, num_bytes):
+        """Get seconds until there are enough tokens for num_bytes"""
+
+        self._fill()
+
+        if self._tokens >= num_bytes:
+            return 0
+
+        return (num_bytes - self._tokens) / self._rate
@@ -0,0 +1,138 @@
+"""
+Process-wide pool of read-only payload blocks shared by all streams and tests.
+
+Content of the blocks is selected by a pattern:
+
+* zeros - all zero bytes
+* random - cryptographically random bytes
+* repeat - the given byte string repeated over the block
+* compressible - random and zero bytes mixed to compress by the given ratio
+
+Every payload is a ring of distinct blocks, so consecutive sends differ
+without making new content per block. Least recently used rings are
+dropped from the pool once it holds more than POOL_MAX_BYTES.
+"""
+import collections
+import os
+import threading
+
+PATTERN_ZEROS = 'zeros'
+PATTERN_RANDOM = 'random'
+PATTERN_REPEAT = 'repeat'
+PATTERN_COMPRESSIBLE = 'compressible'
+
+PAYLOAD_PATTERNS = (PATTERN_ZEROS, PATTERN_RANDOM, PATTERN_REPEAT, PATTERN_COMPRESSIBLE)
+
+DEFAULT_REPEAT = b'0123456789'
+DEFAULT_RATIO = 2.0
+
+# Blocks in a ring, limited so that large blocks do not use too much memory
+RING_BLOCKS = 16
+RING_MAX_BYTES = 64 * 1024 * 1024
+
+# Memory of all pooled rings, the most recently used ring is always kept
+POOL_MAX_BYTES = 2 * RING_MAX_BYTES
+
+# Compressible content is made of chunks of random bytes followed by zeros
+COMPRESS_CHUNK = 4096
+
+# (block size, pattern, param) -> tuple of read-only memoryviews, in LRU order
+_pool = collections.OrderedDict()
+_pool_bytes = 0
+_pool_lock = threading.Lock()
+
+def _ring_size(block_size):
+    """Get number of blocks in a ring"""
+    return max(1, min(RING_BLOCKS, RING_MAX_BYTES // block_size))
+
+def _split(data, block_size, num_blocks, stride=None):
+    """Get read-only views of blocks in data, stride bytes apart"""
+
+    view = memoryview(data).toreadonly()
+    stride = stride or block_size
+
+    return tuple(view[index * stride:index * stride + block_size]
+                 for index in range(num_blocks))
+
+def _make_compressible(block_size, num_blocks, ratio):
+    """Make blocks compressing by about the ratio"""
+
+    if ratio < 1:
+        raise ValueError('Payload compression ratio must be at least 1')
+
+    random_length = max(1, round(COMPRESS_CHUNK / ratio))
+    total = block_size * num_blocks
+    data = bytearray(total)
+    random_bytes = os.urandom(total)
+
+    for offset in range(0, total, COMPRESS_CHUNK):
+        end = min(offset + random_length, total)
+        data[offset:end] = random_bytes[offset:end]
+
+    return bytes(data)
+
+def _make_ring(block_size, pattern, param):
+    """Make content of the ring in bulk"""
+
+    num_blocks = _ring_size(block_size)
+
+    if pattern == PATTERN_ZEROS:
+        # Blocks can not differ
+        return _split(bytes(block_size), block_size, 1)
+
+    elif pattern == PATTERN_RANDOM:
+        return _split(os.urandom(block_size * num_blocks), block_size, num_blocks)
+
+    elif pattern == PATTERN_REPEAT:
+        repeat = param or DEFAULT_REPEAT
+
+        # Blocks are the pattern shifted by one byte each
+        num_blocks = min(num_blocks, len(repeat))
+        data = repeat * ((block_size + num_blocks) // len(repeat) + 1)
+        return _split(data, block_size, num_blocks, stride=1)
+
+    elif pattern == PATTERN_COMPRESSIBLE:
+        ratio = param or DEFAULT_RATIO
+        return _split(_make_compressible(block_size, num_blocks, ratio),
+                      block_size, num_blocks)
+
+    raise ValueError('Unknown payload pattern: {}'.format(pattern))
+
+def _ring_bytes(ring):
+    """Get size of the memory the blocks of a ring are views of"""
+    return len(ring[0].obj)
+
+def get_payload_ring(block_size, pattern=PATTERN_RANDOM, param=None):
+    """
+    Get a ring of read-only blocks of the given size and content. param
+    is the byte string to repeat or the compression ratio. The ring is
+    made once per process while pooled, all callers get views of the
+    same memory.
+    """
+    global _pool_bytes
+
+    key = (block_size, pattern, param)
+
+    with _pool_lock:
+        ring = _pool.get(key)
+        if ring is not None:
+            _pool.move_to_end(key)
+            return ring
+
+        ring = _pool[key] = _make_ring(block_size, pattern, param)
+        _pool_bytes += _ring_bytes(ring)
+
+        # Drop least recently used rings. Streams holding them keep them alive.
+        while _pool_bytes > POOL_MAX_BYTES and len(_pool) > 1:
+            _, old_ring = _pool.popitem(last=False)
+            _pool_bytes -= _ring_bytes(old_ring)
+
+    return ring
+
+def clear_payload_pool():
+    """Drop all pooled blocks. Streams holding a block keep it alive."""
+    global _pool_bytes
+
+    with _pool_lock:
+        _pool.clear()
+        _pool_bytes = 0
@@ -0,0 +1,111 @@
+"""
+Typed results of a finished test for library use.
+"""
+
+class IntervalResult(object):
+    """Stats of a stream over a single report interval"""
+
+    __slots__ = ('start', 'end', 'seconds', 'bytes', 'bits_per_second', 'omitted',
+                 'retransmits', 'snd_cwnd', 'rtt', 'packets', 'errors', 'jitter')
+
+    def __init__(self, stats):
+        self.start = stats['start']
+        self.end = stats['end']
+        self.seconds = stats['seconds']
+        self.bytes = stats['bytes']
+        self.bits_per_second = stats['bits_per_second']
+        self.omitted = stats['omitted']
+        self.errors = stats['errors']
+
+        # None if not known
+        self.retransmits = stats.get('retransmits')
+        self.snd_cwnd = stats.get('snd_cwnd')
+        self.rtt = stats.get('rtt')
+        self.packets = stats.get('packets')
+        self.jitter = stats.get('jitter')
+
+class TransferResult(object):
+    """Data transferred by one side of a stream, or of all streams, over the test"""
+
+    __slots__ = ('bytes', 'seconds', 'bits_per_second', 'retransmits',
+                 'packets', 'errors', 'jitter')
+
+    def __init__(self, num_bytes, seconds, retransmits=None, packets=None,
+                 errors=None, jitter=None):
+        self.bytes = num_bytes
+        self.seconds = seconds
+        self.bits_per_second = num_bytes * 8 / seconds if seconds else 0
+
+        # None if not known
+        self.retransmits = retransmits
+        self.packets = packets
+        self.errors = errors
+        self.jitter = jitter
+
+class StreamResult(object):
+    """Results of a single stream: our and the remote side, and the intervals"""
+
+    __slots__ = ('socket', 'local', 'remote', 'intervals')
+
+    def __init__(self, socket_id, local, remote, intervals):
+        self.socket = socket_id
+        self.local = local
+        self.remote = remote
+        self.intervals = intervals
+
+class TestResult(object):
+    """
+    Results of a test. Local is our side, the sender unless
+    the test is reversed. Sums are over all streams.
+    """
+
+    __slots__ = ('sender', 'seconds', 'streams', 'local', 'remote',
+                 'cpu_utilization', 'remote_cpu_utilization', 'diagnosis', 'integrity')
+
+    def __init__(self, sender, seconds, streams, cpu_utilization,
+                 remote_cpu_utilization, diagnosis, integrity):
+        self.sender = sender
+        self.seconds = seconds
+        self.streams = streams
+        self.local = sum_transfers([x.local for x in streams], seconds)
+        self.remote = sum_transfers([x.remote for x in streams], seconds)
+        self.cpu_utilization = cpu_utilization
+        self.remote_cpu_utilization = remote_cpu_utilization
+        self.diagnosis = diagnosis
+        self.integrity = integrity
+
+def transfer_from_stats(stats, seconds, sender, udp):
+    """
+    Make a transfer result from final stats of a stream. Loss and
+    jitter are known by the UDP receiver, retransmits by the TCP sender.
+    """
+    if not udp:
+        retransmits = stats.get('retransmits', -1)
+        return TransferResult(
+            stats['bytes'], seconds,
+            retransmits=retransmits if retransmits >= 0 else None)
+
+    if sender:
+        return TransferResult(stats['bytes'], seconds, packets=stats.get('packets', 0))
+
+    return TransferResult(
+        stats['bytes'], seconds,
+        packets=stats.get('packets', 0),
+        errors=stats.get('errors', 0),
+        jitter=stats.get('jitter', 0))
+
+def sum_transfers(transfers, seconds):
+    """Sum transfer results of streams over the same time"""
+
+    def added(name):
+        values = [getattr(x, name) for x in transfers if getattr(x, name) is not None]
+        return sum(values) if values else None
+
+    jitters = [x.jitter for x in transfers if x.jitter is not None]
+
+    return TransferResult(
+        sum(x.bytes for x in transfers), seconds,
+        retransmits=added('retransmits'),
+        packets=added('packets'),
+        errors=added('errors'),
+        jitter=sum(jitters) / len(jitters) if jitters else None)
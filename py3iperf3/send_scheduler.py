@@ -0,0 +1,81 @@
+"""
+Round-robin scheduling of the sending callbacks of all streams of a test.
+"""
+
+class ScheduledSend(object):
+    """
+    A stream waiting for its turn. Stands in for the loop handle
+    of the stream, so it can be cancelled the same way.
+    """
+
+    __slots__ = ('_scheduler', 'stream', 'active')
+
+    def __init__(self, scheduler, stream):
+        self._scheduler = scheduler
+        self.stream = stream
+        self.active = True
+
+    def cancel(self):
+        """Remove the stream from the ready set"""
+        if self.active:
+            self.active = False
+            self._scheduler._remove(self)
+
+class SendScheduler(object):
+    """
+    Keeps the set of streams ready to send and gives each of them a turn
+    from a single loop callback per tick, in the order they became ready.
+    A turn sends up to the stream's byte budget, so streams are served
+    byte-fair. Streams paused by their transport or waiting for pacing
+    tokens are not in the set, so idle streams cost nothing per tick.
+    """
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._ready = {}    # Stream -> ScheduledSend, in turn order
+        self._handle = None
+
+    def __len__(self):
+        return len(self._ready)
+
+    def add(self, stream):
+        """Give the stream a turn in the next tick. Returns a cancellable entry."""
+
+        entry = self._ready.get(stream)
+        if entry is None:
+            entry = self._ready[stream] = ScheduledSend(self, stream)
+
+        if self._handle is None:
+            self._handle = self._loop.call_soon(self._run)
+
+        return entry
+
+    def _remove(self, entry):
+        """Drop a cancelled entry if it is still waiting"""
+
+        if self._ready.get(entry.stream) is entry:
+            del self._ready[entry.stream]
+
+    def _run(self):
+        """Give every ready stream one turn. Streams re-add themselves."""
+
+        self._handle = None
+        ready = self._ready
+        self._ready = {}
+
+        for entry in ready.values():
+            # Entry may be cancelled by an earlier stream's turn
+            if entry.active:
+                entry.active = False
+                entry.stream._try_sending()
+
+    def close(self):
+        """Drop all streams and the pending tick"""
+
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        for entry in self._ready.values():
+            entry.active = False
+        self._ready = {}
@@ -8,6 +8,8 @@ class Iperf3TestSettings(object):
     """Default settings of a test"""
 
     test_protocol = Iperf3TestProto.TCP
+    bandwidth = None    # bits/sec, 0 - unlimited. Default 1 Mbit/sec for UDP
+    burst = None        # Packets sent back-to-back
     server_address = ''
     server_port = 5201
 
@@ -16,18 +18,40 @@ class Iperf3TestSettings(object):
     block_size = None
     ip_version = 4
     test_duration = 10
+    omit = 0            # Seconds of warm-up excluded from the results
     report_interval = 1
     no_delay = False
     parallel = 1
     reverse = False
     title = None
     format = None
+    json = False
+    json_stream = False
     blockcount = None
     bytes = None
     file = None
+    file_wrap = False
+    zerocopy = False
+    integrity_hash = False  # Hash the data of TCP streams to verify the transfer
+    file_ranges = False     # Parallel TCP streams send a part of the file each (py3iperf3 peers)
+    payload = 'random'      # zeros, random, repeat or compressible
+    payload_pattern = None  # String repeated with the repeat payload
+    payload_ratio = 2.0     # Compression ratio of the compressible payload
     udp64bitcounters = False
+    udp_gso = False
+    udp_batch_rx = False
+    udp_gro = False
     get_server_output = False
     window = None
+    use_processes = False
+    send_budget = 4 * 1024 * 1024
+    write_buffer_high = None
+    write_buffer_low = None
+    buffered_rx = False
+    stats_retention = 0
+    cpu_interval = False
+    loop_monitor = False
+    send_scheduler = False
 
     # Server specific options
     server = False
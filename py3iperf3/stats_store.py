@@ -0,0 +1,216 @@
+"""
+Columnar store of the interval stats of all streams of a test.
+"""
+from array import array
+
+# Column name, array type code and value used if missing in the stats
+STATS_COLUMNS = (
+    ('stream', 'l', 0),
+    ('socket', 'l', 0),
+    ('start', 'd', 0),
+    ('end', 'd', 0),
+    ('seconds', 'd', 0),
+    ('bytes', 'q', 0),
+    ('packets', 'q', -1),
+    ('errors', 'q', 0),
+    ('retransmits', 'q', -1),
+    ('jitter', 'd', -1),
+    ('snd_cwnd', 'q', -1),
+    ('rtt', 'q', -1),
+    ('omitted', 'b', 0),
+)
+
+MISSING_VALUES = {name: missing for name, _, missing in STATS_COLUMNS}
+
+# Keys put into a stats dict only if the value is not missing
+OPTIONAL_KEYS = ('packets', 'retransmits', 'jitter', 'snd_cwnd', 'rtt')
+
+class StreamTotals(object):
+    """Running totals of a stream over the non-omitted intervals"""
+
+    __slots__ = ('intervals', 'seconds', 'bytes', 'packets', 'errors', 'retransmits')
+
+    def __init__(self):
+        self.intervals = 0
+        self.seconds = 0
+        self.bytes = 0
+        self.packets = 0
+        self.errors = 0
+        self.retransmits = 0
+
+class IntervalRecord(object):
+    """View of a single record in the store"""
+
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __getattr__(self, name):
+        try:
+            return self._store._columns[name][self._index]
+        except KeyError:
+            raise AttributeError(name)
+
+    @property
+    def bits_per_second(self):
+        """Get the average speed over the record"""
+        if not self.seconds:
+            return 0
+
+        return int(self.bytes * 8 / self.seconds)
+
+    def as_dict(self):
+        """Get the record as an iPerf3 interval stats dict"""
+
+        stats = {
+            'socket': self.socket,
+            'start': self.start,
+            'end': self.end,
+            'seconds': self.seconds,
+            'bytes': self.bytes,
+            'bits_per_second': self.bits_per_second,
+            'omitted': bool(self.omitted),
+            'errors': self.errors,
+        }
+
+        for key in OPTIONAL_KEYS:
+            value = getattr(self, key)
+            if value != MISSING_VALUES[key]:
+                stats[key] = value
+
+        return stats
+
+class StatsStore(object):
+    """
+    Keeps interval stats in typed arrays, one per field, instead of a dict
+    per interval. Totals of every stream are kept as records are added,
+    so final stats do not depend on the number of intervals.
+
+    If retention is set, the store holds about that many records at most:
+    once full, the older half is downsampled by merging pairs of consecutive
+    records of the same stream. Old intervals get coarser the older they are.
+    """
+
+    def __init__(self, retention=0):
+        self._retention = retention
+        self._columns = {name: array(code) for name, code, _ in STATS_COLUMNS}
+        self._totals = {}
+
+    def __len__(self):
+        return len(self._columns['stream'])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Record index out of range')
+
+        return IntervalRecord(self, index)
+
+    def append(self, stream_id, stats):
+        """Add interval stats dict of the stream"""
+
+        self._columns['stream'].append(stream_id)
+        for name, _, missing in STATS_COLUMNS[1:]:
+            self._columns[name].append(stats.get(name, missing))
+
+        if not stats.get('omitted'):
+            totals = self._totals.get(stream_id)
+            if totals is None:
+                totals = self._totals[stream_id] = StreamTotals()
+
+            totals.intervals += 1
+            totals.seconds += stats['seconds']
+            totals.bytes += stats['bytes']
+            totals.packets += stats.get('packets', 0)
+            totals.errors += stats.get('errors', 0)
+            totals.retransmits += max(stats.get('retransmits', 0), 0)
+
+        if self._retention and len(self) > self._retention:
+            self._downsample()
+
+    def totals(self, stream_id):
+        """Get running totals of the stream"""
+        totals = self._totals.get(stream_id)
+        if totals is None:
+            totals = StreamTotals()
+
+        return totals
+
+    def records(self, stream_id=None):
+        """Iterate over the records, optionally of a single stream only"""
+
+        streams = self._columns['stream']
+        for index in range(len(self)):
+            if stream_id is None or streams[index] == stream_id:
+                yield IntervalRecord(self, index)
+
+    def _downsample(self):
+        """Merge pairs of records of the same stream in the older half"""
+
+        num_old = len(self) // 2
+        columns = self._columns
+        merged = {name: array(code) for name, code, _ in STATS_COLUMNS}
+        pending = {}    # Stream ID -> index of a record waiting for a pair
+
+        def copy_record(index):
+            for name in merged:
+                merged[name].append(columns[name][index])
+
+        for index in range(num_old):
+            stream_id = columns['stream'][index]
+            first = pending.pop(stream_id, None)
+            if first is None:
+                pending[stream_id] = index
+                continue
+
+            self._merge_into(merged, first, index)
+
+        # Records left without a pair are kept as they are
+        for index in sorted(pending.values()):
+            copy_record(index)
+
+        for index in range(num_old, len(self)):
+            copy_record(index)
+
+        self._columns = merged
+
+    def _merge_into(self, merged, first, second):
+        """Append a record covering two records of the same stream"""
+
+        columns = self._columns
+        seconds_first = columns['seconds'][first]
+        seconds_second = columns['seconds'][second]
+        seconds = seconds_first + seconds_second
+
+        def weighted(name):
+            """Time weighted mean, missing if either value is missing"""
+            value_first = columns[name][first]
+            value_second = columns[name][second]
+            if value_first < 0 or value_second < 0 or not seconds:
+                return value_second
+            return (value_first * seconds_first + value_second * seconds_second) / seconds
+
+        def added(name):
+            """Sum, missing if the stream does not have the value"""
+            value_second = columns[name][second]
+            if value_second < 0:
+                return value_second
+            return max(columns[name][first], 0) + value_second
+
+        merged['stream'].append(columns['stream'][first])
+        merged['socket'].append(columns['socket'][second])
+        merged['start'].append(columns['start'][first])
+        merged['end'].append(columns['end'][second])
+        merged['seconds'].append(seconds)
+        merged['bytes'].append(added('bytes'))
+        merged['packets'].append(added('packets'))
+        merged['errors'].append(added('errors'))
+        merged['retransmits'].append(added('retransmits'))
+        merged['jitter'].append(weighted('jitter'))
+        merged['snd_cwnd'].append(columns['snd_cwnd'][second])
+        merged['rtt'].append(int(weighted('rtt')))
+        merged['omitted'].append(
+            columns['omitted'][first] and columns['omitted'][second])
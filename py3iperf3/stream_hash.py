@@ -0,0 +1,111 @@
+"""
+Running hash of the data of a stream, used to check transfer integrity.
+"""
+import hashlib
+import queue
+import threading
+import time
+
+HASH_ALGORITHM = 'sha256'
+# Max data blocks waiting for the hasher thread
+HASH_QUEUE_DEPTH = 1024
+
+# Seconds the receiver waits for data still in flight when results
+# are exchanged, and the interval of checking for it
+DATA_WAIT_TIMEOUT = 2.0
+DATA_WAIT_POLL = 0.01
+
+class StreamHash(object):
+    """
+    Hashes the data of a stream in a background thread. The event loop
+    only queues references to the blocks, so blocks must not change once
+    queued. It waits for the hasher only when the queue is full; the time
+    spent waiting is reported as backlog time. hashlib releases the GIL
+    while hashing large blocks, so the loop keeps running meanwhile.
+    """
+
+    def __init__(self, algorithm=HASH_ALGORITHM, queue_depth=HASH_QUEUE_DEPTH):
+        """
+        Start the hasher thread.
+        """
+        self._hash = hashlib.new(algorithm)
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._num_bytes = 0
+        self._queued_bytes = 0
+        self._digest = None
+        self._backlog_time = 0
+
+        self._hasher = threading.Thread(target=self._hash_blocks, daemon=True)
+        self._hasher.start()
+
+    @property
+    def algorithm(self):
+        """Get name of the hash algorithm"""
+        return self._hash.name
+
+    @property
+    def backlog_time(self):
+        """Get seconds the event loop waited for the hasher"""
+        return self._backlog_time
+
+    @property
+    def num_bytes(self):
+        """Get number of hashed bytes. Final once finished."""
+        return self._num_bytes
+
+    @property
+    def queued_bytes(self):
+        """Get number of bytes queued for hashing so far"""
+        return self._queued_bytes
+
+    def update(self, data):
+        """Queue a block for hashing. Ignored once finished."""
+
+        if self._digest is not None:
+            return
+
+        self._queued_bytes += len(data)
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            wait_start = time.perf_counter()
+            self._queue.put(data)
+            self._backlog_time += time.perf_counter() - wait_start
+
+    def _hash_blocks(self):
+        """Hasher thread: hash queued blocks until told to stop"""
+
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+
+            self._hash.update(data)
+            self._num_bytes += len(data)
+
+    def finish(self):
+        """Hash the remaining blocks and get the hex digest"""
+
+        if self._digest is None:
+            self._queue.put(None)
+            self._hasher.join()
+            self._digest = self._hash.hexdigest()
+
+        return self._digest
+
+def compare_digests(local, remote):
+    """
+    Compare our final stream stats with the remote ones. Returns
+    ok, mismatch, incomplete (different number of bytes hashed)
+    or unknown (digest of either side missing).
+    """
+    if not local.get('digest') or not remote.get('digest'):
+        return 'unknown'
+
+    if local['digest_bytes'] != remote['digest_bytes']:
+        return 'incomplete'
+
+    if local['digest'] != remote['digest']:
+        return 'mismatch'
+
+    return 'ok'
@@ -0,0 +1,165 @@
+"""
+Worker process running a single test stream on its own event loop.
+"""
+import asyncio
+import logging
+import os
+
+from py3iperf3.iperf3_test import Iperf3Test
+from py3iperf3.iperf3_api import Iperf3TestProto
+from py3iperf3.data_stream_tcp import TestStreamTcp
+from py3iperf3.data_stream_udp import TestStreamUdp
+from py3iperf3.data_stream_worker import WORKER_TICK, WORKER_STARTING, WORKER_RUNNING
+from py3iperf3.data_stream_worker import WORKER_DONE, WORKER_STOPPED
+from py3iperf3.data_stream_worker import CNT_STATE, CNT_BYTES_TX, CNT_BYTES_RX
+from py3iperf3.data_stream_worker import CNT_BLOCKS_TX, CNT_PKT_TX, CNT_PKT_RX, CNT_ERRORS
+from py3iperf3.data_stream_worker import CNT_JITTER_NS, CNT_TCPI_VALID, CNT_TCPI_RETRANS
+from py3iperf3.data_stream_worker import CNT_TCPI_CWND, CNT_TCPI_RTT, CNT_TCPI_RTTVAR, CNT_TCPI_PMTU
+from py3iperf3.data_stream_worker import CNT_CPU_USER_US, CNT_CPU_SYSTEM_US
+from py3iperf3.data_stream_worker import CNT_OUT_OF_ORDER, CNT_DUPLICATES
+from py3iperf3.utils import setup_logging
+
+class StreamWorkerTest(Iperf3Test):
+    """
+    Test seen by a stream running in the worker. The control
+    connection and the test state stay in the parent process.
+    """
+
+    def __init__(self, loop, test_parameters, role, cookie, counters):
+        super().__init__(None, loop, test_parameters)
+
+        self._role = role
+        self._cookie = cookie
+        self._counters = counters
+
+    def sendable_data_depleted(self):
+        """Tell the parent that this worker has sent all data"""
+        self._counters[CNT_STATE] = WORKER_DONE
+
+    def close(self):
+        """Release resources used by the stream"""
+
+        if self._file_source is not None:
+            self._file_source.close()
+            self._file_source = None
+
+class StreamWorker(object):
+    """
+    Drives the stream in the worker: publishes its counters
+    and follows start/stop commands of the parent.
+
+    The server numbers streams in the order it accepts them, so the stream
+    connects only once the worker of the previous stream has connected.
+    """
+
+    def __init__(self, loop, stream, counters, start_event, stop_event,
+                 previous_counters=None):
+        self._loop = loop
+        self._stream = stream
+        self._counters = counters
+        self._start_event = start_event
+        self._stop_event = stop_event
+        self._previous_counters = previous_counters
+        self._connecting = False
+        self._started = False
+
+    def tick(self):
+        """Publish counters and check for commands"""
+
+        if not self._connecting and (self._previous_counters is None or
+                                     self._previous_counters[CNT_STATE] != WORKER_STARTING):
+            self._connecting = True
+            self._stream.create_connection()
+
+        if not self._started and self._start_event.is_set():
+            self._started = True
+            self._stream.start_stream()
+
+        if self._stop_event.is_set():
+            self._stream.stop_stream()
+            self.publish()
+            self._counters[CNT_STATE] = WORKER_STOPPED
+            self._loop.stop()
+            return
+
+        self.publish()
+        self._loop.call_later(WORKER_TICK, self.tick)
+
+    def publish(self):
+        """Write the cumulative stream counters to the shared array"""
+
+        stream = self._stream
+        counters = self._counters
+
+        # Not connected yet
+        if stream._test_protocol is None:
+            return
+
+        if counters[CNT_STATE] != WORKER_DONE:
+            counters[CNT_STATE] = WORKER_RUNNING
+
+        # UDP loss and jitter are computed in bulk
+        if hasattr(stream, '_process_received'):
+            stream._process_received()
+
+        counters[CNT_BYTES_TX] = stream._bytes_tx_this_interval
+        counters[CNT_BYTES_RX] = stream._bytes_rx_this_interval
+        counters[CNT_BLOCKS_TX] = stream._blocks_tx_this_interval
+        counters[CNT_PKT_TX] = stream._pkt_tx_this_interval
+        counters[CNT_PKT_RX] = stream._pkt_rx_this_interval
+        counters[CNT_ERRORS] = getattr(stream, '_err_count', 0)
+        counters[CNT_JITTER_NS] = int(getattr(stream, '_jitter', 0))
+        counters[CNT_OUT_OF_ORDER] = getattr(stream, '_ooo_count', 0)
+        counters[CNT_DUPLICATES] = getattr(stream, '_dup_count', 0)
+
+        cpu_times = os.times()
+        counters[CNT_CPU_USER_US] = int(cpu_times.user * 1000000)
+        counters[CNT_CPU_SYSTEM_US] = int(cpu_times.system * 1000000)
+
+        if not hasattr(stream._test_protocol, 'get_tcp_info'):
+            return
+
+        tcp_info = stream._test_protocol.get_tcp_info()
+        if tcp_info is None:
+            return
+
+        counters[CNT_TCPI_RETRANS] = tcp_info['total_retrans']
+        counters[CNT_TCPI_CWND] = tcp_info['snd_cwnd'] * tcp_info['snd_mss']
+        counters[CNT_TCPI_RTT] = tcp_info['rtt']
+        counters[CNT_TCPI_RTTVAR] = tcp_info['rttvar']
+        counters[CNT_TCPI_PMTU] = tcp_info['pmtu']
+        counters[CNT_TCPI_VALID] = 1
+
+def run_stream_worker(test_parameters, role, cookie, stream_id,
+                      blocks_remaining, bytes_remaining, file_range,
+                      counters, previous_counters, start_event, stop_event):
+    """Worker process entry point"""
+
+    setup_logging(debug=test_parameters.get('debug'))
+    logger = logging.getLogger('py3iperf3')
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    test = StreamWorkerTest(loop, test_parameters, role, cookie, counters)
+    test._blocks_remaining = blocks_remaining
+    test._bytes_remaining = bytes_remaining
+
+    if test.data_protocol == Iperf3TestProto.TCP:
+        stream = TestStreamTcp(loop=loop, test=test, stream_id=stream_id,
+                               file_range=file_range)
+    else:
+        stream = TestStreamUdp(loop=loop, test=test, stream_id=stream_id)
+
+    worker = StreamWorker(loop, stream, counters, start_event, stop_event,
+                          previous_counters)
+    loop.call_soon(worker.tick)
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+    logger.debug('Stream %s worker done', stream_id)
+    test.close()
+    loop.close()
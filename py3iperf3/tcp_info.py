@@ -0,0 +1,64 @@
+"""
+Reading of the Linux TCP_INFO socket option.
+"""
+import socket
+import struct
+import sys
+
+# struct tcp_info from linux/tcp.h up to tcpi_total_retrans
+TCP_INFO_STRUCT = struct.Struct('=8B24I')
+TCP_INFO_FIELDS = (
+    'state', 'ca_state', 'retransmits', 'probes', 'backoff', 'options',
+    'wscale', 'app_limited',
+    'rto', 'ato', 'snd_mss', 'rcv_mss',
+    'unacked', 'sacked', 'lost', 'retrans', 'fackets',
+    'last_data_sent', 'last_ack_sent', 'last_data_recv', 'last_ack_recv',
+    'pmtu', 'rcv_ssthresh', 'rtt', 'rttvar', 'snd_ssthresh', 'snd_cwnd',
+    'advmss', 'reordering',
+    'rcv_rtt', 'rcv_space',
+    'total_retrans',
+)
+
+# Fields added to struct tcp_info up to Linux 4.10, read if the kernel has them.
+# The *_limited times and busy_time are in usec.
+TCP_INFO_EXT_STRUCT = struct.Struct('=8B24I4Q6IQ3Q')
+TCP_INFO_EXT_FIELDS = TCP_INFO_FIELDS + (
+    'pacing_rate', 'max_pacing_rate', 'bytes_acked', 'bytes_received',
+    'segs_out', 'segs_in',
+    'notsent_bytes', 'min_rtt', 'data_segs_in', 'data_segs_out',
+    'delivery_rate',
+    'busy_time', 'rwnd_limited', 'sndbuf_limited',
+)
+
+def tcp_info_supported():
+    """Check if TCP_INFO can be read on this platform"""
+    return sys.platform.startswith('linux') and hasattr(socket, 'TCP_INFO')
+
+def parse_tcp_info(info_bytes):
+    """
+    Parse raw TCP_INFO bytes into a dict. Times are in usec,
+    snd_cwnd is in segments. Returns None if data is too short.
+    Newer fields are in the dict only if the kernel returned them.
+    """
+    if len(info_bytes) >= TCP_INFO_EXT_STRUCT.size:
+        return dict(zip(TCP_INFO_EXT_FIELDS, TCP_INFO_EXT_STRUCT.unpack_from(info_bytes)))
+
+    if len(info_bytes) < TCP_INFO_STRUCT.size:
+        return None
+
+    return dict(zip(TCP_INFO_FIELDS, TCP_INFO_STRUCT.unpack_from(info_bytes)))
+
+def read_tcp_info(sock):
+    """
+    Read TCP_INFO of the socket. Returns None if not available.
+    """
+    if not tcp_info_supported():
+        return None
+
+    try:
+        info_bytes = sock.getsockopt(
+            socket.IPPROTO_TCP, socket.TCP_INFO, TCP_INFO_EXT_STRUCT.size)
+    except OSError:
+        return None
+
+    return parse_tcp_info(info_bytes)
@@ -0,0 +1,152 @@
+"""
+Log of received UDP datagrams. Loss, reordering and jitter are
+computed in bulk from the log instead of on every packet.
+"""
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# RFC 1889 jitter smoothing: J += (|D| - J) / 16
+JITTER_GAIN = 16
+JITTER_DECAY = 1 - 1 / JITTER_GAIN
+
+# Sequence numbers this far below the largest one are not remembered,
+# older copies of a datagram are counted as out of order
+DUPLICATE_WINDOW = 8192
+
+class UdpRxLog(object):
+    """
+    Keeps (sequence, sender time, arrival time) of the received datagrams
+    in typed arrays. process() folds them into the loss, out-of-order and
+    jitter values using the same algorithm as ESnet iPerf3. Unlike iPerf3,
+    duplicates of recently received datagrams are counted on their own and
+    do not count as out of order or make up for lost datagrams.
+    Times are in nanoseconds.
+    """
+
+    def __init__(self, use_numpy=None):
+        self._seq = array('Q')
+        self._sent = array('q')
+        self._arrival = array('q')
+
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        self._use_numpy = use_numpy
+
+        self.max_seq = 0
+        self.errors = 0
+        self.out_of_order = 0
+        self.duplicates = 0
+        self.jitter = 0.0
+        self.prev_transit = 0
+
+        # Sequence numbers received within DUPLICATE_WINDOW of max_seq
+        if self._use_numpy:
+            self._recent = numpy.empty(0, dtype=numpy.int64)
+        else:
+            self._recent = set()
+
+    def __len__(self):
+        return len(self._seq)
+
+    def append(self, seq, sent_ns, arrival_ns):
+        """Log a received datagram"""
+        self._seq.append(seq)
+        self._sent.append(sent_ns)
+        self._arrival.append(arrival_ns)
+
+    def process(self):
+        """
+        Update loss, out-of-order, duplicate and jitter values with the
+        logged datagrams and clear the log. Returns number of datagrams processed.
+        """
+        num_records = len(self._seq)
+        if not num_records:
+            return 0
+
+        if self._use_numpy:
+            self._process_numpy()
+        else:
+            self._process_python()
+
+        del self._seq[:]
+        del self._sent[:]
+        del self._arrival[:]
+
+        return num_records
+
+    def _process_python(self):
+        """Process the log one datagram at a time"""
+
+        max_seq = self.max_seq
+        errors = self.errors
+        out_of_order = self.out_of_order
+        duplicates = self.duplicates
+        jitter = self.jitter
+        prev_transit = self.prev_transit
+        recent = self._recent
+
+        for seq, sent_ns, arrival_ns in zip(self._seq, self._sent, self._arrival):
+            if seq in recent:
+                duplicates += 1
+            elif seq > max_seq:
+                errors += seq - max_seq - 1
+                max_seq = seq
+            else:
+                out_of_order += 1
+                if errors > 0:
+                    errors -= 1
+            recent.add(seq)
+
+            transit = arrival_ns - sent_ns
+            jitter += (abs(transit - prev_transit) - jitter) / JITTER_GAIN
+            prev_transit = transit
+
+        self.max_seq = max_seq
+        self.errors = errors
+        self.out_of_order = out_of_order
+        self.duplicates = duplicates
+        self.jitter = jitter
+        self.prev_transit = prev_transit
+        self._recent = {x for x in recent if x > max_seq - DUPLICATE_WINDOW}
+
+    def _process_numpy(self):
+        """Process the whole log with array operations"""
+
+        all_seq = numpy.frombuffer(self._seq, dtype=numpy.uint64).astype(numpy.int64)
+
+        # Duplicates were received before, in this log or in an earlier one
+        first_seen = numpy.zeros(len(all_seq), dtype=bool)
+        first_seen[numpy.unique(all_seq, return_index=True)[1]] = True
+        unique = first_seen & ~numpy.isin(all_seq, self._recent)
+        seq = all_seq[unique]
+        self.duplicates += int(len(all_seq) - len(seq))
+
+        if len(seq):
+            # Largest sequence seen before each datagram
+            max_before = numpy.maximum.accumulate(
+                numpy.concatenate(([self.max_seq], seq[:-1])))
+            in_order = seq > max_before
+
+            # Gaps add to errors, late datagrams take one off but never below zero.
+            # Clamped running sum is the plain running sum less its lowest point.
+            steps = numpy.where(in_order, seq - max_before - 1, -1)
+            walk = self.errors + numpy.cumsum(steps)
+            self.errors = int(walk[-1] - min(0, walk.min()))
+            self.out_of_order += int(len(seq) - numpy.count_nonzero(in_order))
+            self.max_seq = max(self.max_seq, int(seq.max()))
+
+            recent = numpy.concatenate((self._recent, seq))
+            self._recent = recent[recent > self.max_seq - DUPLICATE_WINDOW]
+
+        # Exponential smoothing unrolled: older samples decay by 15/16 each
+        transit = (numpy.frombuffer(self._arrival, dtype=numpy.int64) -
+                   numpy.frombuffer(self._sent, dtype=numpy.int64))
+        delta = numpy.abs(numpy.diff(transit, prepend=self.prev_transit)).astype(numpy.float64)
+        weights = JITTER_DECAY ** numpy.arange(len(delta) - 1, -1, -1) / JITTER_GAIN
+
+        self.jitter = float(self.jitter * JITTER_DECAY ** len(delta) + numpy.dot(delta, weights))
+        self.prev_transit = int(transit[-1])
@@ -1,6 +1,7 @@
 """
 Various utility functions
 """
+import argparse
 import math
 import random
 import string
@@ -26,6 +27,79 @@ def make_cookie():
 
     return cookie
 
+def parse_bandwidth(bandwidth_string):
+    """
+    Parse iPerf3 style #[KMG][/#] bandwidth string.
+    Returns rate in bits/sec and burst packet count (or None).
+    Used as argparse type, negative rates and bursts below 1 are refused.
+    """
+
+    rate_multiplier = {
+        'k':1000,
+        'm':1000**2,
+        'g':1000**3,
+        't':1000**4,
+    }
+
+    burst = None
+    rate_string = bandwidth_string.strip()
+
+    if '/' in rate_string:
+        rate_string, burst_string = rate_string.split('/', 1)
+        try:
+            burst = int(burst_string)
+        except ValueError:
+            raise argparse.ArgumentTypeError('invalid burst: {}'.format(bandwidth_string))
+
+        if burst <= 0:
+            raise argparse.ArgumentTypeError('burst must be greater than 0: {}'.format(
+                bandwidth_string))
+
+    multiplier = rate_multiplier.get(rate_string[-1:].lower(), 1)
+    if multiplier != 1:
+        rate_string = rate_string[:-1]
+
+    try:
+        rate = int(float(rate_string) * multiplier)
+    except (ValueError, OverflowError):
+        raise argparse.ArgumentTypeError('invalid bandwidth: {}'.format(bandwidth_string))
+
+    if rate < 0:
+        raise argparse.ArgumentTypeError('bandwidth must not be negative: {}'.format(
+            bandwidth_string))
+
+    return rate, burst
+
+def parse_positive_int(value_string):
+    """
+    Parse an integer greater than zero.
+    Used as argparse type, other values are refused.
+    """
+    try:
+        value = int(value_string)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid int value: {}'.format(value_string))
+
+    if value <= 0:
+        raise argparse.ArgumentTypeError('value must be greater than 0: {}'.format(value_string))
+
+    return value
+
+def parse_payload_ratio(ratio_string):
+    """
+    Parse compression ratio of the compressible payload.
+    Used as argparse type, ratios below 1 are refused.
+    """
+    try:
+        ratio = float(ratio_string)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid ratio: {}'.format(ratio_string))
+
+    if not ratio >= 1:
+        raise argparse.ArgumentTypeError('ratio must be at least 1: {}'.format(ratio_string))
+
+    return ratio
+
 def setup_logging(debug=False, log_filename=None, **kwargs):
     """Setup logging infrastructure"""
 
@@ -112,3 +186,24 @@ def data_size_formatter(size_in_bits, decimal=False, in_bytes=False, dimmension=
 
     digit_string = digit_string.rstrip('0').rstrip('.') if '.' in digit_string else digit_string
     return '{} {}'.format(digit_string, postfix[size_index])
+
+def format_cpu_utilization(cpu_util):
+    """Format CPU utilization dict as iPerf3 does: total% (user%u/system%s)"""
+
+    return '{:.1f}% ({:.1f}%u/{:.1f}%s)'.format(
+        cpu_util.get('cpu_util_total', 0),
+        cpu_util.get('cpu_util_user', 0),
+        cpu_util.get('cpu_util_system', 0))
+
+def format_loop_stats(loop_stats):
+    """Format event loop monitor summary as p99/max ms of each histogram"""
+
+    return 'timer delay {:.2f}/{:.2f} ms, callback delay {:.2f}/{:.2f} ms, ' \
+           'send time {:.2f}/{:.2f} ms (p99/max), {} pauses'.format(
+               loop_stats['timer_delay']['p99_ms'],
+               loop_stats['timer_delay']['max_ms'],
+               loop_stats['callback_delay']['p99_ms'],
+               loop_stats['callback_delay']['max_ms'],
+               loop_stats['send_time']['p99_ms'],
+               loop_stats['send_time']['max_ms'],
+               loop_stats['pauses'])
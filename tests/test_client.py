@@ -3,9 +3,11 @@ Unit-test for Iperf3Client class
 """
 #pylint: disable=protected-access, no-member
 
+import asyncio
 import unittest
 import unittest.mock
 
+from py3iperf3.error import IPerf3Exception
 from py3iperf3.iperf3_client import Iperf3Client
 from py3iperf3.iperf3_test import Iperf3Test
 
@@ -96,3 +98,75 @@ class TestIperf3ClientClass(unittest.TestCase):
         # Remove non-existing test
         client.test_done(mock_test2)
         self.assertTrue(mock_logger.error)
+
+    def test_run_test(self):
+        """Test running a test from a coroutine"""
+
+        loop = asyncio.new_event_loop()
+        client = Iperf3Client(loop=loop)
+
+        def finish_test(test):
+            test._remote_results = {'streams': []}
+            test.get_result = unittest.mock.MagicMock(return_value='result')
+            loop.call_soon(client.test_done, test)
+
+        with unittest.mock.patch('py3iperf3.iperf3_test.Iperf3Test.run',
+                                 autospec=True, side_effect=finish_test):
+            result = loop.run_until_complete(client.run_test({}))
+            results = loop.run_until_complete(client.run([{}, {}, {}], concurrency=2))
+
+        self.assertEqual(result, 'result')
+        self.assertEqual(results, ['result'] * 3)
+
+        # Loop is not stopped
+        self.assertFalse(loop.is_running())
+        self.assertFalse(loop.is_closed())
+        loop.close()
+
+    def test_run_test_failed(self):
+        """Test failed and cancelled tests run from a coroutine"""
+
+        loop = asyncio.new_event_loop()
+        client = Iperf3Client(loop=loop)
+
+        def fail_test(test):
+            test._error = OSError('Connection refused')
+            loop.call_soon(client.test_done, test)
+
+        with unittest.mock.patch('py3iperf3.iperf3_test.Iperf3Test.run',
+                                 autospec=True, side_effect=fail_test):
+            with self.assertRaises(IPerf3Exception):
+                loop.run_until_complete(client.run_test({}))
+
+            results = loop.run_until_complete(client.run([{}], return_exceptions=True))
+            self.assertIsInstance(results[0], IPerf3Exception)
+
+        loop.close()
+
+    def test_run_test_cancelled(self):
+        """Test that a cancelled test is stopped and the loop keeps running"""
+
+        loop = asyncio.new_event_loop()
+        mock_loop = unittest.mock.Mock(wraps=loop)
+        client = Iperf3Client(loop=mock_loop)
+        client._logger = unittest.mock.MagicMock()
+
+        def stop_test(test):
+            # Still pending when stopped
+            self.assertIn(test, client._pending)
+            loop.call_soon(client.test_done, test)
+
+        with unittest.mock.patch('py3iperf3.iperf3_test.Iperf3Test.run'), \
+             unittest.mock.patch('py3iperf3.iperf3_test.Iperf3Test.stop',
+                                 autospec=True, side_effect=stop_test) as mock_stop:
+            task = loop.create_task(client.run_test({}))
+            loop.call_soon(task.cancel)
+            with self.assertRaises(asyncio.CancelledError):
+                loop.run_until_complete(task)
+            loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertTrue(mock_stop.called)
+        self.assertFalse(client._pending)
+        self.assertFalse(mock_loop.stop.called)
+        self.assertFalse(client._logger.error.called)
+        loop.close()
@@ -0,0 +1,67 @@
+"""
+Unit-test for the CPU utilization accounting.
+"""
+import unittest
+import unittest.mock
+
+from py3iperf3.cpu_usage import CpuUsage, cpu_utilization
+
+class TestCpuUsage(unittest.TestCase):
+    """Unit-tests of the CPU utilization"""
+
+    def test_cpu_utilization(self):
+        """Test utilization between two samples"""
+
+        utilization = cpu_utilization((10, 1, 1), (12, 2, 1.5))
+        self.assertEqual(utilization['cpu_util_user'], 50)
+        self.assertEqual(utilization['cpu_util_system'], 25)
+        self.assertEqual(utilization['cpu_util_total'], 75)
+
+        # More than one core used
+        self.assertEqual(cpu_utilization((0, 0, 0), (1, 2, 1))['cpu_util_total'], 300)
+
+        # No time elapsed
+        self.assertEqual(cpu_utilization((1, 0, 0), (1, 1, 1))['cpu_util_total'], 0)
+
+    def test_start_stop(self):
+        """Test totals and intervals including the workers"""
+
+        cpu_usage = CpuUsage()
+        self.assertEqual(cpu_usage.total()['cpu_util_total'], 0)
+
+        with unittest.mock.patch('py3iperf3.cpu_usage.time.monotonic',
+                                 side_effect=[0, 1, 4]), \
+             unittest.mock.patch('py3iperf3.cpu_usage.os.times') as mock_times:
+            mock_times.return_value = unittest.mock.MagicMock(user=1, system=0)
+            cpu_usage.start()
+
+            mock_times.return_value = unittest.mock.MagicMock(user=1.5, system=0)
+            interval = cpu_usage.interval(0.5, 0)
+            self.assertEqual(interval['cpu_util_user'], 100)
+
+            mock_times.return_value = unittest.mock.MagicMock(user=2, system=1)
+            cpu_usage.stop(1, 1)
+
+        total = cpu_usage.total()
+        self.assertEqual(total['cpu_util_user'], 50)
+        self.assertEqual(total['cpu_util_system'], 50)
+
+    def test_restart(self):
+        """Test totals count from the restart only"""
+
+        cpu_usage = CpuUsage()
+
+        with unittest.mock.patch('py3iperf3.cpu_usage.time.monotonic',
+                                 side_effect=[0, 2, 4]), \
+             unittest.mock.patch('py3iperf3.cpu_usage.os.times') as mock_times:
+            mock_times.return_value = unittest.mock.MagicMock(user=0, system=0)
+            cpu_usage.start()
+
+            # Omitted period used a full core
+            mock_times.return_value = unittest.mock.MagicMock(user=2, system=0)
+            cpu_usage.restart(1, 0)
+
+            mock_times.return_value = unittest.mock.MagicMock(user=3, system=0)
+            cpu_usage.stop(1, 0)
+
+        self.assertEqual(cpu_usage.total()['cpu_util_user'], 50)
@@ -0,0 +1,53 @@
+"""
+Unit-test for the bottleneck diagnosis.
+"""
+import unittest
+
+from py3iperf3.diagnosis import diagnose_stream
+from py3iperf3.diagnosis import BOUND_CPU, BOUND_FLOW_CONTROL, BOUND_NETWORK
+
+def make_loop_lag(p99_ms):
+    """Loop monitor summary with the given timer delay"""
+    return {'timer_delay': {'p99_ms': p99_ms}}
+
+class TestDiagnosis(unittest.TestCase):
+    """Unit-tests of the stream classification"""
+
+    def test_flow_control(self):
+        """Test receiver window or receiver CPU limited streams"""
+
+        bottleneck, reasons = diagnose_stream(
+            {'rwnd_limited': 0.8, 'paused_fraction': 0.9}, 100, 10)
+        self.assertEqual(bottleneck, BOUND_FLOW_CONTROL)
+        self.assertEqual(reasons, ['receiver window limited 80% of busy time'])
+
+        bottleneck, reasons = diagnose_stream({}, 40, 99)
+        self.assertEqual(bottleneck, BOUND_FLOW_CONTROL)
+        self.assertEqual(reasons, ['receiver CPU 99%'])
+
+    def test_cpu(self):
+        """Test sender not keeping the send buffer full"""
+
+        bottleneck, reasons = diagnose_stream(
+            {'paused_fraction': 0.01, 'send_queue': 0.05}, 98, 30)
+        self.assertEqual(bottleneck, BOUND_CPU)
+        self.assertEqual(reasons, ['sender CPU 98%'])
+
+        bottleneck, reasons = diagnose_stream({}, 50, 30, make_loop_lag(12))
+        self.assertEqual(bottleneck, BOUND_CPU)
+        self.assertEqual(reasons, ['event loop lag 12.0 ms'])
+
+    def test_network(self):
+        """Test sender with data waiting for the network"""
+
+        bottleneck, reasons = diagnose_stream(
+            {'paused_fraction': 0.7, 'send_queue': 0.9, 'sndbuf_limited': 0.3},
+            98, 30, make_loop_lag(12))
+        self.assertEqual(bottleneck, BOUND_NETWORK)
+        self.assertEqual(reasons, ['transport paused 70% of the time',
+                                   'send buffer 90% full',
+                                   'send buffer limited 30% of busy time'])
+
+        bottleneck, reasons = diagnose_stream({}, None, None)
+        self.assertEqual(bottleneck, BOUND_NETWORK)
+        self.assertEqual(reasons, ['no sender or receiver limit found'])
@@ -0,0 +1,33 @@
+"""
+Unit-test for splitting a file between parallel streams.
+"""
+import unittest
+
+from py3iperf3.file_ranges import split_file, pack_range_header, unpack_range_header
+from py3iperf3.file_ranges import RANGE_HEADER
+
+class TestFileRanges(unittest.TestCase):
+    """Unit-tests of file ranges"""
+
+    def test_split_file(self):
+        """Test ranges cover the file without overlap"""
+
+        self.assertEqual(split_file(100, 4), [(0, 25), (25, 25), (50, 25), (75, 25)])
+        self.assertEqual(split_file(10, 3), [(0, 4), (4, 4), (8, 2)])
+
+        # Boundaries aligned to blocks
+        self.assertEqual(split_file(100, 3, align=16), [(0, 48), (48, 48), (96, 4)])
+
+        # More streams than data
+        self.assertEqual(split_file(2, 4), [(0, 1), (1, 1), (2, 0), (2, 0)])
+        self.assertEqual(split_file(0, 2), [(0, 0), (0, 0)])
+
+    def test_range_header(self):
+        """Test packing and unpacking of the range header"""
+
+        header = pack_range_header(1 << 33, 1024, 1 << 34)
+        self.assertEqual(len(header), RANGE_HEADER.size)
+        self.assertEqual(unpack_range_header(header), (1 << 33, 1024, 1 << 34))
+
+        # Data without the header
+        self.assertIsNone(unpack_range_header(bytes(RANGE_HEADER.size)))
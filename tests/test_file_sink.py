@@ -0,0 +1,117 @@
+"""
+Unit-test for the file sink of receiving streams.
+"""
+import os
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+from py3iperf3.file_sink import FileSink
+
+class TestFileSink(unittest.TestCase):
+    """Unit-tests of the coalescing file sink"""
+
+    def setUp(self):
+        handle, self.file_name = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.unlink(self.file_name)
+
+    def test_coalesced_writes(self):
+        """Test that data is written in whole chunks and flushed on close"""
+
+        sink = FileSink(self.file_name, chunk_size=16)
+        written = []
+        real_write = sink._write_at
+        sink._write_at = lambda data, position: written.append(len(data)) or real_write(
+            data, position)
+
+        expected = b''
+        for index in range(10):
+            data = bytes([65 + index]) * 5
+            sink.write(data)
+            expected += data
+        sink.write(memoryview(b'xyz'))
+        expected += b'xyz'
+        sink.close()
+
+        self.assertEqual(written, [16, 16, 16, 5])
+        with open(self.file_name, 'rb') as check_file:
+            self.assertEqual(check_file.read(), expected)
+
+    def test_backlog_time(self):
+        """Test time waiting for a slow writer is accounted"""
+
+        sink = FileSink(self.file_name, chunk_size=4, queue_depth=1)
+        writing = threading.Event()
+        release = threading.Event()
+        real_write = sink._write_at
+
+        def slow_write(data, position):
+            writing.set()
+            release.wait()
+            return real_write(data, position)
+        sink._write_at = slow_write
+
+        # Writer holds the first chunk, the second fills the queue
+        sink.write(b'1234')
+        writing.wait()
+        sink.write(b'5678')
+        self.assertEqual(sink.backlog_time, 0)
+
+        timer = threading.Timer(0.05, release.set)
+        timer.start()
+        sink.write(b'abcd')
+        sink.write(b'efgh')
+        sink.close()
+        timer.join()
+
+        self.assertGreater(sink.backlog_time, 0)
+        with open(self.file_name, 'rb') as check_file:
+            self.assertEqual(check_file.read(), b'12345678abcdefgh')
+
+    def test_write_error(self):
+        """Test that writer errors are raised on the next write"""
+
+        sink = FileSink(self.file_name, chunk_size=4)
+        sink._write_at = unittest.mock.MagicMock(side_effect=OSError('disk full'))
+
+        sink.write(b'1234')
+        sink.close()
+
+        with self.assertRaises(OSError):
+            sink.write(b'5678')
+
+    def test_write_closed(self):
+        """Test that a closed sink refuses data instead of waiting for the writer"""
+
+        sink = FileSink(self.file_name, chunk_size=4, queue_depth=1)
+        sink.write(b'1234')
+        sink.close()
+        sink.close()
+
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                sink.write(b'5678')
+
+        with open(self.file_name, 'rb') as check_file:
+            self.assertEqual(check_file.read(), b'1234')
+
+    def test_ranges(self):
+        """Test sinks of parallel streams write their own part of the file"""
+
+        sink_1 = FileSink(self.file_name, chunk_size=4)
+        sink_2 = FileSink(self.file_name, chunk_size=4)
+        sink_2.set_range(10, 10)
+        sink_1.set_range(0, 10)
+
+        for index in range(5):
+            sink_2.write(b'b' * 2)
+            sink_1.write(b'a' * 2)
+        sink_1.close()
+        sink_2.close()
+
+        with open(self.file_name, 'rb') as check_file:
+            self.assertEqual(check_file.read(), b'a' * 10 + b'b' * 10)
@@ -0,0 +1,107 @@
+"""
+Unit-test for the memory-mapped file source.
+"""
+import os
+import tempfile
+import unittest
+
+from py3iperf3.file_source import FileSource
+
+class TestFileSource(unittest.TestCase):
+    """Unit-tests of the file source"""
+
+    def setUp(self):
+        """Make a temporary file to map"""
+        file_handle, self._file_name = tempfile.mkstemp()
+        os.write(file_handle, bytes(range(25)))
+        os.close(file_handle)
+
+    def tearDown(self):
+        """Remove the temporary file"""
+        os.remove(self._file_name)
+
+    def test_blocks_until_eof(self):
+        """Test reading blocks until file EOF"""
+
+        source = FileSource(self._file_name)
+        self.assertEqual(source.size, 25)
+
+        block, offset = source.get_block(0, 10)
+        self.assertIsInstance(block, memoryview)
+        self.assertEqual(bytes(block), bytes(range(10)))
+        self.assertEqual(offset, 10)
+
+        block, offset = source.get_block(offset, 10)
+        block, offset = source.get_block(offset, 10)
+        self.assertEqual(bytes(block), bytes(range(20, 25)))
+        self.assertEqual(offset, 25)
+
+        # EOF
+        block, offset = source.get_block(offset, 10)
+        self.assertEqual(len(block), 0)
+        self.assertEqual(offset, 25)
+
+        source.close()
+
+    def test_blocks_wrap(self):
+        """Test wrapping to the start of the file on EOF"""
+
+        source = FileSource(self._file_name, wrap=True)
+
+        block, offset = source.get_block(20, 10)
+        self.assertEqual(bytes(block), bytes(range(20, 25)))
+
+        block, offset = source.get_block(offset, 10)
+        self.assertEqual(bytes(block), bytes(range(10)))
+        self.assertEqual(offset, 10)
+
+        source.close()
+
+    def test_independent_offsets(self):
+        """Test that streams sharing the source read independently"""
+
+        source = FileSource(self._file_name)
+
+        block_a, _ = source.get_block(0, 5)
+        block_b, _ = source.get_block(0, 5)
+        self.assertEqual(bytes(block_a), bytes(block_b))
+
+        # Close with blocks still referenced
+        source.close()
+        self.assertTrue(source.file.closed)
+
+    def test_empty_file(self):
+        """Test mapping an empty file"""
+
+        with open(self._file_name, 'wb'):
+            pass
+
+        source = FileSource(self._file_name)
+        block, offset = source.get_block(0, 10)
+        self.assertEqual(len(block), 0)
+        self.assertEqual(offset, 0)
+        source.close()
+
+    def test_blocks_in_range(self):
+        """Test reading blocks limited to a range of the file"""
+
+        source = FileSource(self._file_name)
+
+        block, offset = source.get_block(10, 4, 10, 16)
+        self.assertEqual(bytes(block), bytes(range(10, 14)))
+
+        block, offset = source.get_block(offset, 4, 10, 16)
+        self.assertEqual(bytes(block), bytes(range(14, 16)))
+        self.assertEqual(offset, 16)
+
+        # End of the range
+        block, offset = source.get_block(offset, 4, 10, 16)
+        self.assertEqual(len(block), 0)
+
+        source.close()
+
+        # Wrapping returns to the start of the range
+        source = FileSource(self._file_name, wrap=True)
+        block, offset = source.get_block(16, 4, 10, 16)
+        self.assertEqual(bytes(block), bytes(range(10, 14)))
+        source.close()
@@ -0,0 +1,98 @@
+"""
+Unit-test for the JSON output.
+"""
+import io
+import json
+import unittest
+
+from py3iperf3.json_output import JsonReport, make_interval, final_stream_entry, sum_entry
+
+def udp_receiver_stats(socket_id, packets, errors, jitter):
+    """Interval stats of a UDP receiving stream"""
+
+    return {
+        'socket': socket_id, 'start': 1, 'end': 2, 'seconds': 1,
+        'bytes': packets * 100, 'bits_per_second': packets * 800,
+        'omitted': False, 'packets': packets, 'errors': errors, 'jitter': jitter,
+    }
+
+class TestJsonOutput(unittest.TestCase):
+    """Unit-tests of the JSON output"""
+
+    def test_udp_interval(self):
+        """Test UDP loss and jitter fields in intervals"""
+
+        interval = make_interval([
+            udp_receiver_stats(5, 90, 10, 0.002),
+            udp_receiver_stats(6, 100, 0, 0.004),
+        ], False)
+
+        stream = interval['streams'][0]
+        self.assertEqual(stream['lost_packets'], 10)
+        self.assertAlmostEqual(stream['jitter_ms'], 2)
+        self.assertAlmostEqual(stream['lost_percent'], 10)
+        self.assertFalse(stream['sender'])
+        self.assertNotIn('jitter', stream)
+
+        self.assertEqual(interval['sum']['bytes'], 19000)
+        self.assertEqual(interval['sum']['packets'], 190)
+        self.assertEqual(interval['sum']['lost_packets'], 10)
+        self.assertAlmostEqual(interval['sum']['jitter_ms'], 3)
+
+    def test_final_entries(self):
+        """Test end entries of TCP and UDP streams"""
+
+        tcp_sender = final_stream_entry(
+            {'bytes': 2000, 'retransmits': 3, 'max_rtt': 10}, 5, 2, True, False)
+        tcp_receiver = final_stream_entry(
+            {'bytes': 1500, 'retransmits': -1}, 5, 2, False, False)
+        self.assertEqual(tcp_sender['bits_per_second'], 8000)
+        self.assertEqual(tcp_sender['retransmits'], 3)
+        self.assertEqual(tcp_sender['max_rtt'], 10)
+        self.assertNotIn('retransmits', tcp_receiver)
+
+        sums = sum_entry([tcp_sender, tcp_sender], True)
+        self.assertEqual(sums['bytes'], 4000)
+        self.assertEqual(sums['retransmits'], 6)
+
+        udp_receiver = final_stream_entry(
+            {'bytes': 1000, 'packets': 75, 'errors': 25, 'jitter': 0.001,
+             'out_of_order': 2, 'duplicates': 1}, 5, 1, False, True)
+        self.assertEqual(udp_receiver['lost_percent'], 25)
+        self.assertAlmostEqual(udp_receiver['jitter_ms'], 1)
+        self.assertEqual(udp_receiver['out_of_order'], 2)
+        self.assertEqual(udp_receiver['duplicates'], 1)
+
+    def test_document(self):
+        """Test a single document is written at the end"""
+
+        output = io.StringIO()
+        report = JsonReport(output=output)
+        report.start({'version': 'x'})
+        report.interval({'sum': 1})
+        report.interval({'sum': 2})
+        self.assertEqual(output.getvalue(), '')
+
+        report.end({'sum_sent': 3})
+        self.assertEqual(json.loads(output.getvalue()), {
+            'start': {'version': 'x'},
+            'intervals': [{'sum': 1}, {'sum': 2}],
+            'end': {'sum_sent': 3},
+        })
+
+    def test_stream(self):
+        """Test a JSON line is written for every part as it comes"""
+
+        output = io.StringIO()
+        report = JsonReport(stream_mode=True, output=output)
+        report.start({'version': 'x'})
+        report.interval({'sum': 1})
+        self.assertEqual(len(output.getvalue().splitlines()), 2)
+
+        report.end({'sum_sent': 3})
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(lines, [
+            {'event': 'start', 'data': {'version': 'x'}},
+            {'event': 'interval', 'data': {'sum': 1}},
+            {'event': 'end', 'data': {'sum_sent': 3}},
+        ])
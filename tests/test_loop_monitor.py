@@ -0,0 +1,84 @@
+"""
+Unit-test for the event loop monitor.
+"""
+import unittest
+import unittest.mock
+
+from py3iperf3.loop_monitor import LatencyHistogram, LoopMonitor
+
+class TestLoopMonitor(unittest.TestCase):
+    """Unit-tests of the loop lag histograms and probes"""
+
+    def test_histogram(self):
+        """Test log2 buckets, percentiles and merging"""
+
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.percentile(99), 0)
+
+        for _ in range(98):
+            histogram.add(0.000010)
+        histogram.add(0.003)
+        histogram.add(0.5)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.max, 0.5)
+
+        # Upper bound of the bucket holding the percentile
+        self.assertEqual(histogram.percentile(50), 0.000016)
+        self.assertEqual(histogram.percentile(99), 0.004096)
+        self.assertEqual(histogram.percentile(100), 0.5)
+
+        summary = histogram.as_dict()
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['max_ms'], 500)
+        self.assertAlmostEqual(summary['p90_ms'], 0.016)
+
+        other = LatencyHistogram()
+        other.add(1)
+        other.merge(histogram)
+        self.assertEqual(other.count, 101)
+        self.assertEqual(other.max, 1)
+
+    @unittest.mock.patch('py3iperf3.loop_monitor.time.perf_counter')
+    def test_loop_probes(self, mock_clock):
+        """Test probes measure timer and ready queue delays of the loop"""
+
+        mock_loop = unittest.mock.MagicMock()
+        mock_loop.time.return_value = 10
+        monitor = LoopMonitor(mock_loop, probe_period=0.01)
+
+        monitor.start()
+        self.assertEqual(mock_loop.call_at.call_args[0][0], 10.01)
+
+        # Timer fires 40 ms late, the ready queue callback waits 5 ms
+        mock_loop.time.return_value = 10.05
+        mock_clock.return_value = 100
+        mock_loop.call_at.call_args[0][1]()
+        callback, scheduled = mock_loop.call_soon.call_args[0]
+
+        mock_clock.return_value = 100.005
+        callback(scheduled)
+        self.assertEqual(mock_loop.call_at.call_args[0][0], 10.06)
+
+        monitor.send_time(0.002)
+        monitor.writing_paused()
+
+        interval = monitor.interval()
+        self.assertEqual(interval['timer_delay']['count'], 1)
+        self.assertAlmostEqual(interval['timer_delay']['max_ms'], 40)
+        self.assertAlmostEqual(interval['callback_delay']['max_ms'], 5)
+        self.assertEqual(interval['send_time']['count'], 1)
+        self.assertEqual(interval['pauses'], 1)
+
+        # Next interval starts empty, totals keep everything
+        self.assertEqual(monitor.interval()['pauses'], 0)
+        self.assertEqual(monitor.total()['pauses'], 1)
+        self.assertEqual(monitor.total()['timer_delay']['count'], 1)
+
+        # Omitted intervals are dropped from the totals
+        monitor.reset_total()
+        self.assertEqual(monitor.total()['pauses'], 0)
+        self.assertEqual(monitor.total()['timer_delay']['count'], 0)
+
+        monitor.stop()
+        assert mock_loop.call_at.return_value.cancel.called
@@ -0,0 +1,50 @@
+"""
+Unit-test for the token bucket pacer.
+"""
+import unittest
+
+from py3iperf3.pacing import TokenBucket
+
+class FakeClock(object):
+    """Manually advanced clock"""
+
+    def __init__(self):
+        self.time = 100.0
+
+    def __call__(self):
+        return self.time
+
+class TestTokenBucket(unittest.TestCase):
+    """Unit-tests of the token bucket"""
+
+    def test_burst_then_rate(self):
+        """Test that a full bucket is drained and refilled at the rate"""
+
+        clock = FakeClock()
+        bucket = TokenBucket(8000, 3000, clock=clock)   # 1000 B/s
+        self.assertEqual(bucket.rate, 8000)
+
+        # Full bucket allows a burst
+        for _ in range(3):
+            self.assertTrue(bucket.consume(1000))
+        self.assertFalse(bucket.consume(1000))
+        self.assertAlmostEqual(bucket.delay(1000), 1.0)
+
+        clock.time += 0.5
+        self.assertFalse(bucket.consume(1000))
+        self.assertAlmostEqual(bucket.delay(1000), 0.5)
+
+        clock.time += 0.5
+        self.assertTrue(bucket.consume(1000))
+        self.assertFalse(bucket.consume(1000))
+
+    def test_bucket_size_limit(self):
+        """Test that idle time does not add more tokens than bucket size"""
+
+        clock = FakeClock()
+        bucket = TokenBucket(8000, 1000, clock=clock)
+        clock.time += 60
+
+        self.assertEqual(bucket.delay(1000), 0)
+        self.assertTrue(bucket.consume(1000))
+        self.assertFalse(bucket.consume(1000))
@@ -0,0 +1,101 @@
+"""
+Unit-test for the shared payload pool.
+"""
+import unittest
+import zlib
+
+from py3iperf3.payload_pool import get_payload_ring, clear_payload_pool
+from py3iperf3.payload_pool import PATTERN_RANDOM, PATTERN_ZEROS
+from py3iperf3.payload_pool import PATTERN_REPEAT, PATTERN_COMPRESSIBLE
+from py3iperf3.payload_pool import RING_BLOCKS, RING_MAX_BYTES, POOL_MAX_BYTES
+
+class TestPayloadPool(unittest.TestCase):
+    """Unit-tests of the payload pool"""
+
+    def tearDown(self):
+        clear_payload_pool()
+
+    def test_shared_blocks(self):
+        """Test rings are made once per size and pattern"""
+
+        ring = get_payload_ring(1000)
+        self.assertEqual(len(ring), RING_BLOCKS)
+        self.assertIs(get_payload_ring(1000, PATTERN_RANDOM), ring)
+
+        # Distinct read-only blocks
+        self.assertEqual(len({bytes(block) for block in ring}), RING_BLOCKS)
+        for block in ring:
+            self.assertEqual(len(block), 1000)
+            self.assertTrue(block.readonly)
+
+        with self.assertRaises(TypeError):
+            ring[0][0] = 1
+
+        # Different key, different ring
+        self.assertIsNot(get_payload_ring(2000), ring)
+
+        # A new ring after clearing, old one stays valid
+        clear_payload_pool()
+        self.assertIsNot(get_payload_ring(1000), ring)
+        self.assertEqual(len(ring[0]), 1000)
+
+    def test_ring_memory(self):
+        """Test large blocks get fewer blocks in the ring"""
+
+        ring = get_payload_ring(RING_MAX_BYTES // 2, PATTERN_ZEROS)
+        self.assertEqual(len(ring), 1)
+
+        ring = get_payload_ring(RING_MAX_BYTES // 4)
+        self.assertEqual(len(ring), 4)
+
+    def test_pool_bound(self):
+        """Test least recently used rings are dropped from a full pool"""
+
+        block_size = POOL_MAX_BYTES // RING_BLOCKS // 3
+        first = get_payload_ring(block_size, PATTERN_ZEROS)
+        ring1 = get_payload_ring(block_size)
+        ring2 = get_payload_ring(block_size + 1)
+
+        # Use the first ring, so that the second one is the oldest
+        self.assertIs(get_payload_ring(block_size, PATTERN_ZEROS), first)
+        get_payload_ring(block_size + 2)
+
+        self.assertIs(get_payload_ring(block_size, PATTERN_ZEROS), first)
+        self.assertIs(get_payload_ring(block_size + 1), ring2)
+        self.assertIsNot(get_payload_ring(block_size), ring1)
+
+    def test_zeros(self):
+        """Test zero payload"""
+
+        ring = get_payload_ring(100, PATTERN_ZEROS)
+        self.assertEqual(ring, (bytes(100),))
+
+    def test_repeat(self):
+        """Test repeated pattern shifted by one byte per block"""
+
+        ring = get_payload_ring(8, PATTERN_REPEAT, b'abc')
+        self.assertEqual([bytes(block) for block in ring],
+                         [b'abcabcab', b'bcabcabc', b'cabcabca'])
+
+        ring = get_payload_ring(12, PATTERN_REPEAT)
+        self.assertEqual(bytes(ring[1]), b'123456789012')
+
+    def test_compressible(self):
+        """Test blocks compress by about the requested ratio"""
+
+        for ratio in (1, 2, 5):
+            ring = get_payload_ring(64 * 1024, PATTERN_COMPRESSIBLE, ratio)
+            for block in ring[:2]:
+                achieved = len(block) / len(zlib.compress(block))
+                self.assertAlmostEqual(achieved, ratio, delta=0.1 * ratio)
+
+        self.assertNotEqual(bytes(ring[0]), bytes(ring[1]))
+
+        with self.assertRaises(ValueError):
+            get_payload_ring(100, PATTERN_COMPRESSIBLE, 0.5)
+
+    def test_unknown_pattern(self):
+        """Test unknown patterns are refused"""
+
+        with self.assertRaises(ValueError):
+            get_payload_ring(10, 'foo')
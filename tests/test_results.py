@@ -0,0 +1,43 @@
+"""
+Unit-test for the typed test results.
+"""
+import unittest
+
+from py3iperf3.results import TransferResult, transfer_from_stats, sum_transfers
+
+class TestResults(unittest.TestCase):
+    """Unit-tests of the test results"""
+
+    def test_transfer_from_stats(self):
+        """Test transfers of TCP and UDP streams"""
+
+        stats = {'bytes': 1000, 'retransmits': 3, 'packets': 0, 'errors': 0, 'jitter': 0}
+        transfer = transfer_from_stats(stats, 2, True, False)
+        self.assertEqual(transfer.bits_per_second, 4000)
+        self.assertEqual(transfer.retransmits, 3)
+        self.assertIsNone(transfer.jitter)
+
+        # Receiver does not know retransmits
+        transfer = transfer_from_stats(dict(stats, retransmits=-1), 2, False, False)
+        self.assertIsNone(transfer.retransmits)
+
+        stats = {'bytes': 1000, 'retransmits': -1, 'packets': 9, 'errors': 1, 'jitter': 0.002}
+        transfer = transfer_from_stats(stats, 2, False, True)
+        self.assertEqual((transfer.packets, transfer.errors, transfer.jitter), (9, 1, 0.002))
+
+        transfer = transfer_from_stats(stats, 2, True, True)
+        self.assertEqual(transfer.packets, 9)
+        self.assertIsNone(transfer.errors)
+
+    def test_sum_transfers(self):
+        """Test summing transfers of streams"""
+
+        total = sum_transfers([TransferResult(100, 1, retransmits=1, jitter=0.002),
+                               TransferResult(300, 1, jitter=0.004)], 1)
+        self.assertEqual(total.bytes, 400)
+        self.assertEqual(total.bits_per_second, 3200)
+        self.assertEqual(total.retransmits, 1)
+        self.assertAlmostEqual(total.jitter, 0.003)
+        self.assertIsNone(total.packets)
+
+        self.assertEqual(sum_transfers([], 0).bits_per_second, 0)
@@ -0,0 +1,83 @@
+"""
+Unit-test for the round-robin send scheduler.
+"""
+import unittest
+import unittest.mock
+
+from py3iperf3.send_scheduler import SendScheduler
+
+class FakeStream(object):
+    """Stream sending a given number of turns"""
+
+    def __init__(self, scheduler, name, turns, log):
+        self._scheduler = scheduler
+        self._name = name
+        self._turns = turns
+        self._log = log
+        self.handle = None
+
+    def _try_sending(self):
+        self._log.append(self._name)
+        self._turns -= 1
+        if self._turns:
+            self.handle = self._scheduler.add(self)
+
+class TestSendScheduler(unittest.TestCase):
+    """Unit-tests of the send scheduler"""
+
+    def _run_ticks(self, scheduler, mock_loop):
+        """Run scheduled ticks until the scheduler is idle. Return number of ticks."""
+
+        ticks = 0
+        while mock_loop.call_soon.call_count > ticks:
+            ticks += 1
+            mock_loop.call_soon.call_args[0][0]()
+
+        return ticks
+
+    def test_round_robin(self):
+        """Test streams get turns in order from a single callback per tick"""
+
+        mock_loop = unittest.mock.MagicMock()
+        scheduler = SendScheduler(mock_loop)
+        log = []
+
+        streams = [FakeStream(scheduler, name, turns, log)
+                   for name, turns in (('a', 3), ('b', 1), ('c', 2))]
+        for stream in streams:
+            stream.handle = scheduler.add(stream)
+
+        # Adding twice keeps a single entry
+        self.assertIs(scheduler.add(streams[0]), streams[0].handle)
+        self.assertEqual(len(scheduler), 3)
+
+        ticks = self._run_ticks(scheduler, mock_loop)
+        self.assertEqual(ticks, 3)
+        self.assertEqual(log, ['a', 'b', 'c', 'a', 'c', 'a'])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_cancel(self):
+        """Test cancelled streams are dropped from the ready set"""
+
+        mock_loop = unittest.mock.MagicMock()
+        scheduler = SendScheduler(mock_loop)
+        log = []
+
+        stream_a = FakeStream(scheduler, 'a', 5, log)
+        stream_b = FakeStream(scheduler, 'b', 5, log)
+        stream_a.handle = scheduler.add(stream_a)
+        stream_b.handle = scheduler.add(stream_b)
+
+        # Paused before its turn
+        stream_b.handle.cancel()
+        self.assertEqual(len(scheduler), 1)
+        stream_b.handle.cancel()
+
+        self._run_ticks(scheduler, mock_loop)
+        self.assertEqual(log, ['a'] * 5)
+
+        # Re-added after being resumed
+        stream_b.handle = scheduler.add(stream_b)
+        scheduler.close()
+        self.assertEqual(len(scheduler), 0)
+        self.assertTrue(mock_loop.call_soon.return_value.cancel.called)
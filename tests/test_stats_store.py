@@ -0,0 +1,100 @@
+"""
+Unit-test for the interval stats store.
+"""
+import unittest
+
+from py3iperf3.stats_store import StatsStore
+
+def make_stats(socket_id, index, num_bytes, **extra):
+    """Interval stats dict as made by the streams"""
+
+    stats = {
+        'socket': socket_id,
+        'start': float(index),
+        'end': float(index + 1),
+        'seconds': 1.0,
+        'bytes': num_bytes,
+        'bits_per_second': num_bytes * 8,
+        'omitted': False,
+        'errors': 0,
+    }
+    stats.update(extra)
+
+    return stats
+
+class TestStatsStore(unittest.TestCase):
+    """Unit-tests of the stats store"""
+
+    def test_records_and_totals(self):
+        """Test records are kept per stream with running totals"""
+
+        store = StatsStore()
+        store.append(1, make_stats(5, 0, 100, retransmits=2, snd_cwnd=1000, rtt=50))
+        store.append(2, make_stats(6, 0, 10, packets=3, errors=1, jitter=0.5))
+        store.append(1, make_stats(5, 1, 300, retransmits=0, snd_cwnd=2000, rtt=70))
+
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store[-1].bytes, 300)
+        self.assertEqual(store[-1].bits_per_second, 2400)
+        self.assertEqual([record.start for record in store.records(1)], [0, 1])
+
+        # Only values the stream has are in the dict
+        self.assertEqual(store[0].as_dict(), make_stats(
+            5, 0, 100, retransmits=2, snd_cwnd=1000, rtt=50))
+        self.assertEqual(store[1].as_dict(), make_stats(
+            6, 0, 10, packets=3, errors=1, jitter=0.5))
+
+        totals = store.totals(1)
+        self.assertEqual(totals.intervals, 2)
+        self.assertEqual(totals.bytes, 400)
+        self.assertEqual(totals.retransmits, 2)
+        self.assertEqual(store.totals(2).packets, 3)
+        self.assertEqual(store.totals(2).errors, 1)
+        self.assertEqual(store.totals(3).bytes, 0)
+
+        with self.assertRaises(IndexError):
+            store[3]
+
+    def test_omitted_not_in_totals(self):
+        """Test omitted intervals are stored but not counted"""
+
+        store = StatsStore()
+        store.append(1, make_stats(5, 0, 100, omitted=True))
+        store.append(1, make_stats(5, 1, 200))
+
+        self.assertEqual(len(store), 2)
+        self.assertTrue(store[0].as_dict()['omitted'])
+        self.assertEqual(store.totals(1).bytes, 200)
+        self.assertEqual(store.totals(1).intervals, 1)
+
+    def test_downsampling(self):
+        """Test bounded number of records with coarser old intervals"""
+
+        store = StatsStore(retention=16)
+        for index in range(1000):
+            store.append(1, make_stats(5, index, 100, retransmits=1, rtt=10))
+            store.append(2, make_stats(6, index, 10, packets=1, jitter=0.25))
+
+        self.assertLessEqual(len(store), 16)
+        self.assertEqual(store.totals(1).bytes, 100000)
+        self.assertEqual(store.totals(2).packets, 1000)
+
+        for stream_id, num_bytes in ((1, 100), (2, 10)):
+            records = list(store.records(stream_id))
+
+            # Records still cover the whole test, in order and without gaps
+            self.assertEqual(records[0].start, 0)
+            self.assertEqual(records[-1].end, 1000)
+            for previous, record in zip(records, records[1:]):
+                self.assertEqual(previous.end, record.start)
+
+            # Merged records keep sums and means
+            self.assertEqual(sum(record.bytes for record in records), 1000 * num_bytes)
+            self.assertGreater(records[0].seconds, records[-1].seconds)
+            for record in records:
+                self.assertEqual(record.bits_per_second, num_bytes * 8)
+
+        self.assertEqual(sum(record.retransmits for record in store.records(1)), 1000)
+        self.assertEqual({record.rtt for record in store.records(1)}, {10})
+        self.assertEqual({record.jitter for record in store.records(2)}, {0.25})
+        self.assertEqual({record.retransmits for record in store.records(2)}, {-1})
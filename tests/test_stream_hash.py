@@ -0,0 +1,47 @@
+"""
+Unit-test for the stream integrity hash.
+"""
+import hashlib
+import unittest
+
+from py3iperf3.stream_hash import StreamHash, compare_digests
+
+class TestStreamHash(unittest.TestCase):
+    """Unit-tests of the stream hash"""
+
+    def test_digest(self):
+        """Test the digest equals hashing all data at once"""
+
+        data = bytes(range(256)) * 100
+        stream_hash = StreamHash(queue_depth=2)
+
+        view = memoryview(data).toreadonly()
+        for offset in range(0, len(data), 1000):
+            stream_hash.update(view[offset:offset + 1000])
+
+        self.assertEqual(stream_hash.algorithm, 'sha256')
+        self.assertEqual(stream_hash.finish(), hashlib.sha256(data).hexdigest())
+        self.assertEqual(stream_hash.num_bytes, len(data))
+
+        # Data after the finish is not hashed
+        stream_hash.update(b'late')
+        self.assertEqual(stream_hash.finish(), hashlib.sha256(data).hexdigest())
+        self.assertEqual(stream_hash.num_bytes, len(data))
+
+    def test_empty(self):
+        """Test the digest of a stream without data"""
+
+        stream_hash = StreamHash()
+        self.assertEqual(stream_hash.finish(), hashlib.sha256().hexdigest())
+        self.assertEqual(stream_hash.num_bytes, 0)
+
+    def test_compare_digests(self):
+        """Test comparing local and remote digests"""
+
+        local = {'digest': 'ab', 'digest_bytes': 10}
+
+        self.assertEqual(compare_digests(local, {'digest': 'ab', 'digest_bytes': 10}), 'ok')
+        self.assertEqual(compare_digests(local, {'digest': 'cd', 'digest_bytes': 10}), 'mismatch')
+        self.assertEqual(compare_digests(local, {'digest': 'cd', 'digest_bytes': 8}), 'incomplete')
+        self.assertEqual(compare_digests(local, {'bytes': 10}), 'unknown')
+        self.assertEqual(compare_digests({}, local), 'unknown')
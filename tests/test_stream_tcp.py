@@ -1,11 +1,16 @@
 """
 Unittest for TCP data stream
 """
+import asyncio
+import hashlib
+import tempfile
 import unittest
 import unittest.mock
 import socket
 
 from py3iperf3.data_stream_tcp import TestStreamTcp
+from py3iperf3.file_ranges import pack_range_header, unpack_range_header
+from py3iperf3.file_source import FileSource
 
 class TestTcpStream(unittest.TestCase):
     """
@@ -21,6 +26,7 @@ class TestTcpStream(unittest.TestCase):
         mock_loop = unittest.mock.MagicMock()
         mock_test = unittest.mock.MagicMock()
         mock_test.file = None
+        mock_test.sender = False
         params = {
             'loop': mock_loop,
             'test': mock_test,
@@ -54,6 +60,7 @@ class TestTcpStream(unittest.TestCase):
         mock_test = unittest.mock.MagicMock()
         mock_test.cookie = 'cookie'
         mock_test.file = None
+        mock_test.sender = False
         params = {
             'loop': mock_loop,
             'test': mock_test,
@@ -78,6 +85,7 @@ class TestTcpStream(unittest.TestCase):
         mock_loop = unittest.mock.MagicMock()
         mock_test = unittest.mock.MagicMock()
         mock_test.file = None
+        mock_test.sender = False
         params = {
             'loop': mock_loop,
             'test': mock_test,
@@ -104,3 +112,465 @@ class TestTcpStream(unittest.TestCase):
         tcp_stream.resume_writing()
         self.assertFalse(tcp_stream._paused)
         assert mock_loop.call_soon.called_with(tcp_stream._try_sending)
+
+    def _make_sender_stream(self, **test_attrs):
+        """
+        Make a sending stream linked with mock test and proto.
+        """
+
+        mock_loop = unittest.mock.MagicMock()
+        mock_test = unittest.mock.MagicMock()
+        mock_test.file = None
+        mock_test.role = 'c'
+        mock_test.sender = True
+        mock_test.block_size = 10
+        mock_test.send_budget = 100
+        mock_test.test_type = 't'
+        mock_test.bandwidth = 0
+        mock_test.omitting = False
+        mock_test.send_scheduler = None
+        mock_test.payload = 'random'
+        mock_test.payload_param = None
+        mock_test.file_ranges = False
+        mock_test.integrity_hash = False
+        for attr, value in test_attrs.items():
+            setattr(mock_test, attr, value)
+
+        tcp_stream = TestStreamTcp(loop=mock_loop, test=mock_test, stream_id=1)
+        tcp_stream._test_protocol = unittest.mock.MagicMock()
+        tcp_stream._test_protocol.get_send_queue.return_value = None
+
+        return tcp_stream
+
+    def test_batched_sending_budget(self):
+        """
+        Test that a single call sends blocks until the budget is used.
+        """
+
+        tcp_stream = self._make_sender_stream()
+        tcp_stream._try_sending()
+
+        self.assertEqual(tcp_stream._test_protocol.send_data.call_count, 10)
+        self.assertEqual(tcp_stream._bytes_tx_this_interval, 100)
+        assert tcp_stream._loop.call_soon.called
+        self.assertIsNotNone(tcp_stream._sending_handle)
+
+    def test_batched_sending_paused(self):
+        """
+        Test that sending stops once transport pauses writing.
+        """
+
+        tcp_stream = self._make_sender_stream()
+        tcp_stream._test_protocol.send_data.side_effect = (
+            lambda _: tcp_stream.pause_writing())
+        tcp_stream._try_sending()
+
+        self.assertEqual(tcp_stream._test_protocol.send_data.call_count, 1)
+        assert not tcp_stream._loop.call_soon.called
+        self.assertIsNone(tcp_stream._sending_handle)
+
+    def test_shared_payload(self):
+        """
+        Test that senders of the same block size share a read-only payload
+        and send consecutive blocks of its ring.
+        """
+
+        stream_1 = self._make_sender_stream()
+        stream_2 = self._make_sender_stream()
+
+        ring = stream_1._data_source_sink
+        self.assertIs(ring, stream_2._data_source_sink)
+
+        self.assertIs(stream_1._get_block(), ring[0])
+        self.assertIs(stream_1._get_block(), ring[1])
+        self.assertIs(stream_2._get_block(), ring[0])
+        self.assertTrue(ring[0].readonly)
+        self.assertEqual(len(ring[0]), 10)
+
+    def test_batched_sending_scheduler(self):
+        """
+        Test that the send scheduler gives turns instead of the loop.
+        """
+
+        scheduler = unittest.mock.MagicMock()
+        tcp_stream = self._make_sender_stream(send_scheduler=scheduler)
+        tcp_stream._try_sending()
+
+        assert not tcp_stream._loop.call_soon.called
+        scheduler.add.assert_called_once_with(tcp_stream)
+        self.assertIs(tcp_stream._sending_handle, scheduler.add.return_value)
+
+        # Paused stream leaves the ready set until resumed
+        tcp_stream.pause_writing()
+        self.assertTrue(scheduler.add.return_value.cancel.called)
+        self.assertIsNone(tcp_stream._sending_handle)
+
+        tcp_stream._time_stream_start = 1
+        tcp_stream.resume_writing()
+        self.assertEqual(scheduler.add.call_count, 2)
+
+    def test_sending_monitored(self):
+        """
+        Test that sending callbacks and pauses are reported to the loop monitor.
+        """
+
+        monitor = unittest.mock.MagicMock()
+        tcp_stream = self._make_sender_stream(loop_monitor=monitor)
+        tcp_stream._try_sending()
+
+        self.assertEqual(monitor.send_time.call_count, 1)
+        self.assertGreaterEqual(monitor.send_time.call_args[0][0], 0)
+
+        tcp_stream.pause_writing()
+        self.assertEqual(monitor.writing_paused.call_count, 1)
+
+    def test_batched_sending_blockcount(self):
+        """
+        Test that block count gating is kept when sending in batches.
+        """
+
+        tcp_stream = self._make_sender_stream(test_type='b', _blocks_remaining=3)
+        tcp_stream._try_sending()
+
+        self.assertEqual(tcp_stream._test_protocol.send_data.call_count, 3)
+        self.assertTrue(tcp_stream.done)
+        assert tcp_stream._test.sendable_data_depleted.called
+        self.assertIsNone(tcp_stream._sending_handle)
+
+    def test_batched_sending_bytes(self):
+        """
+        Test that bytes gating is kept when sending in batches.
+        """
+
+        tcp_stream = self._make_sender_stream(test_type='s', _bytes_remaining=25)
+        tcp_stream._try_sending()
+
+        self.assertEqual(tcp_stream._test_protocol.send_data.call_count, 3)
+        self.assertEqual(tcp_stream._test._bytes_remaining, 0)
+        self.assertTrue(tcp_stream.done)
+        assert tcp_stream._test.sendable_data_depleted.called
+
+    def test_zerocopy_sending(self):
+        """
+        Test sendfile based sending and its byte accounting.
+        """
+
+        with tempfile.NamedTemporaryFile() as tmp_file:
+            tmp_file.write(b'x' * 25)
+            tmp_file.flush()
+
+            loop = asyncio.new_event_loop()
+            file_source = FileSource(tmp_file.name)
+            tcp_stream = self._make_sender_stream(
+                file=tmp_file.name, file_source=file_source, zerocopy=True,
+                integrity_hash=True)
+            tcp_stream._loop = loop
+
+            sizes = iter([10, 10, 5, 0])
+            tcp_stream._test_protocol.send_file = unittest.mock.AsyncMock(
+                side_effect=lambda *_: next(sizes))
+
+            tcp_stream.start_stream()
+            loop.run_until_complete(tcp_stream._sendfile_task)
+            loop.close()
+
+            self.assertEqual(tcp_stream._test_protocol.send_file.call_count, 4)
+            self.assertEqual(tcp_stream._bytes_tx_this_interval, 25)
+            self.assertEqual(tcp_stream._blocks_tx_this_interval, 3)
+            self.assertEqual(tcp_stream._file_offset, 25)
+            self.assertTrue(tcp_stream.done)
+            assert tcp_stream._test.sendable_data_depleted.called
+            assert not tcp_stream._test_protocol.send_data.called
+
+            # Data sent by sendfile is hashed from the mapping
+            self.assertEqual(tcp_stream.get_final_stats()['digest'],
+                             hashlib.sha256(b'x' * 25).hexdigest())
+
+            tcp_stream.stop_stream()
+            file_source.close()
+
+    def test_zerocopy_fallback(self):
+        """
+        Test falling back to copying when sendfile is not available.
+        """
+
+        with tempfile.NamedTemporaryFile() as tmp_file:
+            tmp_file.write(b'x' * 25)
+            tmp_file.flush()
+
+            loop = asyncio.new_event_loop()
+            file_source = FileSource(tmp_file.name)
+            tcp_stream = self._make_sender_stream(
+                file=tmp_file.name, file_source=file_source, zerocopy=True)
+            tcp_stream._loop = loop
+            tcp_stream._test_protocol.send_file = unittest.mock.AsyncMock(
+                side_effect=asyncio.SendfileNotAvailableError)
+
+            tcp_stream.start_stream()
+            loop.run_until_complete(tcp_stream._sendfile_task)
+            loop.run_until_complete(asyncio.sleep(0))
+            loop.close()
+
+            # The whole file is sent by copying
+            sent = b''.join(x[0][0] for x in tcp_stream._test_protocol.send_data.call_args_list)
+            self.assertEqual(sent, b'x' * 25)
+            self.assertEqual(tcp_stream._bytes_tx_this_interval, 25)
+            self.assertIsNone(tcp_stream._sendfile_task)
+            self.assertTrue(tcp_stream.done)
+
+            tcp_stream.stop_stream()
+            file_source.close()
+
+    def test_file_range_sending(self):
+        """
+        Test a stream sending its own range of the file after the range header.
+        """
+
+        with tempfile.NamedTemporaryFile() as tmp_file:
+            tmp_file.write(bytes(range(25)))
+            tmp_file.flush()
+
+            file_source = FileSource(tmp_file.name)
+            tcp_stream = self._make_sender_stream(
+                file=tmp_file.name, file_source=file_source, file_ranges=True, zerocopy=False,
+                send_budget=1000, all_streams_done=False,
+                next_file_range=unittest.mock.MagicMock(return_value=(10, 12)))
+            tcp_stream._loop = unittest.mock.MagicMock()
+
+            tcp_stream.start_stream()
+            tcp_stream._try_sending()
+
+            sent = [bytes(x[0][0]) for x in tcp_stream._test_protocol.send_data.call_args_list]
+            self.assertEqual(unpack_range_header(sent[0]), (10, 12, 25))
+            self.assertEqual(b''.join(sent[1:]), bytes(range(10, 22)))
+            self.assertTrue(tcp_stream.done)
+
+            # Other streams are still sending their ranges
+            assert not tcp_stream._test.sendable_data_depleted.called
+
+            tcp_stream.stop_stream()
+            file_source.close()
+
+    def test_file_range_receiving(self):
+        """
+        Test writing data at the range given by the header.
+        """
+        mock_test = unittest.mock.MagicMock()
+        mock_test.role = 'c'
+        mock_test.sender = False
+        mock_test.block_size = 10
+        mock_test.omitting = False
+        mock_test.send_scheduler = None
+        mock_test.payload = 'random'
+        mock_test.payload_param = None
+        mock_test.file_ranges = True
+        mock_test.integrity_hash = False
+
+        with tempfile.NamedTemporaryFile() as rx_file:
+            mock_test.file = rx_file.name
+            tcp_stream = TestStreamTcp(loop=unittest.mock.MagicMock(), test=mock_test, stream_id=1)
+
+            # Header split between reads
+            header = pack_range_header(4, 4, 8)
+            tcp_stream.data_received(header[:5])
+            tcp_stream.data_received(header[5:] + b'ab')
+            tcp_stream.data_received(b'cd')
+            tcp_stream._data_source_sink.close()
+
+            self.assertEqual(tcp_stream._bytes_rx_this_interval, 4)
+            with open(rx_file.name, 'rb') as check_file:
+                self.assertEqual(check_file.read(), b'\x00' * 4 + b'abcd')
+
+    def test_integrity_hash(self):
+        """
+        Test hashing of the sent and the received data.
+        """
+        tcp_stream = self._make_sender_stream(
+            integrity_hash=True, test_type='b', _blocks_remaining=3)
+        tcp_stream._test.stats_store.totals.return_value = unittest.mock.MagicMock(bytes=30)
+
+        tcp_stream._try_sending()
+
+        sent = b''.join(bytes(x[0][0]) for x in tcp_stream._test_protocol.send_data.call_args_list)
+        stats = tcp_stream.get_final_stats()
+        self.assertEqual(stats['digest'], hashlib.sha256(sent).hexdigest())
+        self.assertEqual(stats['digest_bytes'], 30)
+
+        # Receiving side
+        tcp_stream._test.sender = False
+        rx_stream = TestStreamTcp(loop=unittest.mock.MagicMock(), test=tcp_stream._test, stream_id=1)
+        buffer = memoryview(bytearray(sent))
+        rx_stream.data_received(sent[:10])
+        rx_stream.buffer_received(buffer[10:], 20)
+        buffer[10:] = bytes(20)
+
+        stats = rx_stream.get_final_stats()
+        self.assertEqual(stats['digest'], hashlib.sha256(sent).hexdigest())
+
+    def test_integrity_hash_buffered_range(self):
+        """
+        Test that data after the range header is copied out of the rx buffer.
+        """
+        mock_test = unittest.mock.MagicMock()
+        mock_test.file = None
+        mock_test.sender = False
+        mock_test.block_size = 10
+        mock_test.send_scheduler = None
+        mock_test.file_ranges = True
+        mock_test.integrity_hash = True
+
+        rx_stream = TestStreamTcp(loop=unittest.mock.MagicMock(), test=mock_test, stream_id=1)
+        rx_stream._stream_hash = unittest.mock.MagicMock()
+
+        buffer = memoryview(bytearray(pack_range_header(0, 8, 8) + b'abcd'))
+        rx_stream.buffer_received(buffer, len(buffer))
+        buffer[:] = bytes(len(buffer))
+
+        hashed = rx_stream._stream_hash.update.call_args[0][0]
+        self.assertIsInstance(hashed, bytes)
+        self.assertEqual(hashed, b'abcd')
+
+    def test_tcp_info_stats(self):
+        """
+        Test that TCP_INFO is added to interval and final stats.
+        """
+
+        tcp_stream = self._make_sender_stream()
+        tcp_stream._test_protocol.get_tcp_info.side_effect = [
+            {'total_retrans': 3, 'snd_cwnd': 10, 'snd_mss': 1000,
+             'rtt': 200, 'rttvar': 20, 'pmtu': 1500},
+            {'total_retrans': 5, 'snd_cwnd': 20, 'snd_mss': 1000,
+             'rtt': 100, 'rttvar': 10, 'pmtu': 1500},
+        ]
+
+        stats = tcp_stream.get_interval_stats(0, 1, 1)
+        self.assertEqual(stats['retransmits'], 3)
+        self.assertEqual(stats['snd_cwnd'], 10000)
+        self.assertEqual(stats['rtt'], 200)
+        self.assertEqual(stats['rttvar'], 20)
+
+        stats = tcp_stream.get_interval_stats(1, 2, 1)
+        self.assertEqual(stats['retransmits'], 2)
+
+        final_stats = tcp_stream.get_final_stats()
+        self.assertTrue(tcp_stream.has_retransmits)
+        self.assertEqual(final_stats['retransmits'], 5)
+        self.assertEqual(final_stats['max_snd_cwnd'], 20000)
+        self.assertEqual(final_stats['max_rtt'], 200)
+        self.assertEqual(final_stats['min_rtt'], 100)
+        self.assertEqual(final_stats['mean_rtt'], 150)
+
+    def test_tcp_info_stats_omitted(self):
+        """
+        Test final stats of a run that ended within the omit period.
+        """
+
+        tcp_stream = self._make_sender_stream(omitting=True)
+        tcp_stream._test_protocol.get_tcp_info.return_value = {
+            'total_retrans': 3, 'snd_cwnd': 10, 'snd_mss': 1000,
+            'rtt': 200, 'rttvar': 20, 'pmtu': 1500}
+
+        stats = tcp_stream.get_interval_stats(0, 1, 1)
+        self.assertTrue(stats['omitted'])
+        self.assertEqual(stats['rtt'], 200)
+
+        final_stats = tcp_stream.get_final_stats()
+        self.assertEqual(final_stats['retransmits'], 0)
+        self.assertIsNone(final_stats['min_rtt'])
+        self.assertNotIn('mean_rtt', final_stats)
+
+    @unittest.mock.patch('py3iperf3.data_stream_base.time')
+    def test_diagnostics(self, mock_time):
+        """
+        Test that pauses, send buffer and TCP_INFO limits are in the diagnostics.
+        """
+
+        tcp_stream = self._make_sender_stream()
+        self.assertEqual(tcp_stream.get_diagnostics(), {})
+
+        mock_time.time.return_value = 100
+        tcp_stream.start_stream()
+
+        # Paused for a quarter of the run
+        mock_time.monotonic.side_effect = [10, 11, 20, 21]
+        tcp_stream.pause_writing()
+        tcp_stream.resume_writing()
+        tcp_stream.pause_writing()
+        tcp_stream.resume_writing()
+
+        tcp_stream._test_protocol.get_send_queue.side_effect = [(100, 1000), (300, 1000)]
+        tcp_stream._test_protocol.get_tcp_info.side_effect = [
+            {'total_retrans': 0, 'snd_cwnd': 10, 'snd_mss': 1000, 'rtt': 200,
+             'rttvar': 20, 'pmtu': 1500,
+             'busy_time': 1000, 'rwnd_limited': 0, 'sndbuf_limited': 100},
+            {'total_retrans': 0, 'snd_cwnd': 10, 'snd_mss': 1000, 'rtt': 200,
+             'rttvar': 20, 'pmtu': 1500,
+             'busy_time': 2000, 'rwnd_limited': 500, 'sndbuf_limited': 100},
+        ]
+        tcp_stream.get_interval_stats(0, 1, 1)
+        tcp_stream.get_interval_stats(1, 2, 1)
+
+        mock_time.time.return_value = 108
+        tcp_stream.stop_stream()
+
+        diagnostics = tcp_stream.get_diagnostics()
+        self.assertEqual(diagnostics['pauses'], 2)
+        self.assertEqual(diagnostics['paused_fraction'], 0.25)
+        self.assertAlmostEqual(diagnostics['send_queue'], 0.2)
+        self.assertEqual(diagnostics['rwnd_limited'], 0.25)
+        self.assertEqual(diagnostics['sndbuf_limited'], 0.05)
+
+    def test_no_tcp_info_stats(self):
+        """
+        Test that retransmits stay unknown without TCP_INFO.
+        """
+
+        tcp_stream = self._make_sender_stream()
+        tcp_stream._test_protocol.get_tcp_info.return_value = None
+
+        stats = tcp_stream.get_interval_stats(0, 1, 1)
+        self.assertNotIn('retransmits', stats)
+        self.assertFalse(tcp_stream.has_retransmits)
+        self.assertEqual(tcp_stream.get_final_stats()['retransmits'], -1)
+
+    def test_buffer_received(self):
+        """
+        Test counting of data received into the protocol buffer.
+        """
+        mock_test = unittest.mock.MagicMock()
+        mock_test.file = None
+        mock_test.role = 'c'
+        mock_test.sender = True
+        mock_test.block_size = 10
+        mock_test.bandwidth = 0
+        mock_test.omitting = False
+        mock_test.send_scheduler = None
+        mock_test.payload = 'random'
+        mock_test.payload_param = None
+        mock_test.file_ranges = False
+        mock_test.integrity_hash = False
+
+        tcp_stream = TestStreamTcp(loop=unittest.mock.MagicMock(), test=mock_test, stream_id=1)
+
+        buffer = memoryview(bytearray(64))
+        tcp_stream.buffer_received(buffer, 10)
+        tcp_stream.buffer_received(buffer, 20)
+        self.assertEqual(tcp_stream._bytes_rx_this_interval, 30)
+
+        # Data is written to file only when requested
+        with tempfile.NamedTemporaryFile() as rx_file:
+            mock_test.file = rx_file.name
+            mock_test.sender = False
+            tcp_stream = TestStreamTcp(loop=unittest.mock.MagicMock(), test=mock_test, stream_id=1)
+
+            buffer[:4] = b'abcd'
+            tcp_stream.buffer_received(buffer, 4)
+            tcp_stream.stop_stream()
+
+            # Data arriving after the stop is dropped
+            tcp_stream.buffer_received(buffer, 4)
+            tcp_stream.data_received(b'efgh')
+
+            self.assertEqual(tcp_stream._bytes_rx_this_interval, 4)
+            with open(rx_file.name, 'rb') as check_file:
+                self.assertEqual(check_file.read(), b'abcd')
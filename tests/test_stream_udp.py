@@ -0,0 +1,171 @@
+"""
+Unittest for UDP data stream
+"""
+import unittest
+import unittest.mock
+
+from py3iperf3.data_stream_udp import TestStreamUdp, UDP_HEADER_32, UDP_HEADER_64
+
+def make_udp_stream(**test_attrs):
+    """
+    Make a UDP stream linked with mock test and proto.
+    """
+
+    mock_test = unittest.mock.MagicMock()
+    mock_test.file = None
+    mock_test.role = 'c'
+    mock_test.sender = True
+    mock_test.block_size = 100
+    mock_test.send_budget = 1000
+    mock_test.test_type = 't'
+    mock_test.bandwidth = 0
+    mock_test.omitting = False
+    mock_test.send_scheduler = None
+    mock_test.payload = 'random'
+    mock_test.payload_param = None
+    mock_test.file_ranges = False
+    mock_test.integrity_hash = False
+    mock_test._parameters.udp64bitcounters = False
+    for attr, value in test_attrs.items():
+        setattr(mock_test, attr, value)
+
+    udp_stream = TestStreamUdp(
+        loop=unittest.mock.MagicMock(), test=mock_test, stream_id=1)
+    udp_stream._test_protocol = unittest.mock.MagicMock()
+
+    return udp_stream
+
+class TestUdpStream(unittest.TestCase):
+    """
+    Unit tests for UDP stream.
+    """
+
+    def test_datagram_builder(self):
+        """
+        Test that datagrams are built in place with a fresh header.
+        """
+
+        udp_stream = make_udp_stream()
+        ring = udp_stream._data_source_sink
+
+        first = udp_stream._get_block()
+        self.assertEqual(len(first), 100)
+        self.assertEqual(UDP_HEADER_32.unpack_from(first)[2], 0)
+        self.assertEqual(bytes(first[12:]), bytes(ring[0][12:]))
+
+        udp_stream._pkt_cnt = 7
+        second = udp_stream._get_block()
+
+        # Same buffer is reused with the next payload of the ring
+        self.assertIs(first, second)
+        self.assertEqual(UDP_HEADER_32.unpack_from(second)[2], 7)
+        self.assertEqual(bytes(second[12:]), bytes(ring[1][12:]))
+
+    def test_datagram_builder_64bit(self):
+        """
+        Test 64-bit packet counters.
+        """
+
+        udp_stream = make_udp_stream()
+        udp_stream._header = UDP_HEADER_64
+        udp_stream._pkt_cnt = 2**40
+
+        block = udp_stream._get_block()
+        self.assertEqual(UDP_HEADER_64.unpack_from(block)[2], 2**40)
+
+    def test_send_counters(self):
+        """
+        Test that sent datagrams are counted.
+        """
+
+        udp_stream = make_udp_stream()
+        udp_stream._try_sending()
+
+        self.assertEqual(udp_stream._test_protocol.send_data.call_count, 10)
+        self.assertEqual(udp_stream._pkt_tx_this_interval, 10)
+        self.assertEqual(udp_stream._pkt_cnt, 10)
+
+    def test_gso_send(self):
+        """
+        Test that GSO super-buffer carries sequential datagrams.
+        """
+
+        udp_stream = make_udp_stream(udp_gso=True, test_type='b', _blocks_remaining=5)
+        udp_stream._test_protocol.enable_gso.return_value = True
+        udp_stream._setup_gso()
+        self.assertEqual(udp_stream._gso_segments, 64)
+
+        udp_stream._try_sending()
+
+        udp_stream._test_protocol.send_segments.assert_called_once()
+        data, segment_size = udp_stream._test_protocol.send_segments.call_args[0]
+        self.assertEqual(segment_size, 100)
+        self.assertEqual(len(data), 500)
+        ring = udp_stream._data_source_sink
+        for index in range(5):
+            self.assertEqual(UDP_HEADER_32.unpack_from(data, index * 100)[2], index)
+            self.assertEqual(bytes(data[index * 100 + 12:(index + 1) * 100]),
+                             bytes(ring[index][12:]))
+
+        self.assertEqual(udp_stream._pkt_tx_this_interval, 5)
+        self.assertEqual(udp_stream._bytes_tx_this_interval, 500)
+        self.assertTrue(udp_stream.done)
+
+    def test_gso_refused(self):
+        """
+        Test that datagrams are sent one by one when GSO is refused.
+        """
+
+        udp_stream = make_udp_stream(udp_gso=True)
+        udp_stream._test_protocol.enable_gso.return_value = False
+        udp_stream._setup_gso()
+
+        self.assertEqual(udp_stream._gso_segments, 0)
+        udp_stream._try_sending()
+        self.assertEqual(udp_stream._test_protocol.send_data.call_count, 10)
+
+    def test_paced_sending(self):
+        """
+        Test that sending waits for tokens when bandwidth is set.
+        """
+
+        udp_stream = make_udp_stream(bandwidth=8000, burst=2)
+        udp_stream._try_sending()
+
+        # Burst of two blocks, then wait for tokens
+        self.assertEqual(udp_stream._test_protocol.send_data.call_count, 2)
+        assert udp_stream._loop.call_later.called
+        delay = udp_stream._loop.call_later.call_args[0][0]
+        self.assertAlmostEqual(delay, 0.1, places=2)
+
+    def test_receive_deferred_stats(self):
+        """
+        Test that loss is computed from the received datagrams at the interval.
+        """
+        udp_stream = make_udp_stream(sender=False, role='s')
+
+        for pkt_num in (1, 2, 5, 4, 6, 4):
+            datagram = bytearray(100)
+            UDP_HEADER_32.pack_into(datagram, 0, 1, 0, pkt_num)
+            udp_stream.data_received(datagram)
+
+        # Nothing computed on the receive path
+        self.assertEqual(udp_stream._pkt_rx_this_interval, 0)
+        self.assertEqual(len(udp_stream._rx_log), 6)
+
+        stats = udp_stream.get_interval_stats(0, 1, 1)
+        self.assertEqual(stats['packets'], 6)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(udp_stream._ooo_count, 1)
+        self.assertEqual(udp_stream._dup_count, 1)
+        self.assertGreater(stats['jitter'], 0)
+
+        # Counters restart for the next interval
+        stats = udp_stream.get_interval_stats(1, 2, 1)
+        self.assertEqual(stats['packets'], 0)
+        self.assertEqual(stats['errors'], 0)
+
+        # Late and duplicate datagrams are reported at the end
+        stats = udp_stream.get_final_stats()
+        self.assertEqual(stats['out_of_order'], 1)
+        self.assertEqual(stats['duplicates'], 1)
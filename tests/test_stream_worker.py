@@ -0,0 +1,168 @@
+"""
+Unit-test for streams running in worker processes.
+"""
+import unittest
+import unittest.mock
+
+from py3iperf3.data_stream_worker import WorkerStreamTcp, NUM_COUNTERS
+from py3iperf3.data_stream_worker import WORKER_RUNNING, WORKER_DONE, WORKER_STOPPED
+from py3iperf3.data_stream_worker import CNT_STATE, CNT_BYTES_TX
+from py3iperf3.data_stream_worker import CNT_TCPI_VALID, CNT_TCPI_RETRANS, CNT_TCPI_CWND
+from py3iperf3.iperf3_test import Iperf3Test
+from py3iperf3.stats_store import StatsStore
+from py3iperf3.stream_worker import StreamWorker
+
+def make_worker_stream():
+    """Make a proxy of a sending worker stream"""
+
+    mock_test = unittest.mock.MagicMock()
+    mock_test.file = None
+    mock_test.role = 'c'
+    mock_test.sender = True
+    mock_test.block_size = 10
+    mock_test.bandwidth = 0
+    mock_test.omitting = False
+    mock_test.send_scheduler = None
+    mock_test.payload = 'random'
+    mock_test.payload_param = None
+    mock_test.file_ranges = False
+    mock_test.integrity_hash = False
+    mock_test.stats_store = StatsStore()
+
+    return WorkerStreamTcp(loop=unittest.mock.MagicMock(), test=mock_test, stream_id=1)
+
+class TestStreamWorker(unittest.TestCase):
+    """Unit tests of worker streams"""
+
+    def test_interval_stats_from_counters(self):
+        """Test that interval stats are deltas of worker counters"""
+
+        worker_stream = make_worker_stream()
+        counters = worker_stream._counters
+        counters[CNT_BYTES_TX] = 1000
+
+        # Stream id stands for the socket of the worker
+        stats = worker_stream.get_interval_stats(0, 1, 1)
+        self.assertEqual(stats['socket'], 1)
+        self.assertEqual(stats['bytes'], 1000)
+        self.assertNotIn('retransmits', stats)
+
+        counters[CNT_BYTES_TX] = 3000
+        counters[CNT_TCPI_VALID] = 1
+        counters[CNT_TCPI_RETRANS] = 4
+        counters[CNT_TCPI_CWND] = 20000
+
+        stats = worker_stream.get_interval_stats(1, 2, 1)
+        self.assertEqual(stats['bytes'], 2000)
+        self.assertEqual(stats['retransmits'], 4)
+        self.assertEqual(stats['snd_cwnd'], 20000)
+
+        self.assertEqual(worker_stream.get_final_stats()['bytes'], 3000)
+
+    def test_poll_worker_done(self):
+        """Test that test is informed once all workers are done"""
+
+        worker_stream = make_worker_stream()
+
+        # Still running
+        worker_stream._poll_worker()
+        assert worker_stream._loop.call_later.called
+        self.assertFalse(worker_stream.done)
+
+        # Done, but other streams are not
+        worker_stream._counters[CNT_STATE] = WORKER_DONE
+        worker_stream._test.all_streams_done = False
+        worker_stream._poll_worker()
+        self.assertTrue(worker_stream.done)
+        assert not worker_stream._test.sendable_data_depleted.called
+
+        # All done
+        worker_stream._test.all_streams_done = True
+        worker_stream._poll_worker()
+        assert worker_stream._test.sendable_data_depleted.called
+
+    def test_worker_publish_and_commands(self):
+        """Test worker side publishing of counters and commands"""
+
+        mock_loop = unittest.mock.MagicMock()
+        mock_stream = unittest.mock.MagicMock()
+        mock_stream._bytes_tx_this_interval = 1234
+        mock_stream._test_protocol.get_tcp_info.return_value = None
+        start_event = unittest.mock.MagicMock()
+        stop_event = unittest.mock.MagicMock()
+        start_event.is_set.return_value = False
+        stop_event.is_set.return_value = False
+        counters = [0] * NUM_COUNTERS
+
+        worker = StreamWorker(mock_loop, mock_stream, counters, start_event, stop_event)
+        worker.tick()
+
+        self.assertEqual(counters[CNT_STATE], WORKER_RUNNING)
+        self.assertEqual(counters[CNT_BYTES_TX], 1234)
+        self.assertEqual(counters[CNT_TCPI_VALID], 0)
+        assert not mock_stream.start_stream.called
+        assert mock_loop.call_later.called
+
+        # Start once
+        start_event.is_set.return_value = True
+        worker.tick()
+        worker.tick()
+        mock_stream.start_stream.assert_called_once_with()
+
+        # Stop
+        stop_event.is_set.return_value = True
+        worker.tick()
+        assert mock_stream.stop_stream.called
+        assert mock_loop.stop.called
+        self.assertEqual(counters[CNT_STATE], WORKER_STOPPED)
+
+    def test_worker_connects_after_previous(self):
+        """Test that worker connects once the previous worker has connected"""
+
+        mock_loop = unittest.mock.MagicMock()
+        mock_stream = unittest.mock.MagicMock()
+        mock_stream._test_protocol = None
+        start_event = unittest.mock.MagicMock()
+        stop_event = unittest.mock.MagicMock()
+        start_event.is_set.return_value = False
+        stop_event.is_set.return_value = False
+        counters = [0] * NUM_COUNTERS
+        previous_counters = [0] * NUM_COUNTERS
+
+        worker = StreamWorker(mock_loop, mock_stream, counters,
+                              start_event, stop_event, previous_counters)
+        worker.tick()
+        assert not mock_stream.create_connection.called
+
+        # Connect once
+        previous_counters[CNT_STATE] = WORKER_RUNNING
+        worker.tick()
+        worker.tick()
+        mock_stream.create_connection.assert_called_once_with()
+
+    def test_stop_without_waiting(self):
+        """Test that stop is requested without waiting for the worker"""
+
+        worker_stream = make_worker_stream()
+        worker_stream._worker = unittest.mock.MagicMock()
+        worker_stream._worker.is_alive.return_value = True
+        poll_handle = unittest.mock.MagicMock()
+        worker_stream._poll_handle = poll_handle
+
+        worker_stream.request_stop()
+        self.assertTrue(worker_stream._stop_event.is_set())
+        assert poll_handle.cancel.called
+        assert not worker_stream._worker.join.called
+        self.assertFalse(worker_stream.stopped)
+
+        worker_stream._counters[CNT_STATE] = WORKER_STOPPED
+        self.assertTrue(worker_stream.stopped)
+
+    def test_split_remaining(self):
+        """Test splitting of blocks/bytes between the workers"""
+
+        iperf_test = Iperf3Test(None, None, {'parallel': 3})
+
+        self.assertIsNone(iperf_test._split_remaining(None, 0))
+        shares = [iperf_test._split_remaining(10, x) for x in range(3)]
+        self.assertEqual(shares, [4, 3, 3])
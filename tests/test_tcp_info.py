@@ -0,0 +1,55 @@
+"""
+Unit-test for TCP_INFO reading.
+"""
+import socket
+import unittest
+
+from py3iperf3.tcp_info import TCP_INFO_STRUCT, TCP_INFO_FIELDS
+from py3iperf3.tcp_info import TCP_INFO_EXT_STRUCT, TCP_INFO_EXT_FIELDS
+from py3iperf3.tcp_info import parse_tcp_info, read_tcp_info, tcp_info_supported
+
+class TestTcpInfo(unittest.TestCase):
+    """Unit-tests of TCP_INFO parsing"""
+
+    def test_parse_tcp_info(self):
+        """Test parsing of raw TCP_INFO bytes"""
+
+        values = list(range(len(TCP_INFO_FIELDS)))
+        info_bytes = TCP_INFO_STRUCT.pack(*values) + bytes(64)
+
+        tcp_info = parse_tcp_info(info_bytes)
+        self.assertEqual(tcp_info['state'], 0)
+        self.assertEqual(tcp_info['rtt'], TCP_INFO_FIELDS.index('rtt'))
+        self.assertEqual(tcp_info['total_retrans'], len(TCP_INFO_FIELDS) - 1)
+        self.assertNotIn('busy_time', tcp_info)
+
+        # Newer kernels
+        values = list(range(len(TCP_INFO_EXT_FIELDS)))
+        tcp_info = parse_tcp_info(TCP_INFO_EXT_STRUCT.pack(*values))
+        self.assertEqual(tcp_info['rtt'], TCP_INFO_FIELDS.index('rtt'))
+        self.assertEqual(tcp_info['sndbuf_limited'], len(TCP_INFO_EXT_FIELDS) - 1)
+
+        # Too short
+        self.assertIsNone(parse_tcp_info(info_bytes[:20]))
+
+    def test_read_tcp_info(self):
+        """Test reading TCP_INFO of a connected socket"""
+
+        if not tcp_info_supported():
+            self.skipTest('TCP_INFO not supported')
+
+        server_sock = socket.socket()
+        server_sock.bind(('127.0.0.1', 0))
+        server_sock.listen(1)
+        client_sock = socket.create_connection(server_sock.getsockname())
+        accepted_sock, _ = server_sock.accept()
+
+        try:
+            tcp_info = read_tcp_info(client_sock)
+            self.assertIsNotNone(tcp_info)
+            self.assertGreater(tcp_info['snd_mss'], 0)
+            self.assertGreater(tcp_info['snd_cwnd'], 0)
+        finally:
+            accepted_sock.close()
+            client_sock.close()
+            server_sock.close()
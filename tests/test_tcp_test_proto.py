@@ -5,7 +5,7 @@ import unittest
 import unittest.mock
 import socket
 
-from py3iperf3.data_protocol_tcp import TcpTestProtocol
+from py3iperf3.data_protocol_tcp import TcpTestProtocol, TcpBufferedTestProtocol
 
 def fake_logger(message, **kwargs):
     """Mockup of logger"""
@@ -177,3 +177,47 @@ class TestTcpTestProtocol(unittest.TestCase):
 
         assert mock_transport.get_extra_info.called_once_with('peername')
         assert mock_server.tcp_connection_established.called_once_with(tcp_proto)
+
+    def test_write_buffer_limits(self):
+        """
+        Test that transport write buffer limits are applied when given.
+        """
+        mock_transport = unittest.mock.MagicMock()
+        mock_stream = unittest.mock.MagicMock()
+
+        # Asyncio defaults are kept
+        tcp_proto = TcpTestProtocol(mock_stream)
+        tcp_proto.connection_made(mock_transport)
+        assert not mock_transport.set_write_buffer_limits.called
+
+        tcp_proto = TcpTestProtocol(mock_stream, write_buffer_high=1337, write_buffer_low=42)
+        tcp_proto.connection_made(mock_transport)
+        mock_transport.set_write_buffer_limits.assert_called_once_with(high=1337, low=42)
+
+    def test_buffered_data_rx(self):
+        """
+        Test receiving into the preallocated buffer.
+        """
+        mock_stream = unittest.mock.MagicMock()
+        tcp_proto = TcpBufferedTestProtocol(rx_buffer_size=64, test_stream=mock_stream)
+
+        # The same buffer is handed out every time
+        buffer = tcp_proto.get_buffer(-1)
+        self.assertEqual(len(buffer), 64)
+        self.assertIs(tcp_proto.get_buffer(1024), buffer)
+
+        buffer[:5] = b'12345'
+        tcp_proto.buffer_updated(5)
+        mock_stream.buffer_received.assert_called_once_with(buffer, 5)
+
+    def test_buffered_server_data_rx(self):
+        """
+        Test data before the stream is known goes to the server.
+        """
+        mock_server = unittest.mock.MagicMock()
+        tcp_proto = TcpBufferedTestProtocol(rx_buffer_size=64, server=mock_server)
+
+        buffer = tcp_proto.get_buffer(-1)
+        buffer[:5] = b'12345'
+        tcp_proto.buffer_updated(5)
+        mock_server.control_data_received.assert_called_once_with(tcp_proto, b'12345')
@@ -3,6 +3,7 @@ Unit-test for Iperf3Test class
 """
 #pylint: disable=protected-access, no-member
 
+import io
 import json
 import random
 import struct
@@ -10,8 +11,9 @@ import unittest
 import unittest.mock
 
 from py3iperf3.iperf3_test import Iperf3Test
-from py3iperf3.iperf3_api import Iperf3TestProto, DEFAULT_BLOCK_TCP, DEFAULT_BLOCK_UDP
+from py3iperf3.iperf3_api import Iperf3TestProto, DEFAULT_BLOCK_TCP, DEFAULT_BLOCK_UDP, DEFAULT_UDP_RATE
 from py3iperf3.iperf3_api import Iperf3State
+from py3iperf3.loop_monitor import LoopMonitor
 
 def fake_cookie():
     """Fake cookie generator"""
@@ -55,6 +57,17 @@ class TestIperf3TestClass(unittest.TestCase):
         self.assertEqual(iperf_test.role, 'c')
         self.assertEqual(iperf_test.file, 'foobar.bin')
 
+    def test_file_ranges_setting(self):
+        """Test that file ranges are used only when asked for and possible"""
+
+        params = {'file': 'foobar.bin', 'parallel': 4}
+        self.assertFalse(Iperf3Test(None, None, params).file_ranges)
+        self.assertTrue(Iperf3Test(None, None, dict(params, file_ranges=True)).file_ranges)
+        self.assertFalse(Iperf3Test(None, None, dict(params, file_ranges=True,
+                                                     parallel=1)).file_ranges)
+        self.assertFalse(Iperf3Test(None, None, dict(params, file_ranges=True,
+                                                     test_protocol=Iperf3TestProto.UDP)).file_ranges)
+
     @unittest.mock.patch('py3iperf3.iperf3_test.make_cookie',
                          side_effect=fake_cookie)
     def test_cookie_set_on_call(self, _):
@@ -202,10 +215,12 @@ class TestIperf3TestClass(unittest.TestCase):
             'id':7,
             'bytes':100000
         }
+        mock_stream.get_diagnostics = unittest.mock.MagicMock(return_value={})
         mock_stream.get_final_stats = unittest.mock.MagicMock(return_value=our_stat)
 
         iperf_test = Iperf3Test(mock_master, None, {})
         iperf_test._control_protocol = mock_control
+        iperf_test._send_scheduler = unittest.mock.MagicMock()
         iperf_test._streams.append(mock_stream)
         iperf_test._remote_results = {'streams':[
             {
@@ -213,8 +228,8 @@ class TestIperf3TestClass(unittest.TestCase):
                 'bytes': 123456,
             }
         ]}
-        iperf_test._stream_stop_time = 2
-        iperf_test._stream_start_time = 1
+        iperf_test._stats_stop_ns = 2000000000
+        iperf_test._stats_start_ns = 1000000000
 
         iperf_test.handle_server_message(struct.pack(
             '!c', bytes([Iperf3State.DISPLAY_RESULTS.value])))
@@ -224,6 +239,7 @@ class TestIperf3TestClass(unittest.TestCase):
         assert mock_control.close_connection.called
         assert mock_master.test_done.called_with(iperf_test)
         assert mock_stream.get_stats_header.called
+        assert iperf_test._send_scheduler.close.called
 
     def test_sting_drain(self):
         """Test draining the string"""
@@ -260,3 +276,347 @@ class TestIperf3TestClass(unittest.TestCase):
 
         for stream in iperf_test._streams:
             stream.stop_stream.assert_called_once_with()
+
+    def test_streams_stopped_together(self):
+        """Test that workers are all told to stop before waiting for them"""
+
+        mock_stream1 = unittest.mock.MagicMock()
+        mock_stream2 = unittest.mock.MagicMock()
+        mock_stream1.stopped = True
+        mock_stream2.stopped = False
+        mock_loop = unittest.mock.MagicMock()
+
+        iperf_test = Iperf3Test(None, mock_loop, {})
+        iperf_test._control_protocol = unittest.mock.MagicMock()
+        iperf_test._send_scheduler = unittest.mock.MagicMock()
+        iperf_test._streams.extend([mock_stream1, mock_stream2])
+
+        # Second stream is still stopping, poll it on the loop
+        iperf_test._stop_all_streams()
+        mock_stream1.request_stop.assert_called_once_with()
+        mock_stream2.request_stop.assert_called_once_with()
+        assert not mock_stream1.stop_stream.called
+        mock_loop.call_later.assert_called_once_with(
+            unittest.mock.ANY, iperf_test._wait_streams_stopped)
+
+        mock_stream2.stopped = True
+        iperf_test._wait_streams_stopped()
+        mock_stream1.stop_stream.assert_called_once_with()
+        mock_stream2.stop_stream.assert_called_once_with()
+        assert iperf_test._send_scheduler.close.called
+        iperf_test._control_protocol.send_data.assert_called_once_with(
+            struct.pack('!c', bytes([Iperf3State.TEST_END.value])))
+
+    @unittest.mock.patch('py3iperf3.iperf3_test.time.monotonic_ns')
+    def test_stop_time_at_stop_request(self, mock_clock):
+        """Test that waiting for workers to stop is not counted in the test"""
+
+        mock_stream = unittest.mock.MagicMock()
+        mock_stream.stopped = False
+        mock_stream.get_cpu_times.return_value = (0, 0)
+        mock_loop = unittest.mock.MagicMock()
+        mock_loop.time.return_value = 100
+
+        iperf_test = Iperf3Test(None, mock_loop, {})
+        iperf_test._control_protocol = unittest.mock.MagicMock()
+        iperf_test._streams.append(mock_stream)
+
+        mock_clock.return_value = 1000000000
+        iperf_test._start_stats_timer()
+        hdl_stats = iperf_test._hdl_stats
+
+        # Stop requested at 2 seconds, periodic stats are cancelled
+        mock_clock.return_value = 3000000000
+        iperf_test._stop_all_streams()
+        assert hdl_stats.cancel.called
+
+        # Worker stopped later
+        mock_clock.return_value = 3160000000
+        mock_stream.stopped = True
+        iperf_test._wait_streams_stopped()
+        mock_stream.get_interval_stats.assert_called_with(0, 2, 2)
+        self.assertEqual(iperf_test._test_length, 2)
+
+    def test_bandwidth_defaults(self):
+        """Test default bandwidth and its exchange"""
+
+        # Unlimited TCP
+        iperf_test = Iperf3Test(None, None, {})
+        self.assertEqual(iperf_test.bandwidth, 0)
+
+        # 1 Mbit/sec UDP
+        iperf_test = Iperf3Test(None, None, {'test_protocol': Iperf3TestProto.UDP})
+        self.assertEqual(iperf_test.bandwidth, DEFAULT_UDP_RATE)
+
+        # Given rate and burst are sent to the server
+        mock_control = unittest.mock.MagicMock()
+        iperf_test = Iperf3Test(None, None, {'bandwidth': 1000000, 'burst': 10})
+        iperf_test._control_protocol = mock_control
+        iperf_test._exchange_parameters()
+
+        param_obj = json.loads(mock_control.send_data.call_args[0][0].decode('ascii'))
+        self.assertEqual(param_obj['bandwidth'], 1000000)
+        self.assertEqual(param_obj['burst'], 10)
+
+    def test_json_output(self):
+        """Test intervals and results are written as a JSON document"""
+
+        mock_control = unittest.mock.MagicMock()
+        mock_master = unittest.mock.MagicMock()
+        mock_stream = unittest.mock.MagicMock()
+        mock_stream.socket_id = 5
+        mock_stream.get_interval_stats = unittest.mock.MagicMock(return_value={
+            'socket': 5, 'start': 0, 'end': 1, 'seconds': 1, 'bytes': 1000,
+            'bits_per_second': 8000, 'omitted': False, 'errors': 0, 'retransmits': 2})
+        mock_stream.get_diagnostics = unittest.mock.MagicMock(return_value={})
+        mock_stream.get_final_stats = unittest.mock.MagicMock(return_value={
+            'id': 1, 'bytes': 1000, 'retransmits': 2})
+
+        mock_loop = unittest.mock.MagicMock()
+        mock_loop.time = unittest.mock.MagicMock(return_value=100)
+
+        iperf_test = Iperf3Test(mock_master, mock_loop, {'json': True})
+        output = io.StringIO()
+        iperf_test._json_report._output = output
+        iperf_test._control_protocol = mock_control
+        iperf_test._streams.append(mock_stream)
+        iperf_test._start_stats_timer()
+        iperf_test._json_report.start(iperf_test._json_start())
+
+        # Intervals are not printed
+        iperf_test._collect_print_stats()
+        assert not mock_stream.print_last_stats_entry.called
+
+        # Sliver of the last interval is left out
+        iperf_test._collect_print_stats(final=True, t_now_ns=iperf_test._stats_last_ns + 140000)
+
+        iperf_test._remote_results = {'streams': [{'id': 1, 'bytes': 900}]}
+        iperf_test._stats_stop_ns = iperf_test._stats_start_ns + 2000000000
+        iperf_test.display_results()
+
+        document = json.loads(output.getvalue())
+        self.assertEqual(document['start']['test_start']['protocol'], 'TCP')
+        self.assertEqual(len(document['intervals']), 1)
+        self.assertEqual(document['intervals'][0]['sum']['bytes'], 1000)
+        self.assertEqual(document['intervals'][0]['sum']['retransmits'], 2)
+        self.assertEqual(document['end']['sum_sent']['bytes'], 1000)
+        self.assertEqual(document['end']['sum_sent']['retransmits'], 2)
+        self.assertEqual(document['end']['sum_received']['bytes'], 900)
+        self.assertNotIn('retransmits', document['end']['sum_received'])
+
+    @unittest.mock.patch('py3iperf3.iperf3_test.time.monotonic_ns')
+    def test_stats_timer(self, mock_clock):
+        """Test stats ticks at absolute deadlines, missed ticks and last interval"""
+
+        mock_loop = unittest.mock.MagicMock()
+        mock_loop.time = unittest.mock.MagicMock(return_value=100)
+        mock_stream = unittest.mock.MagicMock()
+        mock_stream.get_cpu_times = unittest.mock.MagicMock(return_value=(0, 0))
+
+        iperf_test = Iperf3Test(None, mock_loop, {'report_interval': 2})
+        iperf_test._streams.append(mock_stream)
+
+        mock_clock.return_value = 5000000000
+        iperf_test._start_stats_timer()
+        self.assertEqual(mock_loop.call_at.call_args[0][0], 102)
+
+        # Late tick still schedules the next one on the grid
+        mock_loop.time.return_value = 102.5
+        mock_clock.return_value = 7500000000
+        iperf_test._collect_print_stats()
+        mock_stream.get_interval_stats.assert_called_with(0, 2.5, 2.5)
+        self.assertEqual(mock_loop.call_at.call_args[0][0], 104)
+
+        # Loop was blocked over two deadlines
+        mock_loop.time.return_value = 108.1
+        mock_clock.return_value = 13100000000
+        with self.assertLogs('py3iperf3', 'WARNING'):
+            iperf_test._collect_print_stats()
+        mock_stream.get_interval_stats.assert_called_with(2.5, 8.1, 5.6)
+        self.assertEqual(mock_loop.call_at.call_args[0][0], 110)
+
+        # Last partial interval is collected on stop, but too short to print
+        mock_stream.print_last_stats_entry.reset_mock()
+        mock_clock.return_value = 13200000000
+        iperf_test._stop_stats_timer()
+        mock_stream.get_interval_stats.assert_called_with(8.1, 8.2, 0.1)
+        assert not mock_stream.print_last_stats_entry.called
+        self.assertAlmostEqual(iperf_test._test_length, 8.2)
+
+    @unittest.mock.patch('py3iperf3.iperf3_test.time.monotonic_ns')
+    def test_omit(self, mock_clock):
+        """Test warm-up intervals are omitted and stats restart after it"""
+
+        mock_loop = unittest.mock.MagicMock()
+        mock_loop.time = unittest.mock.MagicMock(return_value=100)
+        mock_stream = unittest.mock.MagicMock()
+        mock_stream.get_interval_stats = lambda *args: omitted.append(iperf_test.omitting)
+        mock_stream.get_cpu_times.return_value = (0, 0)
+        omitted = []
+
+        iperf_test = Iperf3Test(None, mock_loop, {'omit': 3})
+        iperf_test._streams.append(mock_stream)
+        iperf_test._cpu_usage = unittest.mock.MagicMock(wraps=iperf_test._cpu_usage)
+        iperf_test._loop_monitor = unittest.mock.MagicMock(wraps=LoopMonitor(mock_loop))
+
+        # Omit is sent to the server
+        mock_control = unittest.mock.MagicMock()
+        iperf_test._control_protocol = mock_control
+        iperf_test._exchange_parameters()
+        param_obj = json.loads(mock_control.send_data.call_args[0][0].decode('ascii'))
+        self.assertEqual(param_obj['omit'], 3)
+
+        mock_clock.return_value = 1000000000
+        iperf_test._start_stats_timer()
+        iperf_test._start_omitting()
+        self.assertTrue(iperf_test.omitting)
+        mock_loop.call_later.assert_called_with(3, iperf_test._omitting_done)
+
+        mock_clock.return_value = 2000000000
+        iperf_test._collect_print_stats()
+
+        # Rest of the warm-up is collected as omitted, then stats restart
+        mock_loop.time.return_value = 103
+        mock_clock.return_value = 4000000000
+        iperf_test._omitting_done()
+        self.assertFalse(iperf_test.omitting)
+        self.assertEqual(iperf_test._stats_start_ns, 4000000000)
+        self.assertEqual(mock_loop.call_at.call_args[0][0], 104)
+        assert iperf_test._cpu_usage.restart.called
+        assert iperf_test._loop_monitor.reset_total.called
+
+        mock_loop.time.return_value = 104
+        mock_clock.return_value = 5000000000
+        iperf_test._collect_print_stats()
+        self.assertEqual(omitted, [True, True, False])
+
+    def test_cpu_utilization(self):
+        """Test CPU utilization in the results and the summary"""
+
+        mock_control = unittest.mock.MagicMock()
+        mock_stream = unittest.mock.MagicMock()
+        mock_stream.get_cpu_times = unittest.mock.MagicMock(return_value=(1.5, 0.5))
+        mock_stream.get_diagnostics = unittest.mock.MagicMock(return_value={})
+        mock_stream.get_final_stats = unittest.mock.MagicMock(return_value={
+            'id': 1, 'bytes': 1000, 'cpu_util_total': 50})
+
+        iperf_test = Iperf3Test(None, None, {})
+        iperf_test._control_protocol = mock_control
+        iperf_test._streams.append(mock_stream)
+
+        with unittest.mock.patch('py3iperf3.cpu_usage.time.monotonic', side_effect=[10, 14]), \
+             unittest.mock.patch('py3iperf3.cpu_usage.os.times') as mock_times:
+            mock_times.return_value = unittest.mock.MagicMock(user=1, system=1)
+            iperf_test._cpu_usage.start()
+            mock_times.return_value = unittest.mock.MagicMock(user=2, system=1.5)
+            iperf_test._cpu_usage.stop(*iperf_test._worker_cpu_times())
+
+        # Process and worker CPU time over the test time
+        iperf_test._send_results()
+        results = json.loads(mock_control.send_data.call_args[0][0].decode('ascii'))
+        self.assertEqual(results['cpu_util_total'], 87.5)
+        self.assertEqual(results['cpu_util_user'], 62.5)
+        self.assertEqual(results['cpu_util_system'], 25)
+
+        iperf_test._remote_results = {'streams': [{'id': 1, 'bytes': 900}],
+                                      'cpu_util_total': 10, 'cpu_util_user': 4,
+                                      'cpu_util_system': 6}
+        iperf_test._stats_start_ns = 0
+        iperf_test._stats_stop_ns = 1000000000
+        with self.assertLogs('py3iperf3', 'INFO') as logs:
+            iperf_test.display_results()
+
+        self.assertIn('Worker CPU Utilization: 50.0% (0.0%u/0.0%s)', logs.output[-3])
+        self.assertIn('CPU Utilization: local/sender 87.5% (62.5%u/25.0%s), '
+                      'remote/receiver 10.0% (4.0%u/6.0%s)', logs.output[-2])
+        self.assertIn('Bottleneck: network-bound', logs.output[-1])
+
+    def test_integrity(self):
+        """Test comparing stream digests with the remote ones"""
+
+        iperf_test = Iperf3Test(None, None, {'integrity_hash': True})
+        for stream_id, digest in ((1, 'ab'), (3, 'cd')):
+            mock_stream = unittest.mock.MagicMock()
+            mock_stream.socket_id = stream_id + 4
+            mock_stream.get_final_stats = unittest.mock.MagicMock(return_value={
+                'id': stream_id, 'bytes': 1000, 'digest': digest, 'digest_bytes': 1000})
+            iperf_test._streams.append(mock_stream)
+
+        iperf_test._remote_results = {'streams': [
+            {'id': 1, 'bytes': 1000, 'digest': 'ab', 'digest_bytes': 1000},
+            {'id': 3, 'bytes': 1000, 'digest': 'ef', 'digest_bytes': 1000}]}
+
+        integrity = iperf_test._check_integrity()
+        self.assertEqual([x['status'] for x in integrity], ['ok', 'mismatch'])
+        self.assertEqual(integrity[1]['socket'], 7)
+        self.assertEqual(integrity[1]['remote_digest'], 'ef')
+
+        # Not hashed with UDP
+        iperf_test = Iperf3Test(None, None, {'integrity_hash': True,
+                                             'test_protocol': Iperf3TestProto.UDP})
+        self.assertFalse(iperf_test.integrity_hash)
+        self.assertEqual(iperf_test._check_integrity(), [])
+
+    def test_server_waits_for_data(self):
+        """Test the server sends results once it received all hashed data"""
+
+        mock_loop = unittest.mock.MagicMock()
+        mock_loop.time.return_value = 100
+        mock_stream = unittest.mock.MagicMock()
+        mock_stream._stream_id = 1
+        mock_stream.get_hashed_bytes = unittest.mock.MagicMock(side_effect=[500, 1000])
+        mock_stream.get_final_stats = unittest.mock.MagicMock(return_value={'id': 1, 'bytes': 1000})
+
+        iperf_test = Iperf3Test(None, mock_loop, {'integrity_hash': True})
+        iperf_test._role = 's'
+        iperf_test._control_protocol = unittest.mock.MagicMock()
+        iperf_test._streams.append(mock_stream)
+        iperf_test._remote_results = {'streams': [{'id': 1, 'digest_bytes': 1000}]}
+
+        # Data still in flight
+        iperf_test._send_server_results()
+        self.assertFalse(iperf_test._control_protocol.send_data.called)
+        callback, deadline = mock_loop.call_later.call_args[0][1:]
+        self.assertEqual(deadline, 102)
+
+        callback(deadline)
+        self.assertEqual(iperf_test._state, Iperf3State.DISPLAY_RESULTS)
+
+        # Results are sent at the deadline even if data is missing
+        mock_stream.get_hashed_bytes = unittest.mock.MagicMock(return_value=0)
+        iperf_test._control_protocol.reset_mock()
+        mock_loop.time.return_value = 103
+        iperf_test._send_server_results(102)
+        assert iperf_test._control_protocol.send_data.called
+
+    def test_get_result(self):
+        """Test typed results of a finished test"""
+
+        mock_stream = unittest.mock.MagicMock()
+        mock_stream.socket_id = 5
+        mock_stream.get_diagnostics = unittest.mock.MagicMock(return_value={})
+        mock_stream.get_final_stats = unittest.mock.MagicMock(return_value={
+            'id': 1, 'bytes': 1000, 'retransmits': 2})
+
+        iperf_test = Iperf3Test(None, None, {})
+        iperf_test._streams.append(mock_stream)
+        self.assertIsNone(iperf_test.get_result())
+
+        iperf_test.stats_store.append(1, {'socket': 5, 'start': 0, 'end': 1, 'seconds': 1,
+                                          'bytes': 1000, 'retransmits': 2})
+        iperf_test._remote_results = {'streams': [{'id': 1, 'bytes': 900}],
+                                      'cpu_util_total': 10}
+        iperf_test._stats_start_ns = 0
+        iperf_test._stats_stop_ns = 2000000000
+
+        result = iperf_test.get_result()
+        self.assertTrue(result.sender)
+        self.assertEqual(result.seconds, 2)
+        self.assertEqual(result.local.bits_per_second, 4000)
+        self.assertEqual(result.remote.bytes, 900)
+        self.assertEqual(result.streams[0].socket, 5)
+        self.assertEqual(result.streams[0].local.retransmits, 2)
+        self.assertEqual(result.streams[0].intervals[0].bytes, 1000)
+        self.assertEqual(result.remote_cpu_utilization['cpu_util_total'], 10)
+        self.assertEqual(result.diagnosis[0]['socket'], 5)
+        self.assertEqual(result.integrity, [])
@@ -0,0 +1,96 @@
+"""
+Unit-test for the log of received UDP datagrams.
+"""
+import random
+import unittest
+
+from py3iperf3 import udp_rx_log
+from py3iperf3.udp_rx_log import UdpRxLog
+
+def per_packet_reference(records):
+    """Loss and jitter computed per packet as the stream used to"""
+
+    max_seq = errors = out_of_order = duplicates = prev_transit = 0
+    jitter = 0.0
+    received = set()
+
+    for seq, sent_ns, arrival_ns in records:
+        if seq in received:
+            duplicates += 1
+        elif seq >= max_seq + 1:
+            if seq > max_seq + 1:
+                errors += (seq - 1) - max_seq
+            max_seq = seq
+        else:
+            out_of_order += 1
+            if errors > 0:
+                errors -= 1
+        received.add(seq)
+
+        transit = arrival_ns - sent_ns
+        d = transit - prev_transit
+        if d < 0:
+            d = -d
+        prev_transit = transit
+        jitter += (d - jitter) / 16.0
+
+    return max_seq, errors, out_of_order, duplicates, jitter
+
+def make_records(num_records, seed=7):
+    """Datagrams with loss, reordering, duplicates and varying delay"""
+
+    rnd = random.Random(seed)
+    sequence = [seq for seq in range(1, num_records + 1) if rnd.random() > 0.05]
+
+    for index in range(0, len(sequence) - 1, 17):
+        sequence[index], sequence[index + 1] = sequence[index + 1], sequence[index]
+    sequence.insert(len(sequence) // 2, sequence[len(sequence) // 3])
+
+    return [(seq, seq * 1000000, seq * 1000000 + rnd.randint(20000, 90000))
+            for seq in sequence]
+
+class TestUdpRxLog(unittest.TestCase):
+    """Unit-tests of the received datagram log"""
+
+    def check_against_reference(self, use_numpy):
+        """Process records in batches and compare with per packet values"""
+
+        records = make_records(2000)
+        rx_log = UdpRxLog(use_numpy=use_numpy)
+
+        for index, record in enumerate(records):
+            rx_log.append(*record)
+            if index % 300 == 299:
+                rx_log.process()
+        rx_log.process()
+        self.assertEqual(len(rx_log), 0)
+
+        max_seq, errors, out_of_order, duplicates, jitter = per_packet_reference(records)
+        self.assertEqual(rx_log.max_seq, max_seq)
+        self.assertEqual(rx_log.errors, errors)
+        self.assertEqual(rx_log.out_of_order, out_of_order)
+        self.assertEqual(rx_log.duplicates, duplicates)
+        self.assertAlmostEqual(rx_log.jitter, jitter, places=3)
+
+    def test_python(self):
+        """Test the pure-Python implementation"""
+        self.check_against_reference(use_numpy=False)
+
+    @unittest.skipIf(udp_rx_log.numpy is None, 'NumPy is not installed')
+    def test_numpy(self):
+        """Test the NumPy implementation"""
+        self.check_against_reference(use_numpy=True)
+
+    def test_errors_never_negative(self):
+        """Test late datagrams do not take errors below zero"""
+
+        for use_numpy in (False, udp_rx_log.numpy is not None):
+            rx_log = UdpRxLog(use_numpy=use_numpy)
+            for seq in (5, 1, 2, 3, 4, 4, 9):
+                rx_log.append(seq, 0, 0)
+
+            self.assertEqual(rx_log.process(), 7)
+            self.assertEqual(rx_log.max_seq, 9)
+            self.assertEqual(rx_log.errors, 3)
+            self.assertEqual(rx_log.out_of_order, 4)
+            self.assertEqual(rx_log.duplicates, 1)
@@ -1,11 +1,13 @@
 """
 Unitttest for the UDP data protocol.
 """
+import asyncio
 import unittest
 import unittest.mock
 import socket
 
-from py3iperf3.data_protocol_udp import UdpTestProtocol
+from py3iperf3.data_protocol_udp import UdpTestProtocol, UdpBatchTestProtocol
+from py3iperf3.data_protocol_udp import SOL_UDP, UDP_SEGMENT
 
 class TestUdpTestProtocol(unittest.TestCase):
     """
@@ -73,3 +75,107 @@ class TestUdpTestProtocol(unittest.TestCase):
         
         udp_proto.send_data('foo')
         assert mock_transport.sendto.called_with('foo')
+
+    def test_udp_gso_loopback(self):
+        """
+        Test that a GSO super-buffer arrives as separate datagrams.
+        """
+        rx_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rx_sock.bind(('127.0.0.1', 0))
+        rx_sock.settimeout(1)
+
+        tx_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        tx_sock.connect(rx_sock.getsockname())
+
+        mock_transport = unittest.mock.MagicMock()
+        mock_transport.get_write_buffer_size = unittest.mock.MagicMock(return_value=0)
+
+        udp_proto = UdpTestProtocol(unittest.mock.MagicMock(), sock=tx_sock)
+        udp_proto.connection_made(mock_transport)
+
+        try:
+            if not udp_proto.enable_gso(100):
+                self.skipTest('UDP GSO not supported')
+
+            udp_proto.send_segments(bytes(range(250)), 100)
+
+            self.assertEqual(rx_sock.recv(1000), bytes(range(100)))
+            self.assertEqual(rx_sock.recv(1000), bytes(range(100, 200)))
+            self.assertEqual(rx_sock.recv(1000), bytes(range(200, 250)))
+            assert not mock_transport.sendto.called
+        finally:
+            tx_sock.close()
+            rx_sock.close()
+
+    def test_udp_gso_fallback(self):
+        """
+        Test sending datagrams one by one without GSO.
+        """
+        mock_sock = unittest.mock.MagicMock()
+        mock_sock.setsockopt.side_effect = OSError('Not supported')
+        mock_transport = unittest.mock.MagicMock()
+
+        udp_proto = UdpTestProtocol(unittest.mock.MagicMock(), sock=mock_sock)
+        udp_proto.connection_made(mock_transport)
+
+        self.assertFalse(udp_proto.enable_gso(100))
+
+        udp_proto.send_segments(bytes(250), 100)
+        self.assertEqual(mock_transport.sendto.call_count, 3)
+        assert not mock_sock.send.called
+
+    def _run_batch_receive(self, gro, send_func):
+        """
+        Receive datagrams sent by send_func with the batched receive engine.
+        """
+        loop = asyncio.new_event_loop()
+
+        rx_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rx_sock.bind(('127.0.0.1', 0))
+        tx_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        tx_sock.bind(('127.0.0.1', 0))
+        tx_sock.connect(rx_sock.getsockname())
+        rx_sock.connect(tx_sock.getsockname())
+        rx_sock.setblocking(False)
+
+        received = []
+        mock_stream = unittest.mock.MagicMock()
+        mock_stream.data_received = lambda data: received.append(bytes(data))
+
+        batch_proto = UdpBatchTestProtocol(loop, rx_sock, test_stream=mock_stream, gro=gro)
+        batch_proto.start()
+        assert mock_stream.connection_established.called
+
+        send_func(tx_sock)
+        loop.run_until_complete(asyncio.sleep(0.1))
+
+        batch_proto.close()
+        tx_sock.close()
+        loop.close()
+
+        return received
+
+    def test_udp_batch_receive(self):
+        """
+        Test that many datagrams are received on one wake-up.
+        """
+        def send_func(tx_sock):
+            for index in range(5):
+                tx_sock.send(bytes([index]) * 100)
+
+        received = self._run_batch_receive(False, send_func)
+        self.assertEqual(received, [bytes([x]) * 100 for x in range(5)])
+
+    def test_udp_batch_receive_gro(self):
+        """
+        Test splitting of GRO coalesced datagrams.
+        """
+        def send_func(tx_sock):
+            try:
+                tx_sock.setsockopt(SOL_UDP, UDP_SEGMENT, 100)
+            except OSError:
+                self.skipTest('UDP GSO not supported')
+            tx_sock.send(bytes(range(250)))
+
+        received = self._run_batch_receive(True, send_func)
+        self.assertEqual(received, [bytes(range(100)), bytes(range(100, 200)), bytes(range(200, 250))])
@@ -1,11 +1,14 @@
 """
 Unit-test for util functions
 """
+import argparse
 import unittest
 import unittest.mock
 
 from py3iperf3.iperf3_api import COOKIE_SIZE
-from py3iperf3.utils import make_cookie, data_size_formatter, setup_logging
+from py3iperf3.utils import make_cookie, data_size_formatter, setup_logging, parse_bandwidth
+from py3iperf3.utils import format_loop_stats, parse_payload_ratio, parse_positive_int
+from py3iperf3.loop_monitor import LoopMonitor
 
 class TestUtilFunctions(unittest.TestCase):
     """Unit-tests of utilities function"""
@@ -95,3 +98,47 @@ class TestUtilFunctions(unittest.TestCase):
         setup_logging(debug, filename)
         assert mock_file_handler.called_with(filename)
         assert mock_logger.addHandler.called_with(mock_file_handler)
+
+    def test_parse_bandwidth(self):
+        """Test parsing of bandwidth strings"""
+
+        self.assertEqual(parse_bandwidth('0'), (0, None))
+        self.assertEqual(parse_bandwidth('1000'), (1000, None))
+        self.assertEqual(parse_bandwidth('10K'), (10000, None))
+        self.assertEqual(parse_bandwidth('1.5m'), (1500000, None))
+        self.assertEqual(parse_bandwidth('2G/16'), (2000000000, 16))
+
+        for bandwidth_string in ('foo', '10X', '-1M', '1M/0', '1M/foo', 'inf'):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse_bandwidth(bandwidth_string)
+
+    def test_parse_positive_int(self):
+        """Test parsing of values that must be greater than zero"""
+
+        self.assertEqual(parse_positive_int('65536'), 65536)
+
+        for value_string in ('0', '-1', '1.5', 'foo'):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse_positive_int(value_string)
+
+    def test_parse_payload_ratio(self):
+        """Test parsing of payload compression ratios"""
+
+        self.assertEqual(parse_payload_ratio('1'), 1)
+        self.assertEqual(parse_payload_ratio('2.5'), 2.5)
+
+        for ratio_string in ('0.5', '0', '-2', 'nan', 'foo'):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse_payload_ratio(ratio_string)
+
+    def test_format_loop_stats(self):
+        """Test formatting of the loop monitor summary"""
+
+        monitor = LoopMonitor(None)
+        monitor.send_time(0.0015)
+        monitor.writing_paused()
+
+        self.assertEqual(
+            format_loop_stats(monitor.interval()),
+            'timer delay 0.00/0.00 ms, callback delay 0.00/0.00 ms, '
+            'send time 1.50/1.50 ms (p99/max), 1 pauses')